@@ -1,7 +1,9 @@
+import sys
 import time
 import logging
 import argparse
 from random import randint
+from datetime import datetime
 
 import schedule
 
@@ -36,6 +38,21 @@ parser.add_argument(
     default=False,
     help="Update the static dashboard code",
 )
+parser.add_argument(
+    "-t",
+    "--tor-pool",
+    action="store_true",
+    default=False,
+    help="Run the pool of Tor containers for the workers",
+)
+parser.add_argument(
+    "-b",
+    "--backfill",
+    nargs=2,
+    type=datetime.fromisoformat,
+    metavar=("START", "END"),
+    help="Record the relays in the consensuses from START to END, such as 2021-06-01 or 2021-06-01T12:00, in UTC",
+)
 args = parser.parse_args()
 
 # Get the root logger for the package
@@ -52,6 +69,9 @@ cm = CaptchaMonitor()
 if args.worker:
     logger.info("Intializing CAPTCHA Monitor in worker mode")
     cm.worker()
+elif args.tor_pool:
+    logger.info("Intializing CAPTCHA Monitor in Tor pool mode")
+    cm.tor_pool()
 elif args.analyzer:
     logger.info("Intializing CAPTCHA Monitor in data analysis mode")
     cm.analyzer()
@@ -61,10 +81,15 @@ elif args.updater:
     schedule.every().hour.do(cm.update_relays)
     schedule.every().hour.do(cm.update_proxies)
     schedule.every().day.do(cm.update_fetchers)
+    schedule.every().day.do(cm.update_partitions)
     schedule.every().hour.do(cm.schedule_jobs)
 elif args.dashboard:
     logger.info("Intializing CAPTCHA Monitor in dashboard update mode")
     schedule.every(30).minutes.do(cm.render_dashboard)
+elif args.backfill:
+    logger.info("Intializing CAPTCHA Monitor in backfill mode")
+    cm.backfill_relays(*args.backfill)
+    sys.exit(0)
 
 # Run all scheduled jobs at the beginning
 schedule.run_all()
@@ -2,6 +2,7 @@ import sys
 import time
 import logging
 from typing import Optional
+from datetime import datetime
 
 from sqlalchemy.exc import IntegrityError
 
@@ -9,6 +10,7 @@ from captchamonitor.core.worker import Worker
 from captchamonitor.utils.config import Config
 from captchamonitor.utils.models import MetaData
 from captchamonitor.core.analyzer import Analyzer
+from captchamonitor.core.tor_pool import TorPool
 from captchamonitor.utils.database import Database
 from captchamonitor.utils.exceptions import ConfigInitError, DatabaseInitError
 from captchamonitor.core.schedule_jobs import ScheduleJobs
@@ -16,7 +18,9 @@ from captchamonitor.core.update_relays import UpdateRelays
 from captchamonitor.core.update_domains import UpdateDomains
 from captchamonitor.core.update_proxies import UpdateProxies
 from captchamonitor.utils.small_scripts import node_id, hasattr_private, insert_fixtures
+from captchamonitor.core.backfill_relays import BackfillRelays
 from captchamonitor.core.update_fetchers import UpdateFetchers
+from captchamonitor.core.update_partitions import UpdatePartitions
 from captchamonitor.dashboard.render_dashboard import RenderDashboard
 
 
@@ -110,6 +114,35 @@ class CaptchaMonitor:
 
         UpdateProxies(config=self.__config, db_session=self.__db_session)
 
+    def update_partitions(self) -> None:
+        """
+        Creates the upcoming partitions and removes the data that is older than
+        the retention period
+        """
+        self.__logger.info("Started updating partitions")
+
+        UpdatePartitions(config=self.__config, db_session=self.__db_session)
+
+    def backfill_relays(self, start_date: datetime, end_date: datetime) -> None:
+        """
+        Records the relays in the consensuses from the given start date to the
+        given end date
+
+        :param start_date: Valid-after time of the first consensus, in UTC
+        :type start_date: datetime
+        :param end_date: Valid-after time of the last consensus, in UTC
+        :type end_date: datetime
+        """
+        self.__logger.info("Started backfilling relays")
+
+        BackfillRelays(
+            config=self.__config,
+            db_session=self.__db_session,
+            start_date=start_date,
+            end_date=end_date,
+            num_processes=int(self.__config["backfill_processes"]),
+        )
+
     def render_dashboard(self) -> None:
         """
         Renders the dashboard HTML code again
@@ -143,8 +176,17 @@ class CaptchaMonitor:
             worker_id=self.__node_id,
             config=self.__config,
             db_session=self.__db_session,
+            concurrency=int(self.__config["worker_concurrency"]),
         )
 
+    def tor_pool(self) -> None:
+        """
+        Keeps a pool of Tor containers running and lends them to the workers
+        """
+        self.__logger.info("Running the Tor pool")
+
+        TorPool(config=self.__config, size=int(self.__config["tor_pool_size"]))
+
     def analyzer(self) -> None:
         """
         Analyzes the data recorded in the database
@@ -155,6 +197,7 @@ class CaptchaMonitor:
             analyzer_id=self.__node_id,
             config=self.__config,
             db_session=self.__db_session,
+            num_processes=int(self.__config["analyzer_processes"]),
         )
 
     def __del__(self) -> None:
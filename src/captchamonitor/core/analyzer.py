@@ -1,21 +1,68 @@
+import os
 import sys
-import json
 import time
 import logging
+import multiprocessing
 from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-from bs4 import BeautifulSoup
-from sqlalchemy import func
+import pytz
+from sqlalchemy import exists
 from sqlalchemy.orm import sessionmaker
 
 from captchamonitor.utils.config import Config
 from captchamonitor.utils.models import (
-    Domain,
     Fetcher,
     MetaData,
     FetchCompleted,
     AnalyzeCompleted,
 )
+from captchamonitor.utils.har_parser import read_har_statuses
+from captchamonitor.utils.dom_features import DomFeatures, DomFeatureExtractor
+from captchamonitor.utils.small_scripts import hasattr_private
+from captchamonitor.utils.keyword_matcher import (
+    CAPTCHA_SIGNATURES,
+    KeywordMatcher,
+    get_keyword_matcher,
+)
+
+
+def analyze_fetches(
+    match_list: List[str],
+    tor_html_data: str,
+    tor_http_requests: Optional[str],
+    non_tor_html_data: str,
+    non_tor_http_requests: Optional[str],
+    proxy_countries_html_data: List[str],
+) -> Dict[str, Optional[int]]:
+    """
+    Compares a Tor fetch with the non-Tor and proxy fetches of the same domain.
+    Doesn't need a database connection, so it can run in a separate process.
+
+    :param match_list: Keywords that are searched for in the pages
+    :type match_list: List[str]
+    :param tor_html_data: Tor HTML data
+    :type tor_html_data: str
+    :param tor_http_requests: Tor HAR as a JSON string
+    :type tor_http_requests: Optional[str]
+    :param non_tor_html_data: Non-Tor HTML data
+    :type non_tor_html_data: str
+    :param non_tor_http_requests: Non-Tor HAR as a JSON string
+    :type non_tor_http_requests: Optional[str]
+    :param proxy_countries_html_data: List of Proxy html data
+    :type proxy_countries_html_data: List[str]
+    :return: Results of the analysis, keyed by the AnalyzeCompleted columns
+    :rtype: Dict[str, Optional[int]]
+    """
+    return Analyzer.for_analysis_only(match_list).analyze(
+        tor_html_data,
+        tor_http_requests,
+        non_tor_html_data,
+        non_tor_http_requests,
+        proxy_countries_html_data,
+    )
 
 
 class Analyzer:
@@ -29,6 +76,7 @@ class Analyzer:
         config: Config,
         db_session: sessionmaker,
         loop: Optional[bool] = True,
+        num_processes: int = 1,
     ) -> None:
         """
         Initializes a new analyzer
@@ -41,25 +89,69 @@ class Analyzer:
         :type db_session: sessionmaker
         :param loop: Should I process a batch of domains or keep looping, defaults to True
         :type loop: bool, optional
+        :param num_processes: Number of processes to analyze the fetches with, 0 means one per CPU core, defaults to 1
+        :type num_processes: int
         """
         # Private class attributes
-        self.__logger = logging.getLogger(__name__)
         self.__config: Config = config
         self.__db_session: sessionmaker = db_session
         self.__analyzer_id: str = analyzer_id  # pylint: disable=W0238
         self.__job_queue_delay: float = float(self.__config["job_queue_delay"])
+        self.__watermark_metadata_key: str = "analyzer_last_fetch_completed_id"
+        self.__executor: Optional[ProcessPoolExecutor] = None
+
+        self.__init_analysis_attributes(self.__get_match_list())
+
+        # Spawn the processes instead of forking, so that they don't inherit
+        # the database connections
+        if num_processes <= 0:
+            num_processes = os.cpu_count() or 1
+        if num_processes > 1:
+            self.__executor = ProcessPoolExecutor(
+                max_workers=num_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        # Loop over the jobs
+        while loop:
+            # Only wait if there was nothing new to analyze
+            if self.process_next_batch() == 0:
+                time.sleep(self.__job_queue_delay)
+
+    @classmethod
+    def for_analysis_only(cls, match_list: List[str]) -> "Analyzer":
+        """
+        Creates an analyzer that can only be used to analyze the given pages,
+        without connecting to the database
+
+        :param match_list: Keywords that are searched for in the pages
+        :type match_list: List[str]
+        :return: Analyzer without a database connection
+        :rtype: Analyzer
+        """
+        analyzer = cls.__new__(cls)
+        analyzer.__init_analysis_attributes(match_list)
+        return analyzer
+
+    def __init_analysis_attributes(self, match_list: List[str]) -> None:
+        """
+        Initializes the attributes used while analyzing the pages
+
+        :param match_list: Keywords that are searched for in the pages
+        :type match_list: List[str]
+        """
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
 
         # Public class attributes
-        self.soup_tor: BeautifulSoup = BeautifulSoup("", "html.parser")
-        self.soup_non_tor: BeautifulSoup = BeautifulSoup("", "html.parser")
+        self.features_tor: DomFeatures = DomFeatures()
+        self.features_non_tor: DomFeatures = DomFeatures()
         self.max_threshold_value: int = 150
         self.min_threshold_value: int = 20
-        self.match_list: List[str] = (
-            self.__db_session.query(MetaData)
-            .filter(MetaData.key == "analyzer_match_list")
-            .one()
-            .value
-        )
+        self.pair_grace_period: int = 3600
+        self.watermark_delay: int = 600
+        self.match_list: List[str] = match_list
+        self.keyword_matcher: KeywordMatcher = self.__build_keyword_matcher(match_list)
         self.tor_store: Dict[str, Any] = {}
         self.non_store: Dict[str, Any] = {}
         self.captcha_checker_value: Optional[int] = None
@@ -69,75 +161,242 @@ class Analyzer:
         self.captcha_proxy_val: List[int]
         self.consensus_lite_captcha_value: Optional[int] = None
 
-        # Loop over the jobs
-        while loop:
-            self.process_next_batch_of_domains()
-            time.sleep(self.__job_queue_delay)
+    @staticmethod
+    def __build_keyword_matcher(match_list: List[str]) -> KeywordMatcher:
+        """
+        Gets the matcher that finds the keywords in the match list together with
+        the CAPTCHA signatures
+
+        :param match_list: Keywords that are searched for in the pages
+        :type match_list: List[str]
+        :return: Matcher for the keywords and the CAPTCHA signatures
+        :rtype: KeywordMatcher
+        """
+        return get_keyword_matcher(set(match_list) | CAPTCHA_SIGNATURES)
+
+    def __get_match_list(self) -> List[str]:
+        """
+        Gets the current keyword match list from the database
+
+        :return: Keywords that are searched for in the pages
+        :rtype: List[str]
+        """
+        return (
+            self.__db_session.query(MetaData)
+            .filter(MetaData.key == "analyzer_match_list")
+            .one()
+            .value
+        )
 
-    # pylint: disable=R0914
-    def process_next_batch_of_domains(self) -> None:
+    def __update_match_list(self) -> None:
         """
-        Loop over the domain list and get corresponding website data from the database
+        Rebuilds the keyword matcher if the match list in the database changed
         """
-        # pylint: disable=C0121,W0104
-        domains = self.__db_session.query(Domain)
-        for domain in domains:
-            query_by_domain = (
-                self.__db_session.query(FetchCompleted)
-                .join(Fetcher)
-                .filter(FetchCompleted.ref_domain == domain)
+        match_list = self.__get_match_list()
+
+        if match_list != self.match_list:
+            self.__logger.info("Match list changed, rebuilding the keyword matcher")
+            self.match_list = match_list
+            self.keyword_matcher = self.__build_keyword_matcher(match_list)
+
+    def __get_watermark(self) -> MetaData:
+        """
+        Gets the metadata entry that stores the ID of the last analyzed Tor fetch,
+        creates it if it doesn't exist yet
+
+        :return: The watermark metadata entry
+        :rtype: MetaData
+        """
+        watermark = (
+            self.__db_session.query(MetaData)
+            .filter(MetaData.key == self.__watermark_metadata_key)
+            .one_or_none()
+        )
+
+        if watermark is None:
+            watermark = MetaData(key=self.__watermark_metadata_key, value=0)
+            self.__db_session.add(watermark)
+
+        return watermark
+
+    def process_next_batch(self, batch_size: int = 100) -> int:
+        """
+        Analyzes the next batch of Tor fetches that weren't analyzed yet, by
+        comparing each of them with the latest non-Tor and proxy fetches of the
+        same domain. Keeps track of the last processed fetch that is older than
+        watermark_delay, so each batch only reads the recent fetches again. The
+        workers might commit the recent fetches out of order, so the ones with
+        lower IDs might still show up.
+
+        :param batch_size: Maximum number of Tor fetches to analyze, defaults to 100
+        :type batch_size: int
+        :return: Number of Tor fetches processed
+        :rtype: int
+        """
+        # pylint: disable=C0121,R0914,W0143
+        self.__update_match_list()
+        watermark = self.__get_watermark()
+
+        already_analyzed = exists().where(
+            AnalyzeCompleted.fetch_completed_id == FetchCompleted.id
+        )
+        tor_fetches = (
+            self.__db_session.query(FetchCompleted)
+            .join(Fetcher)
+            .filter(Fetcher.uses_proxy_type == "tor")
+            .filter(FetchCompleted.id > watermark.value)
+            .options(*FetchCompleted.load_bodies())
+            .filter(~already_analyzed)
+            .order_by(FetchCompleted.id)
+            .limit(batch_size)
+            .all()
+        )
+
+        if len(tor_fetches) == 0:
+            return 0
+
+        domain_ids = {tor.domain_id for tor in tor_fetches}
+
+        # Get the latest non-Tor fetch of each domain
+        non_tor_fetches = {
+            non_tor.domain_id: non_tor
+            for non_tor in self.__db_session.query(FetchCompleted)
+            .join(Fetcher)
+            .filter(Fetcher.uses_proxy_type == None)
+            .filter(FetchCompleted.domain_id.in_(domain_ids))
+            .options(*FetchCompleted.load_bodies())
+            .distinct(FetchCompleted.domain_id)
+            .order_by(FetchCompleted.domain_id, FetchCompleted.id.desc())
+        }
+
+        # Get the latest fetch of each domain through each of the proxies
+        proxy_fetches: Dict[int, List[FetchCompleted]] = defaultdict(list)
+        for proxy in (
+            self.__db_session.query(FetchCompleted)
+            .join(Fetcher)
+            .filter(Fetcher.uses_proxy_type == "http")
+            .filter(FetchCompleted.domain_id.in_(domain_ids))
+            .filter(FetchCompleted.proxy_id != None)
+            .options(*FetchCompleted.load_bodies(http_requests=False))
+            .distinct(FetchCompleted.domain_id, FetchCompleted.proxy_id)
+            .order_by(
+                FetchCompleted.domain_id,
+                FetchCompleted.proxy_id,
+                FetchCompleted.id.desc(),
             )
+        ):
+            proxy_fetches[proxy.domain_id].append(proxy)
+
+        # Pair the Tor fetches with their counterparts
+        analyzed_ids = []
+        tasks = []
+        num_processed = 0
+        safe_before = datetime.now(pytz.utc) - timedelta(seconds=self.watermark_delay)
+        for tor in tor_fetches:
+            non_tor = non_tor_fetches.get(tor.domain_id, None)
+
+            if non_tor is None:
+                # Wait for the non-Tor counterpart if it might still be in the queue
+                age = datetime.now(pytz.utc) - tor.created_at
+                if age.total_seconds() < self.pair_grace_period:
+                    break
 
-            tor = query_by_domain.filter(Fetcher.uses_proxy_type == "tor").first()
-            non_tor = query_by_domain.filter(Fetcher.uses_proxy_type == None).first()
-            proxies = query_by_domain.filter(Fetcher.uses_proxy_type == "http").all()
-
-            if tor is not None and non_tor is not None:
-                proxy_countries_html_data = []
-                for proxy in proxies:
-                    if proxy.url == tor.url:
-                        proxy_countries_html_data.append(proxy.html_data)
-
-                # Loads JSON
-                HAR_json_tor = json.loads(tor.http_requests)
-                HAR_json_non_tor = json.loads(non_tor.http_requests)
-                self.captcha_checker_value = None
-                self.dom_analyze_value = None
-                self.status_check_value = None
-                self.consensus_lite_dom_value = None
-                self.consensus_lite_captcha_value = None
-                self.tor_store = {}
-                self.non_store = {}
-
-                self.status_check(
-                    tor.html_data,
-                    HAR_json_tor,
-                    non_tor.html_data,
-                    HAR_json_non_tor,
-                    proxy_countries_html_data,
-                )
+                self.__logger.debug("No non-Tor fetch to compare %s with", tor.url)
 
-                fetch_completed_present = (
-                    self.__db_session.query(
-                        func.count(AnalyzeCompleted.fetch_completed_id)
-                    ).filter(
-                        AnalyzeCompleted.fetch_completed_id  # pylint: disable=W0143
-                        == tor.id
+            else:
+                proxy_countries_html_data = [
+                    html_data
+                    for html_data in (
+                        proxy.html_data
+                        for proxy in proxy_fetches[tor.domain_id]
+                        if proxy.url == tor.url
                     )
-                ).all()
-                if fetch_completed_present[0][0] == 0:
-                    # Tor from the FetchCompleted
-                    analyzer_val_t = AnalyzeCompleted(
-                        captcha_checker=self.captcha_checker_value,
-                        status_check=self.status_check_value,
-                        dom_analyze=self.dom_analyze_value,
-                        consensus_lite_dom=self.consensus_lite_dom_value,
-                        consensus_lite_captcha=self.consensus_lite_captcha_value,
-                        fetch_completed_id=tor.id,
+                    if html_data is not None
+                ]
+                analyzed_ids.append(tor.id)
+                tasks.append(
+                    (
+                        self.match_list,
+                        tor.html_data,
+                        tor.http_requests,
+                        non_tor.html_data,
+                        non_tor.http_requests,
+                        proxy_countries_html_data,
                     )
+                )
+
+            # Only move past the fetches that are old enough for the fetches
+            # with lower IDs to be committed, the recent ones are read again and
+            # the analyzed ones among them are filtered out
+            if tor.created_at < safe_before:
+                watermark.value = tor.id
+            num_processed += 1
+
+        # Analyze the pairs in parallel if there are multiple processes
+        if self.__executor is not None and len(tasks) > 1:
+            results = list(self.__executor.map(analyze_fetches, *zip(*tasks)))
+        else:
+            results = [analyze_fetches(*task) for task in tasks]
+
+        # Save the results and the watermark together
+        self.__db_session.bulk_insert_mappings(
+            AnalyzeCompleted,
+            [
+                dict(result, fetch_completed_id=fetch_completed_id)
+                for fetch_completed_id, result in zip(analyzed_ids, results)
+            ],
+        )
+        self.__db_session.commit()
+
+        return num_processed
+
+    def analyze(
+        self,
+        tor_html_data: str,
+        tor_http_requests: Optional[str],
+        non_tor_html_data: str,
+        non_tor_http_requests: Optional[str],
+        proxy_countries_html_data: List[str],
+    ) -> Dict[str, Optional[int]]:
+        """
+        Compares the given Tor page with the non-Tor and proxy pages
+
+        :param tor_html_data: Tor HTML data
+        :type tor_html_data: str
+        :param tor_http_requests: Tor HAR as a JSON string
+        :type tor_http_requests: Optional[str]
+        :param non_tor_html_data: Non-Tor HTML data
+        :type non_tor_html_data: str
+        :param non_tor_http_requests: Non-Tor HAR as a JSON string
+        :type non_tor_http_requests: Optional[str]
+        :param proxy_countries_html_data: List of Proxy html data
+        :type proxy_countries_html_data: List[str]
+        :return: Results of the analysis, keyed by the AnalyzeCompleted columns
+        :rtype: Dict[str, Optional[int]]
+        """
+        self.captcha_checker_value = None
+        self.dom_analyze_value = None
+        self.status_check_value = None
+        self.consensus_lite_dom_value = None
+        self.consensus_lite_captcha_value = None
+        self.tor_store = {}
+        self.non_store = {}
+
+        self.status_check(
+            tor_html_data,
+            tor_http_requests,
+            non_tor_html_data,
+            non_tor_http_requests,
+            proxy_countries_html_data,
+        )
 
-                    self.__db_session.add(analyzer_val_t)
-                    self.__db_session.commit()
+        return {
+            "captcha_checker": self.captcha_checker_value,
+            "status_check": self.status_check_value,
+            "dom_analyze": self.dom_analyze_value,
+            "consensus_lite_dom": self.consensus_lite_dom_value,
+            "consensus_lite_captcha": self.consensus_lite_captcha_value,
+        }
 
     def consensus_lite_captcha(self) -> None:
         """
@@ -276,16 +535,18 @@ class Analyzer:
         tor_c = 0
         tor = 0
         # If captcha in html of tor:
-        if "captcha" in self.soup_tor and "captcha" not in self.soup_non_tor:
+        if self.features_tor.keyword_matches & CAPTCHA_SIGNATURES and not (
+            self.features_non_tor.keyword_matches & CAPTCHA_SIGNATURES
+        ):
             tor_c = 1
         # If captcha in both, tor_html and non_tor html, or not anywhere:
         else:
             for s_ in self.tor_store:
-                if "captcha" in s_:
+                if self.keyword_matcher.find_all(s_) & CAPTCHA_SIGNATURES:
                     tor = 1
                     self.__logger.info("Captcha in tor from HAR")
             for s_ in self.non_store:
-                if "captcha" in s_:
+                if self.keyword_matcher.find_all(s_) & CAPTCHA_SIGNATURES:
                     tor = 0
                     self.__logger.info("Captcha in Non-Tor too")
         if tor == 0 and tor_c == 0:
@@ -314,30 +575,28 @@ class Analyzer:
         :param proxy_countries_html_data: List of Proxy html data
         :type proxy_countries_html_data: List[str]
         """
-        self.soup_tor = BeautifulSoup(tor_html_data, "html.parser")
-        # Count the number of nodes in tor
-        tor_node_count = len(self.soup_tor.find_all(True))
+        # Extract the node counts and the keywords of each page in a single pass
+        extractor = DomFeatureExtractor()
+
+        self.features_tor = extractor.extract(tor_html_data, self.keyword_matcher)
+        tor_node_count = self.features_tor.node_count
 
-        self.soup_non_tor = BeautifulSoup(non_tor_html_data, "html.parser")
-        # Count the number of nodes in non-tor
-        non_tor_node_count = len(self.soup_non_tor.find_all(True))
+        self.features_non_tor = extractor.extract(
+            non_tor_html_data, self.keyword_matcher
+        )
+        non_tor_node_count = self.features_non_tor.node_count
 
         # Count the number of nodes returned by the proxies
         proxy_node_count = []
-        proxy_node_detail = []
         self.captcha_proxy_val = []
 
         for proxy_html in proxy_countries_html_data:
-            node_proxy = []
-            soup_proxy = BeautifulSoup(proxy_html, "html.parser")
-            # Check for captcha here itself, thereby reducing the space of the list ass well as execution later
-            captcha_proxy = str(soup_proxy).lower()
+            features_proxy = extractor.extract(proxy_html, self.keyword_matcher)
             # Contains captcha or not in forms of 0(No captcha) and 1(Captcha), so that it can be accessed via another class
-            self.captcha_proxy_val.append(int("captcha" in captcha_proxy))
-            for tag in soup_proxy.find_all(True):
-                node_proxy.append(tag)
-            proxy_node_detail.append(node_proxy)
-            proxy_node_count.append(len(node_proxy))
+            self.captcha_proxy_val.append(
+                int(bool(features_proxy.keyword_matches & CAPTCHA_SIGNATURES))
+            )
+            proxy_node_count.append(features_proxy.node_count)
 
         self.__logger.info(
             "Nodes by tor: %f, non-tor: %f and proxies: %s",
@@ -354,9 +613,6 @@ class Analyzer:
 
         self.__logger.info("DOM Score : %s", dom_score)
 
-        self.soup_tor = str(self.soup_tor).lower()
-        self.soup_non_tor = str(self.soup_non_tor).lower()
-
         if self.captcha_checker() is False:
             if dom_score > 0:
                 if dom_score > self.max_threshold_value:
@@ -379,7 +635,10 @@ class Analyzer:
                     self.__logger.info("checking for keywords...")
                     #   checks for keywords to help in this case
                     for _ in self.match_list:
-                        if _ in self.soup_tor and _ not in self.soup_non_tor:
+                        if (
+                            _ in self.features_tor.keyword_matches
+                            and _ not in self.features_non_tor.keyword_matches
+                        ):
                             self.__logger.info("Tor Blocked : checklist!! ")
                             self.dom_analyze_value = 3
                         else:
@@ -400,9 +659,9 @@ class Analyzer:
     def status_check(
         self,
         tor_html_data: str,
-        tor_http_requests: Dict[str, Any],
+        tor_http_requests: Optional[str],
         non_tor_html_data: str,
-        non_tor_http_requests: Dict[str, Any],
+        non_tor_http_requests: Optional[str],
         proxy_countries_html_data: List[str],
     ) -> None:
 
@@ -411,85 +670,63 @@ class Analyzer:
 
         :param tor_html_data: Tor HTML data
         :type tor_html_data: str
-        :param tor_http_requests: Tor HAR
-        :type tor_http_requests: Dict[str, Any]
+        :param tor_http_requests: Tor HAR as a JSON string
+        :type tor_http_requests: Optional[str]
         :param non_tor_html_data: Non-Tor HTML data
         :type non_tor_html_data: str
-        :param non_tor_http_requests: Non-Tor HAR
-        :type non_tor_http_requests: Dict[str, Any]
+        :param non_tor_http_requests: Non-Tor HAR as a JSON string
+        :type non_tor_http_requests: Optional[str]
         :param proxy_countries_html_data: Html data of all given proxies matching the location of tor nodes.
         :type proxy_countries_html_data: List[str]
         """
-        tor_HAR = {}
-        non_tor_HAR = {}
-        try:
-            for i in range(0, len(tor_http_requests["log"]["entries"])):
-                tor_HAR[
-                    tor_http_requests["log"]["entries"][i]["request"]["url"]
-                ] = tor_http_requests["log"]["entries"][i]["response"]["status"]
-            # pylint: disable=C0206
-            for i in tor_HAR:
-                if tor_HAR[i] != 0 or tor_HAR != "" or tor_HAR is not None:
-                    if 300 <= tor_HAR[i] < 400:
-                        continue
-                    self.tor_store[i] = tor_HAR[i]  # type: ignore
-                    break
+        tor_statuses = read_har_statuses(tor_http_requests)
+        non_tor_statuses = read_har_statuses(non_tor_http_requests)
 
-            for i in range(len(non_tor_http_requests["log"]["entries"])):
-                non_tor_HAR[
-                    non_tor_http_requests["log"]["entries"][i]["request"]["url"]
-                ] = non_tor_http_requests["log"]["entries"][i]["response"]["status"]
-
-            # pylint: disable=C0206
-            for i in non_tor_HAR:
-                if non_tor_HAR[i] != 0 or non_tor_HAR != "" or non_tor_HAR is not None:
-                    if 300 <= non_tor_HAR[i] < 400:
-                        continue
-                    self.non_store[i] = non_tor_HAR[i]  # type: ignore
-                    break
+        if tor_statuses.document is None or non_tor_statuses.document is None:
+            self.__logger.debug(
+                "Check for the HARExport. Might have no entries or returned nothing"
+            )
+            return
 
-            first_url_t = list(self.tor_store.keys())[0]
-            first_status_tor = int(self.tor_store[str(first_url_t)])
+        first_url_t, first_status_tor = tor_statuses.document
+        self.tor_store[first_url_t] = first_status_tor
 
-            # non tor use HARExportTrigger
-            first_url_nt = list(self.non_store.keys())[0]
-            first_status_non_tor = int(self.non_store[str(first_url_nt)])
+        # non tor use HARExportTrigger
+        first_url_nt, first_status_non_tor = non_tor_statuses.document
+        self.non_store[first_url_nt] = first_status_non_tor
 
-            self.__logger.info(
-                "Tor status: %d and Nontor status: %d",
-                first_status_tor,
-                first_status_non_tor,
-            )
+        self.__logger.info(
+            "Tor status: %d and Nontor status: %d",
+            first_status_tor,
+            first_status_non_tor,
+        )
 
-            if first_status_tor > 399 and first_status_non_tor < 400:
-                # Error for tag and no error for non tor
-                self.__logger.info("Tor Blocked")
-                self.status_check_value = 0
+        if first_status_tor > 399 and first_status_non_tor < 400:
+            # Error for tag and no error for non tor
+            self.__logger.info("Tor Blocked")
+            self.status_check_value = 0
 
-            elif first_status_tor > 399 and first_status_non_tor > 399:
-                # Both blocked on tor and non-tor
-                self.__logger.info("Site is blocked on tor and non-tor browsers")
-                self.status_check_value = 1
+        elif first_status_tor > 399 and first_status_non_tor > 399:
+            # Both blocked on tor and non-tor
+            self.__logger.info("Site is blocked on tor and non-tor browsers")
+            self.status_check_value = 1
 
-            elif first_status_tor < 300 and first_status_non_tor > 399:
-                # When tor isn't blocked and non-tor is blocked
-                self.__logger.info(
-                    "Tor is not blocked, rather non-tor browser is blocked"
+        elif first_status_tor < 300 and first_status_non_tor > 399:
+            # When tor isn't blocked and non-tor is blocked
+            self.__logger.info("Tor is not blocked, rather non-tor browser is blocked")
+            self.status_check_value = 2
+        else:
+            if (400 > first_status_tor > 299) or (
+                first_status_tor < 300 and first_status_non_tor < 300
+            ):
+                # Check if tor returns error pages or warning or captchas due to reload
+                self.dom_analyze(
+                    tor_html_data, non_tor_html_data, proxy_countries_html_data
                 )
-                self.status_check_value = 2
-            else:
-                if (400 > first_status_tor > 299) or (
-                    first_status_tor < 300 and first_status_non_tor < 300
-                ):
-                    # Check if tor returns error pages or warning or captchas due to reload
-                    self.dom_analyze(
-                        tor_html_data, non_tor_html_data, proxy_countries_html_data
-                    )
-        except TypeError:
-            self.__logger.debug(
-                "Check for the HARExport. Might have actually returned nothing"
-            )
-        except IndexError:
-            self.__logger.debug(
-                "Check for the HARExport. Might have no entries and is out of indexes"
-            )
+
+    def __del__(self) -> None:
+        """
+        Perform cleanup before going out of scope
+        """
+        if hasattr_private(self, "__executor") and self.__executor is not None:
+            self.__executor.shutdown(wait=True)
@@ -0,0 +1,259 @@
+import os
+import time
+import logging
+import multiprocessing
+from typing import Any, Set, Dict, List, Deque, Tuple, Iterator, Optional
+from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import pytz
+from sqlalchemy.orm import sessionmaker
+
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.models import Consensus
+from captchamonitor.utils.collector import Collector
+from captchamonitor.utils.exceptions import (
+    CollectorDownloadError,
+    CollectorConnectionError,
+)
+from captchamonitor.utils.relay_history import record_consensus, get_consensus_snapshot
+from captchamonitor.utils.consensus_parser import ConsensusV3Parser
+
+
+def parse_consensus(consensus_file: str) -> Dict[str, Any]:
+    """
+    Parses a consensus into the state of its relays, defined at the module level
+    so that it can be run in the processes of BackfillRelays
+
+    :param consensus_file: The absolute path to the consensus file
+    :type consensus_file: str
+    :return: The consensus and the state of its relays
+    :rtype: Dict[str, Any]
+    """
+    return get_consensus_snapshot(ConsensusV3Parser(consensus_file))
+
+
+class BackfillRelays:
+    """
+    Records the relays in the hourly consensuses of a date range as relay
+    snapshots. The consensuses are parsed in parallel and the hours that were
+    already recorded are skipped, so an interrupted backfill can be resumed.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        db_session: sessionmaker,
+        start_date: datetime,
+        end_date: datetime,
+        num_processes: int = 1,
+        collector: Optional[Collector] = None,
+    ) -> None:
+        """
+        Initializes BackfillRelays
+
+        :param config: The config class instance that contains global configuration values
+        :type config: Config
+        :param db_session: Database session used to connect to the database
+        :type db_session: sessionmaker
+        :param start_date: Valid-after time of the first consensus, in UTC
+        :type start_date: datetime
+        :param end_date: Valid-after time of the last consensus, in UTC
+        :type end_date: datetime
+        :param num_processes: Number of processes to parse the consensuses with, 0 means one per CPU core, defaults to 1
+        :type num_processes: int
+        :param collector: Collector to get the consensuses from, defaults to None to create a new one
+        :type collector: Optional[Collector]
+        """
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
+        self.__config: Config = config  # pylint: disable=W0238
+        self.__db_session: sessionmaker = db_session
+        self.__start_date: datetime = self.__to_hour(start_date)
+        self.__end_date: datetime = self.__to_hour(end_date)
+        self.__collector: Collector = collector or Collector()
+        self.__executor: Optional[ProcessPoolExecutor] = None
+
+        if num_processes <= 0:
+            num_processes = os.cpu_count() or 1
+        self.__num_processes: int = num_processes
+
+        # Calls to the class methods
+        self.backfill()
+
+    @staticmethod
+    def __to_hour(date: datetime) -> datetime:
+        """
+        Rounds the given date down to the hour and removes its time zone
+
+        :param date: The date to round down
+        :type date: datetime
+        :return: The hour as a naive datetime in UTC
+        :rtype: datetime
+        """
+        if date.tzinfo is not None:
+            date = date.astimezone(pytz.utc).replace(tzinfo=None)
+        return date.replace(minute=0, second=0, microsecond=0)
+
+    def __get_missing_hours(self) -> List[datetime]:
+        """
+        Gets the hours in the date range whose consensuses weren't recorded yet
+
+        :return: The hours to backfill, in order
+        :rtype: List[datetime]
+        """
+        recorded = {
+            valid_after.astimezone(pytz.utc).replace(tzinfo=None)
+            for (valid_after,) in self.__db_session.query(Consensus.valid_after)
+            .filter(Consensus.valid_after >= self.__start_date.replace(tzinfo=pytz.utc))
+            .filter(Consensus.valid_after <= self.__end_date.replace(tzinfo=pytz.utc))
+        }
+
+        hours = []
+        hour = self.__start_date
+        while hour <= self.__end_date:
+            if hour not in recorded:
+                hours.append(hour)
+            hour += timedelta(hours=1)
+
+        return hours
+
+    def __iter_consensus_files(self, hours: List[datetime]) -> Iterator[Optional[str]]:
+        """
+        Gets the consensus files of the given hours from Collector. The
+        consensuses of each month are downloaded once, until the end of the date
+        range, and the hours that are still missing after that are skipped.
+
+        :param hours: The hours to get the consensuses of, in order
+        :type hours: List[datetime]
+        :yield: The absolute path to the consensus file of each hour, or None if it couldn't be found
+        :rtype: Iterator[Optional[str]]
+        """
+        downloaded_months: Set[Tuple[int, int]] = set()
+        for hour in hours:
+            consensus_file = self.__collector.find_consensus(hour)
+
+            if (
+                consensus_file is None
+                and (hour.year, hour.month) not in downloaded_months
+            ):
+                downloaded_months.add((hour.year, hour.month))
+                try:
+                    self.__collector.download_consensus(hour, self.__end_date)
+                except (CollectorConnectionError, CollectorDownloadError):
+                    pass
+                consensus_file = self.__collector.find_consensus(hour)
+
+            if consensus_file is None:
+                self.__logger.warning("Could not get the consensus of %s", hour)
+
+            yield consensus_file
+
+    def __parse_consensus_files(
+        self, consensus_files: Iterator[Optional[str]], batch_size: int
+    ) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Parses the consensus files in order. The next consensus files are
+        downloaded while the processes parse the previous ones, and at most
+        batch_size parsed consensuses wait to be recorded.
+
+        :param consensus_files: The absolute paths to the consensus files, None for the missing ones
+        :type consensus_files: Iterator[Optional[str]]
+        :param batch_size: Number of consensuses to parse ahead
+        :type batch_size: int
+        :yield: The consensus and the state of its relays, or None if its file is missing
+        :rtype: Iterator[Optional[Dict[str, Any]]]
+        """
+        if self.__executor is None:
+            for consensus_file in consensus_files:
+                yield None if consensus_file is None else parse_consensus(
+                    consensus_file
+                )
+            return
+
+        pending: Deque[Optional[Future]] = deque()
+        for consensus_file in consensus_files:
+            if consensus_file is None:
+                pending.append(None)
+            else:
+                pending.append(self.__executor.submit(parse_consensus, consensus_file))
+
+            if len(pending) > batch_size:
+                future = pending.popleft()
+                yield None if future is None else future.result()
+
+        while pending:
+            future = pending.popleft()
+            yield None if future is None else future.result()
+
+    def backfill(self) -> None:
+        """
+        Parses the consensuses of the hours that weren't recorded yet, and
+        records the changes in the state of their relays
+        """
+        hours = self.__get_missing_hours()
+        batch_size = self.__num_processes * 2
+        started_at = time.monotonic()
+        num_recorded = 0
+
+        self.__logger.info(
+            "Backfilling %s consensuses from %s to %s",
+            len(hours),
+            self.__start_date,
+            self.__end_date,
+        )
+
+        # Spawn the processes instead of forking, so that they don't inherit
+        # the database connections
+        if self.__num_processes > 1 and len(hours) > 1:
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.__num_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        try:
+            consensuses = self.__parse_consensus_files(
+                self.__iter_consensus_files(hours), batch_size
+            )
+            for num_done, consensus in enumerate(consensuses, start=1):
+                if consensus is not None:
+                    num_recorded += record_consensus(self.__db_session, consensus)
+
+                if num_done % batch_size == 0 or num_done == len(hours):
+                    self.__log_throughput(
+                        num_recorded, num_done, len(hours), started_at
+                    )
+
+        finally:
+            if self.__executor is not None:
+                self.__executor.shutdown(cancel_futures=True)
+                self.__executor = None
+
+        self.__logger.info("Done with backfilling %s consensuses", num_recorded)
+
+    def __log_throughput(
+        self, num_recorded: int, num_done: int, num_hours: int, started_at: float
+    ) -> None:
+        """
+        Logs the progress and the throughput of the backfill
+
+        :param num_recorded: Number of consensuses recorded so far
+        :type num_recorded: int
+        :param num_done: Number of hours processed so far
+        :type num_done: int
+        :param num_hours: Number of hours to process in total
+        :type num_hours: int
+        :param started_at: Monotonic time the backfill was started at
+        :type started_at: float
+        """
+        elapsed = time.monotonic() - started_at
+        throughput = num_recorded / elapsed if elapsed > 0 else 0.0
+
+        self.__logger.info(
+            "Processed %s/%s hours in %.1f seconds, %.2f consensuses per second",
+            num_done,
+            num_hours,
+            elapsed,
+            throughput,
+        )
@@ -1,11 +1,16 @@
+import math
 import time
+import uuid
+import random
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
+from sqlalchemy import Text, or_, cast, func, exists, insert
 from sqlalchemy.orm import sessionmaker
 
 from captchamonitor.utils.config import Config
-from captchamonitor.utils.models import Relay, Domain, Fetcher, FetchQueue
+from captchamonitor.utils.models import Relay, Domain, Fetcher, MetaData, FetchQueue
+from captchamonitor.utils.alias_table import AliasTable
 
 
 class ScheduleJobs:
@@ -31,24 +36,113 @@ class ScheduleJobs:
         :type loop: bool, optional
         """
         # Private class attributes
-        self.__logger = logging.getLogger(__name__)  # pylint: disable=W0238
+        self.__logger = logging.getLogger(__name__)
         self.__config: Config = config
         self.__db_session: sessionmaker = db_session
         self.__job_queue_delay: float = float(self.__config["job_queue_delay"])
+        self.__max_queue_depth: int = int(self.__config["job_queue_max_depth"])
+        self.__relay_rotation_period: float = (
+            float(self.__config["relay_rotation_period"]) * 3600
+        )
+        self.__relay_rotation_metadata_key: str = "relay_rotation"
 
         # Loop over the jobs
         while loop:
             self.schedule_next_batch()
             time.sleep(self.__job_queue_delay)
 
-    def schedule_next_batch(self) -> None:
+    def __pick_exit_relays(self, num_relays: int) -> List[int]:
+        """
+        Picks exit relays for the given number of Tor jobs. The relays are picked
+        randomly, weighted by their exit probabilities, using an alias table. To
+        make sure that every exit relay is used within the rotation period, the
+        relays that weren't used in the current rotation are picked first whenever
+        the rotation would otherwise fall behind schedule.
+
+        :param num_relays: Number of exit relays to pick
+        :type num_relays: int
+        :return: IDs of the picked relays, empty if there are no exit relays
+        :rtype: List[int]
+        """
+        # pylint: disable=C0121,R0914
+        exit_relays = (
+            self.__db_session.query(Relay.id, Relay.exit_probability)
+            .filter(Relay.ipv4_exiting_allowed == True)
+            .filter(Relay.status.isnot(False))
+            .all()
+        )
+
+        if len(exit_relays) == 0 or num_relays == 0:
+            return []
+
+        relay_ids = [relay.id for relay in exit_relays]
+        alias_table = AliasTable(
+            relay_ids, [relay.exit_probability for relay in exit_relays]
+        )
+
+        # Get the progress of the current rotation
+        metadata = (
+            self.__db_session.query(MetaData)
+            .filter(MetaData.key == self.__relay_rotation_metadata_key)
+            .one_or_none()
+        )
+        if metadata is None:
+            metadata = MetaData(key=self.__relay_rotation_metadata_key)
+            self.__db_session.add(metadata)
+
+        now = time.time()
+        rotation = metadata.value or {}
+        started_at = rotation.get("started_at", now)
+        last_run = rotation.get("last_run", now)
+        covered = set(rotation.get("covered", [])) & set(relay_ids)
+
+        # Start a new rotation if every relay was covered or the period is over
+        if len(covered) == len(relay_ids) or now - started_at >= (
+            self.__relay_rotation_period
+        ):
+            started_at = now
+            covered = set()
+
+        # Estimate how many relays should be covered until the next run, assuming
+        # that the runs are equally spaced
+        run_interval = max(now - last_run, self.__job_queue_delay)
+        progress = min(
+            1.0, (now - started_at + run_interval) / self.__relay_rotation_period
+        )
+        num_behind = math.ceil(len(relay_ids) * progress) - len(covered)
+
+        # Catch up with the uncovered relays and sample the rest by weight
+        uncovered = [relay_id for relay_id in relay_ids if relay_id not in covered]
+        picks = random.sample(uncovered, max(0, min(num_behind, num_relays)))
+        picks += [alias_table.sample() for _ in range(num_relays - len(picks))]
+        random.shuffle(picks)
+
+        covered.update(picks)
+        metadata.value = {
+            "started_at": started_at,
+            "last_run": now,
+            "covered": sorted(covered),
+        }
+
+        return picks
+
+    def schedule_next_batch(self, max_queue_depth: Optional[int] = None) -> int:
         """
         Goes over all available domains and inserts a new job for fetching them
-        with Tor Browser and Firefox Browser
+        with Tor Browser and Firefox Browser. Each Tor Browser job gets its own
+        exit relay. The domains that already have a job queued for a fetcher are
+        skipped for that fetcher, and the new jobs are inserted in bulk.
+
+        :param max_queue_depth: Maximum number of jobs allowed in the queue, 0 means
+            unlimited, defaults to the value in the config
+        :type max_queue_depth: Optional[int], optional
+        :return: Number of jobs inserted into the queue
+        :rtype: int
         """
-        # pylint: disable=C0121
-        # Get the list of domains
-        domains = self.__db_session.query(Domain).all()
+        # pylint: disable=C0121,R0914,W0143
+        if max_queue_depth is None:
+            max_queue_depth = self.__max_queue_depth
+
         tor_browser = (
             self.__db_session.query(Fetcher)
             .filter(Fetcher.method == "tor_browser")
@@ -61,28 +155,76 @@ class ScheduleJobs:
             .filter(Fetcher.uses_proxy_type == None)
             .first()
         )
-        relay = (
-            self.__db_session.query(Relay)
-            .filter(Relay.ipv4_exiting_allowed == True)
-            .first()
-        )
+        fetchers = [f for f in (tor_browser, firefox_browser) if f is not None]
 
-        for domain in domains:
-            new_job_tor_browser = FetchQueue(
-                url=f"https://{domain.domain}",
-                options=domain.options,
-                fetcher_id=tor_browser.id,
-                domain_id=domain.id,
-                relay_id=relay.id,
+        if len(fetchers) == 0:
+            self.__logger.warning("There are no fetchers to schedule jobs for")
+            return 0
+
+        # Find the domains that don't have a job queued for each of the fetchers
+        not_queued = [
+            ~exists().where(
+                (FetchQueue.domain_id == Domain.id)
+                & (FetchQueue.fetcher_id == fetcher.id)
             )
-            new_job_firefox_browser = FetchQueue(
-                url=f"https://{domain.domain}",
-                options=domain.options,
-                fetcher_id=firefox_browser.id,
-                domain_id=domain.id,
+            for fetcher in fetchers
+        ]
+        query = self.__db_session.query(
+            Domain.id, Domain.domain, Domain.options, *not_queued
+        ).filter(or_(*not_queued))
+
+        free_slots = None
+        if max_queue_depth > 0:
+            free_slots = max_queue_depth - self.__db_session.query(FetchQueue).count()
+            if free_slots <= 0:
+                self.__logger.info(
+                    "The job queue is full with %s jobs, not scheduling new jobs",
+                    max_queue_depth,
+                )
+                return 0
+
+            # Shuffle the domains differently in every run, so that all of them
+            # get a chance when the queue is full, while keeping the jobs of the
+            # same domain together
+            seed = uuid.uuid4().hex
+            query = query.order_by(func.md5(cast(Domain.id, Text) + seed)).limit(
+                free_slots
             )
-            self.__db_session.add(new_job_tor_browser)
-            self.__db_session.add(new_job_firefox_browser)
+
+        jobs: List[Dict[str, Any]] = []
+        for domain_id, domain, options, *needs_job in query:
+            for fetcher, needed in zip(fetchers, needs_job):
+                if needed:
+                    jobs.append(
+                        {
+                            "url": f"https://{domain}",
+                            "options": options,
+                            "fetcher_id": fetcher.id,
+                            "domain_id": domain_id,
+                            "relay_id": None,
+                        }
+                    )
+        jobs = jobs[:free_slots]
+
+        # Spread the Tor jobs over the exit relays
+        if tor_browser is not None:
+            tor_jobs = [job for job in jobs if job["fetcher_id"] == tor_browser.id]
+            relay_ids = self.__pick_exit_relays(len(tor_jobs))
+
+            if len(relay_ids) == 0 and len(tor_jobs) > 0:
+                self.__logger.warning("There are no exit relays to schedule jobs for")
+                jobs = [job for job in jobs if job["fetcher_id"] != tor_browser.id]
+
+            for job, relay_id in zip(tor_jobs, relay_ids):
+                job["relay_id"] = relay_id
+
+        if len(jobs) > 0:
+            fetch_queue = FetchQueue.__table__  # pylint: disable=E1101
+            self.__db_session.execute(insert(fetch_queue), jobs)
 
         # Save changes
         self.__db_session.commit()
+
+        self.__logger.debug("Scheduled %s new jobs", len(jobs))
+
+        return len(jobs)
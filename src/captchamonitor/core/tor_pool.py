@@ -0,0 +1,370 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Dict, List, Tuple, Optional
+from functools import partial
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.exceptions import TorPoolInitError
+from captchamonitor.utils.tor_launcher import TorLauncher
+from captchamonitor.utils.small_scripts import hasattr_private
+
+
+class TorPoolRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the HTTP API of the Tor pool:
+
+    - POST /leases?timeout=<seconds> leases a Tor container, waits until one is
+      available
+    - DELETE /leases/<lease id> returns the leased Tor container
+    - GET /status gets the number of Tor containers in each state
+    """
+
+    def __init__(self, tor_pool: "TorPool", *args: Any) -> None:
+        """
+        Initializes the request handler, which handles the request right away
+
+        :param tor_pool: The Tor pool to serve
+        :type tor_pool: TorPool
+        :param args: Request, client address, and server, passed to BaseHTTPRequestHandler
+        :type args: Any
+        """
+        self.__tor_pool: TorPool = tor_pool
+        super().__init__(*args)
+
+    def __send_json(self, status: int, body: Dict[str, Any]) -> None:
+        """
+        Sends the given body as the JSON response
+
+        :param status: HTTP status code of the response
+        :type status: int
+        :param body: Body of the response
+        :type body: Dict[str, Any]
+        """
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self) -> None:  # pylint: disable=C0103
+        """
+        Handles the GET requests
+        """
+        if urlparse(self.path).path == "/status":
+            self.__send_json(200, self.__tor_pool.get_status())
+        else:
+            self.__send_json(404, {"error": "Not found"})
+
+    def do_POST(self) -> None:  # pylint: disable=C0103
+        """
+        Handles the POST requests
+        """
+        url = urlparse(self.path)
+        if url.path != "/leases":
+            self.__send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            timeout = float(parse_qs(url.query).get("timeout", ["0"])[0])
+        except ValueError:
+            self.__send_json(400, {"error": "Invalid timeout"})
+            return
+
+        lease = self.__tor_pool.lease(timeout)
+        if lease is None:
+            self.__send_json(503, {"error": "No Tor container is available"})
+        else:
+            self.__send_json(200, lease)
+
+    def do_DELETE(self) -> None:  # pylint: disable=C0103
+        """
+        Handles the DELETE requests
+        """
+        path = urlparse(self.path).path
+        if path.startswith("/leases/") and self.__tor_pool.release(path[8:]):
+            self.__send_json(200, {})
+        else:
+            self.__send_json(404, {"error": "Not found"})
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=W0622
+        """
+        Logs the requests with the logger of the module instead of stderr
+
+        :param format: Format string of the message
+        :type format: str
+        :param args: Values to format the message with
+        :type args: Any
+        """
+        logging.getLogger(__name__).debug(format, *args)
+
+
+class TorPool:
+    """
+    Keeps a number of bootstrapped Tor containers running and lends them to the
+    workers over a local HTTP API, so that the workers don't need to launch
+    their own Tor containers and can share them. The Tor containers are health
+    checked through their control ports and replaced when they are unhealthy.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        size: int = 1,
+        loop: Optional[bool] = True,
+        health_check_interval: float = 60,
+    ) -> None:
+        """
+        Initializes the Tor pool and starts serving its HTTP API
+
+        :param config: The config class instance that contains global configuration values
+        :type config: Config
+        :param size: Number of Tor containers to keep running, defaults to 1
+        :type size: int
+        :param loop: Should I keep maintaining the Tor containers until the program exits, defaults to True
+        :type loop: bool, optional
+        :param health_check_interval: Number of seconds between the health checks, defaults to 60
+        :type health_check_interval: float
+        :raises TorPoolInitError: If the HTTP API couldn't be served
+        """
+        # Public class attributes
+        self.port: int
+
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
+        self.__config: Config = config
+        self.__size: int = max(1, size)
+        self.__lease_timeout: float = float(self.__config["tor_pool_lease_timeout"])
+        self.__health_check_interval: float = health_check_interval
+        self.__bootstrap_timeout: float = 300
+        self.__condition: threading.Condition = threading.Condition()
+        self.__instances: Dict[str, TorLauncher] = {}
+        self.__idle: deque = deque()
+        self.__leases: Dict[str, Tuple[str, float]] = {}
+        self.__num_launching: int = 0
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=self.__size
+        )
+
+        try:
+            self.__server = ThreadingHTTPServer(
+                ("0.0.0.0", urlparse(self.__config["tor_pool_url"]).port or 80),
+                partial(TorPoolRequestHandler, self),
+            )
+
+        except (OSError, ValueError) as exception:
+            self.__logger.warning("Could not serve the Tor pool API: %s", exception)
+            raise TorPoolInitError from exception
+
+        self.port = self.__server.server_address[1]
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        self.__logger.info("Serving the Tor pool API on port %s", self.port)
+
+        # Launch the Tor containers in the background
+        self.__launch_missing_instances()
+
+        # Keep the Tor containers healthy
+        while loop:
+            time.sleep(self.__health_check_interval)
+            self.maintain()
+
+    def __launch_missing_instances(self) -> None:
+        """
+        Launches new Tor containers in the background until there are enough of
+        them running or being launched
+        """
+        with self.__condition:
+            num_missing = self.__size - len(self.__instances) - self.__num_launching
+            self.__num_launching += max(0, num_missing)
+
+        for _ in range(num_missing):
+            self.__executor.submit(self.__launch_instance)
+
+    def __launch_instance(self) -> None:
+        """
+        Launches a new Tor container, and makes it available once Tor is done
+        bootstrapping
+        """
+        tor_launcher = None
+
+        # pylint: disable=W0703
+        try:
+            tor_launcher = TorLauncher(self.__config)
+            tor_launcher.wait_for_bootstrap(self.__bootstrap_timeout)
+
+        except Exception as exception:
+            self.__logger.warning("Could not launch a Tor container: %s", exception)
+            if tor_launcher is not None:
+                tor_launcher.close()
+            tor_launcher = None
+
+        with self.__condition:
+            self.__num_launching -= 1
+
+            if tor_launcher is not None:
+                instance_id = f"{tor_launcher.ip_address}:{tor_launcher.control_port}"
+                self.__instances[instance_id] = tor_launcher
+                self.__idle.append(instance_id)
+                self.__condition.notify()
+
+                self.__logger.debug(
+                    "Added the %s Tor container to the pool", instance_id
+                )
+
+    def __return_instance(self, instance_id: str) -> None:
+        """
+        Resets the given Tor container and makes it available again if it is
+        healthy, replaces it with a new Tor container otherwise
+
+        :param instance_id: ID of the Tor container
+        :type instance_id: str
+        """
+        tor_launcher = self.__instances[instance_id]
+
+        # pylint: disable=W0703
+        try:
+            # Undo the changes of the worker in case it couldn't do it itself
+            tor_launcher.reset_configuration()
+            healthy = tor_launcher.is_healthy()
+
+        except Exception as exception:
+            self.__logger.debug("Could not reset the Tor container: %s", exception)
+            healthy = False
+
+        if healthy:
+            with self.__condition:
+                self.__idle.append(instance_id)
+                self.__condition.notify()
+            return
+
+        self.__logger.info("Replacing the unhealthy %s Tor container", instance_id)
+
+        with self.__condition:
+            del self.__instances[instance_id]
+        tor_launcher.close()
+
+        self.__launch_missing_instances()
+
+    def lease(self, timeout: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Leases a Tor container until it is released or the lease times out
+
+        :param timeout: Maximum number of seconds to wait for a Tor container, defaults to 0
+        :type timeout: float
+        :return: ID of the lease and the address of the Tor container, None if no Tor container was available in time
+        :rtype: Optional[Dict[str, Any]]
+        """
+        deadline = time.monotonic() + timeout
+
+        with self.__condition:
+            while len(self.__idle) == 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.__condition.wait(remaining)
+
+            instance_id = self.__idle.popleft()
+            lease_id = uuid.uuid4().hex
+            self.__leases[lease_id] = (
+                instance_id,
+                time.monotonic() + self.__lease_timeout,
+            )
+            tor_launcher = self.__instances[instance_id]
+
+        return {
+            "lease_id": lease_id,
+            "ip_address": tor_launcher.ip_address,
+            "socks_port": tor_launcher.socks_port,
+            "control_port": tor_launcher.control_port,
+        }
+
+    def release(self, lease_id: str) -> bool:
+        """
+        Returns a leased Tor container to the pool
+
+        :param lease_id: ID of the lease
+        :type lease_id: str
+        :return: False if the lease didn't exist or timed out, True otherwise
+        :rtype: bool
+        """
+        with self.__condition:
+            lease = self.__leases.pop(lease_id, None)
+
+        if lease is None:
+            return False
+
+        self.__return_instance(lease[0])
+        return True
+
+    def get_status(self) -> Dict[str, int]:
+        """
+        Gets the number of Tor containers in each state
+
+        :return: Number of idle, leased, and launching Tor containers
+        :rtype: Dict[str, int]
+        """
+        with self.__condition:
+            return {
+                "idle": len(self.__idle),
+                "leased": len(self.__leases),
+                "launching": self.__num_launching,
+            }
+
+    def maintain(self) -> None:
+        """
+        Takes back the Tor containers whose leases timed out, health checks the
+        idle Tor containers, and launches new Tor containers to replace the
+        unhealthy ones
+        """
+        now = time.monotonic()
+
+        with self.__condition:
+            expired = [
+                lease_id
+                for lease_id, (_, expires_at) in self.__leases.items()
+                if expires_at <= now
+            ]
+            instance_ids: List[str] = [self.__leases.pop(i)[0] for i in expired]
+
+            # The idle Tor containers can't be leased while they are checked
+            instance_ids.extend(self.__idle)
+            self.__idle.clear()
+
+        if len(expired) > 0:
+            self.__logger.warning("Took back %s timed out leases", len(expired))
+
+        for instance_id in instance_ids:
+            self.__return_instance(instance_id)
+
+        self.__launch_missing_instances()
+
+    def close(self) -> None:
+        """
+        Stops serving the HTTP API and kills the Tor containers
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__executor.shutdown(wait=True)
+
+        with self.__condition:
+            tor_launchers = list(self.__instances.values())
+            self.__instances.clear()
+            self.__idle.clear()
+            self.__leases.clear()
+
+        for tor_launcher in tor_launchers:
+            tor_launcher.close()
+
+    def __del__(self) -> None:
+        """
+        Perform cleanup before going out of scope
+        """
+        if hasattr_private(self, "__server"):
+            self.close()
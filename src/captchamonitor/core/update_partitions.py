@@ -0,0 +1,226 @@
+import logging
+from typing import Any
+from datetime import date, datetime
+
+import pytz
+from sqlalchemy import Table, or_, sql, exists
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Connection
+
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.models import (
+    Blob,
+    Model,
+    FetchFailed,
+    FetchCompleted,
+    AnalyzeCompleted,
+)
+from captchamonitor.utils.partitions import (
+    add_months,
+    get_partitions,
+    is_partitioned,
+    remove_partition,
+    create_partitions,
+    get_partitioned_tables,
+    get_archived_partitions,
+)
+
+
+class UpdatePartitions:
+    """
+    Creates the monthly partitions of the partitioned tables ahead of time and
+    removes the data that is older than the retention period, including the
+    bodies that were only used by the removed fetches
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        db_session: sessionmaker,
+        months_ahead: int = 2,
+    ) -> None:
+        """
+        Initializes UpdatePartitions
+
+        :param config: The config class instance that contains global configuration values
+        :type config: Config
+        :param db_session: Database session used to connect to the database
+        :type db_session: sessionmaker
+        :param months_ahead: Number of months to create the partitions for, including the current one, defaults to 2
+        :type months_ahead: int
+        """
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
+        self.__config: Config = config
+        self.__db_session: sessionmaker = db_session
+        self.__months_ahead: int = months_ahead
+        self.__retention_months: int = int(self.__config["db_retention_months"])
+        self.__archive_schema: str = self.__config["db_retention_archive_schema"]
+
+        # Calls to the class methods
+        self.update()
+
+    def update(self) -> None:
+        """
+        Creates the missing partitions and applies the retention period
+        """
+        today = datetime.now(pytz.utc).date()
+
+        # Roll back the possibly open transaction of the session, so it doesn't
+        # hold any locks on the tables while altering their partitions
+        self.__db_session.rollback()
+
+        with self.__db_session.get_bind().connect() as connection:
+            for table in get_partitioned_tables(Model.metadata):
+                if not is_partitioned(connection, table.name):
+                    continue
+
+                for name in create_partitions(
+                    connection, table, today, self.__months_ahead
+                ):
+                    self.__logger.info("Created the %s partition", name)
+
+                if self.__retention_months > 0:
+                    self.__remove_old_partitions(connection, table, today)
+
+        if self.__retention_months > 0:
+            self.__delete_old_rows(today)
+            self.__delete_orphaned_blobs(today)
+
+    def __get_cutoff(self, today: date) -> date:
+        """
+        Gets the first day of the oldest month to keep
+
+        :param today: The current date
+        :type today: date
+        :return: The first day of the oldest month to keep
+        :rtype: date
+        """
+        return add_months(today, 1 - self.__retention_months)
+
+    def __remove_old_partitions(
+        self, connection: Connection, table: Table, today: date
+    ) -> None:
+        """
+        Archives or drops the partitions of the given table that only contain
+        data older than the retention period
+
+        :param connection: Connection to the database
+        :type connection: Connection
+        :param table: The partitioned table
+        :type table: Table
+        :param today: The current date
+        :type today: date
+        """
+        cutoff = self.__get_cutoff(today)
+
+        for name, month in sorted(get_partitions(connection, table.name).items()):
+            if month >= cutoff:
+                continue
+
+            remove_partition(connection, table, name, self.__archive_schema)
+
+            if self.__archive_schema:
+                self.__logger.info(
+                    "Moved the %s partition to the %s schema",
+                    name,
+                    self.__archive_schema,
+                )
+            else:
+                self.__logger.info("Dropped the %s partition", name)
+
+    def __delete_old_rows(self, today: date) -> None:
+        """
+        Deletes the rows older than the retention period. These are the rows of
+        the tables that were created before they could be partitioned, and the
+        rows of the partitioned tables that ended up in their default partitions.
+
+        :param today: The current date
+        :type today: date
+        """
+        cutoff = datetime.combine(
+            self.__get_cutoff(today), datetime.min.time(), pytz.utc
+        )
+
+        # The analyses have to be deleted before their fetches, since the tables
+        # created before partitioning reference the fetches with a foreign key
+        old_fetches = self.__db_session.query(FetchCompleted.id).filter(
+            FetchCompleted.created_at < cutoff
+        )
+        self.__delete(
+            AnalyzeCompleted,
+            or_(
+                AnalyzeCompleted.created_at < cutoff,
+                AnalyzeCompleted.fetch_completed_id.in_(old_fetches.subquery()),
+            ),
+        )
+        self.__delete(FetchCompleted, FetchCompleted.created_at < cutoff)
+        self.__delete(FetchFailed, FetchFailed.created_at < cutoff)
+
+    def __delete_orphaned_blobs(self, today: date) -> None:
+        """
+        Deletes the blobs older than the retention period that none of the
+        fetches use anymore. The fetches in the archived partitions still
+        reference their blobs, so their blobs are kept. The blobs locked by the
+        workers for the fetches they are inserting are skipped.
+
+        :param today: The current date
+        :type today: date
+        """
+        cutoff = datetime.combine(
+            self.__get_cutoff(today), datetime.min.time(), pytz.utc
+        )
+
+        fetch_tables = [FetchCompleted.__table__]  # pylint: disable=E1101
+        if self.__archive_schema:
+            fetch_tables += [
+                sql.table(
+                    name,
+                    sql.column("html_data_blob_id"),
+                    sql.column("http_requests_blob_id"),
+                    schema=self.__archive_schema,
+                )
+                for name in get_archived_partitions(
+                    self.__db_session.connection(),
+                    FetchCompleted.__tablename__,
+                    self.__archive_schema,
+                )
+            ]
+
+        # pylint: disable=W0143
+        orphaned = (
+            self.__db_session.query(Blob.id)
+            .filter(Blob.created_at < cutoff)
+            .filter(
+                *(
+                    ~exists().where(fetch_table.c[column_name] == Blob.id)
+                    for fetch_table in fetch_tables
+                    for column_name in ("html_data_blob_id", "http_requests_blob_id")
+                )
+            )
+            .with_for_update(skip_locked=True)
+        )
+        self.__delete(Blob, Blob.id.in_(orphaned.subquery()))
+
+    def __delete(self, model: Any, criterion: Any) -> None:
+        """
+        Deletes the rows of the given model that match the given criterion
+
+        :param model: The model to delete the rows of
+        :type model: Any
+        :param criterion: Filter for the rows to delete
+        :type criterion: Any
+        """
+        count = (
+            self.__db_session.query(model)
+            .filter(criterion)
+            .delete(synchronize_session=False)
+        )
+        self.__db_session.commit()
+
+        if count > 0:
+            self.__logger.info(
+                "Deleted %s rows older than the retention period from the %s table",
+                count,
+                model.__tablename__,
+            )
@@ -1,14 +1,17 @@
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 
 import pytz
+from sqlalchemy import or_
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import insert
 
 from captchamonitor.utils.config import Config
 from captchamonitor.utils.models import Relay, MetaData
 from captchamonitor.utils.onionoo import Onionoo, OnionooRelayEntry
 from captchamonitor.utils.collector import Collector
+from captchamonitor.utils.relay_history import record_consensus, get_consensus_snapshot
 from captchamonitor.utils.consensus_parser import ConsensusV3Parser, ConsensusRelayEntry
 
 
@@ -88,78 +91,99 @@ class UpdateRelays:
         self,
         onionoo_relay_data: List[OnionooRelayEntry],
         parsed_consensus: Dict[str, ConsensusRelayEntry],
+        updated_at: Optional[datetime] = None,
+        chunk_size: int = 1000,
     ) -> None:
         """
-        Inserts given batch of data into the database
+        Inserts given batch of data into the database, updating the relays that
+        already exist. Sends a single upsert statement for each chunk of relays
+        instead of querying and updating the relays one by one.
 
         :param onionoo_relay_data: List of OnionooRelayEntry objects
         :type onionoo_relay_data: List[OnionooRelayEntry]
         :param parsed_consensus: Dictionary of ConsensusRelayEntry
         :type parsed_consensus: Dict[str, ConsensusRelayEntry]
+        :param updated_at: Update time to set for the relays, defaults to the current time
+        :type updated_at: Optional[datetime]
+        :param chunk_size: Maximum number of relays to upsert in a single statement, defaults to 1000
+        :type chunk_size: int
         """
-        # Iterate over the relays in consensus file
+        if updated_at is None:
+            updated_at = datetime.now(pytz.utc)
+
+        # A single statement can't update the same relay twice
+        relays = {}
         for onionoo_relay in onionoo_relay_data:
-            # Check if the relay already exists
-            query = self.__db_session.query(Relay).filter(
-                Relay.fingerprint == onionoo_relay.fingerprint
+            consensus_relay = parsed_consensus[onionoo_relay.fingerprint]
+            relays[onionoo_relay.fingerprint] = {
+                "created_at": updated_at,
+                "updated_at": updated_at,
+                "fingerprint": onionoo_relay.fingerprint,
+                "ipv4_address": consensus_relay.IP,
+                "ipv6_address": consensus_relay.IPv6,
+                "ipv4_exiting_allowed": onionoo_relay.ipv4_exiting_allowed,
+                "ipv6_exiting_allowed": onionoo_relay.ipv6_exiting_allowed,
+                "country": onionoo_relay.country,
+                "country_name": onionoo_relay.country_name,
+                "continent": onionoo_relay.continent,
+                "status": True,
+                "nickname": onionoo_relay.nickname,
+                "first_seen": onionoo_relay.first_seen,
+                "last_seen": onionoo_relay.last_seen,
+                "version": onionoo_relay.version,
+                "asn": onionoo_relay.asn,
+                "asn_name": onionoo_relay.asn_name,
+                "platform": onionoo_relay.platform,
+                "exit_probability": consensus_relay.exit_probability,
+            }
+
+        rows = list(relays.values())
+        relay = Relay.__table__  # pylint: disable=E1101
+        for i in range(0, len(rows), chunk_size):
+            statement = insert(relay).values(rows[i : i + chunk_size])
+
+            # Update everything except the creation time of the existing relays
+            statement = statement.on_conflict_do_update(
+                index_elements=[relay.c.fingerprint],
+                set_={
+                    column: statement.excluded[column]
+                    for column in rows[0]
+                    if column not in ("created_at", "fingerprint")
+                },
             )
+            self.__db_session.execute(statement)
 
-            if query.count() == 0:
-                # Add new relay
-                db_relay = Relay(
-                    fingerprint=onionoo_relay.fingerprint,
-                    ipv4_address=parsed_consensus[onionoo_relay.fingerprint].IP,
-                    ipv6_address=parsed_consensus[onionoo_relay.fingerprint].IPv6,
-                    ipv4_exiting_allowed=onionoo_relay.ipv4_exiting_allowed,
-                    ipv6_exiting_allowed=onionoo_relay.ipv6_exiting_allowed,
-                    country=onionoo_relay.country,
-                    country_name=onionoo_relay.country_name,
-                    continent=onionoo_relay.continent,
-                    status=True,
-                    nickname=onionoo_relay.nickname,
-                    first_seen=onionoo_relay.first_seen,
-                    last_seen=onionoo_relay.last_seen,
-                    version=onionoo_relay.version,
-                    asn=onionoo_relay.asn,
-                    asn_name=onionoo_relay.asn_name,
-                    platform=onionoo_relay.platform,
-                )
+        # Commit changes to the database
+        self.__db_session.commit()
 
-                # Add to the database
-                self.__db_session.add(db_relay)
+        self.__logger.debug("Inserted a batch of relays into the database")
 
-            else:
-                # Update the existing relay
-                db_relay = query.first()
-                db_relay.updated_at = datetime.now(pytz.utc)
-                db_relay.ipv4_address = parsed_consensus[onionoo_relay.fingerprint].IP
-                db_relay.ipv6_address = parsed_consensus[onionoo_relay.fingerprint].IPv6
-                db_relay.ipv4_exiting_allowed = onionoo_relay.ipv4_exiting_allowed
-                db_relay.ipv6_exiting_allowed = onionoo_relay.ipv6_exiting_allowed
-                db_relay.country = onionoo_relay.country
-                db_relay.country_name = onionoo_relay.country_name
-                db_relay.continent = onionoo_relay.continent
-                db_relay.status = True
-                db_relay.nickname = onionoo_relay.nickname
-                db_relay.first_seen = onionoo_relay.first_seen
-                db_relay.last_seen = onionoo_relay.last_seen
-                db_relay.version = onionoo_relay.version
-                db_relay.asn = onionoo_relay.asn
-                db_relay.asn_name = onionoo_relay.asn_name
-                db_relay.platform = onionoo_relay.platform
+    def __mark_offline_relays(self, updated_at: datetime) -> None:
+        """
+        Marks the relays that weren't updated at the given time as offline, in a
+        single statement
 
-        # Commit changes to the database
+        :param updated_at: Update time that was set for the online relays
+        :type updated_at: datetime
+        """
+        # pylint: disable=C0121
+        count = (
+            self.__db_session.query(Relay)
+            .filter(Relay.status.isnot(False))
+            .filter(or_(Relay.updated_at == None, Relay.updated_at < updated_at))
+            .update({Relay.status: False}, synchronize_session=False)
+        )
         self.__db_session.commit()
 
-        self.__logger.debug("Inserted a batch of relays into the database")
+        self.__logger.debug("Marked %s relays as offline", count)
 
     def update(self, batch_size: int = 40) -> None:
         """
         Gets the latest consensus and parses the list of relays in the consensus.
-        Later, adds the relays to the database. Performs this operation in batches
-        to not to overwhelm the Onionoo API.
+        Later, gets the details of the relays from Onionoo and adds the relays to
+        the database.
 
-        :param batch_size: Number of relays to process in a single batch, defaults to 40
+        :param batch_size: Number of relays to look up in a single Onionoo request, defaults to 40
         :type batch_size: int
         """
         # Download the latest consensus
@@ -167,28 +191,26 @@ class UpdateRelays:
         consensus_file = self.__collector.get_consensus(current_datetime)
 
         # Parse the consensus file
+        consensus = ConsensusV3Parser(consensus_file)
         parsed_consensus = {
-            str(relay.fingerprint): relay
-            for relay in ConsensusV3Parser(consensus_file).relay_entries
+            str(relay.fingerprint): relay for relay in consensus.relay_entries
         }
 
-        relay_fingerprints = list(parsed_consensus.keys())
+        # The relay table only keeps the latest state of the relays, so their
+        # earlier states are kept in the relay history
+        if record_consensus(self.__db_session, get_consensus_snapshot(consensus)):
+            self.__logger.debug("Recorded the consensus in the relay history")
 
-        # Set all relays as offline
-        # TODO: Yes, the following is a bad practice, please use an ORM statement instead
-        table = Relay.__tablename__.lower()
-        query = f"UPDATE {table} SET status = false"
-        self.__db_session.execute(query)
-        self.__db_session.commit()
+        relay_fingerprints = list(parsed_consensus.keys())
+        updated_at = datetime.now(pytz.utc)
 
-        # Get relay information in chunks to not overwhelm Onionoo API
-        for i in range(0, len(relay_fingerprints), batch_size):
-            relay_batch = relay_fingerprints[i : i + batch_size]
+        # Get relays' details from Onionoo
+        onionoo_relay_data = Onionoo(relay_fingerprints, batch_size).relay_entries
 
-            # Get relays' details from Onionoo
-            onionoo_relay_data = Onionoo(relay_batch).relay_entries
+        self.__insert_batch_into_db(onionoo_relay_data, parsed_consensus, updated_at)
 
-            self.__insert_batch_into_db(onionoo_relay_data, parsed_consensus)
+        # The relays that weren't in this consensus are offline
+        self.__mark_offline_relays(updated_at)
 
         self.__logger.info(
             "Done with updating the relay list using the latest consensus"
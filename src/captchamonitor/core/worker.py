@@ -1,25 +1,79 @@
 import time
 import logging
-from typing import Union, Optional
+from queue import Queue
+from typing import Dict, List, Tuple, Union, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
-from sqlalchemy import text
+from sqlalchemy import update
 from sqlalchemy.orm import sessionmaker
 
 from captchamonitor.utils.config import Config
 from captchamonitor.utils.models import FetchQueue, FetchFailed, FetchCompleted
-from captchamonitor.utils.exceptions import FetcherNotFound
+from captchamonitor.utils.blob_store import BlobStore
+from captchamonitor.utils.exceptions import FetcherNotFound, TorPoolLeaseError
 from captchamonitor.utils.tor_launcher import TorLauncher
 from captchamonitor.utils.small_scripts import (
     hasattr_private,
     get_traceback_information,
 )
 from captchamonitor.fetchers.tor_browser import TorBrowser
+from captchamonitor.fetchers.session_pool import SessionPool
+from captchamonitor.utils.tor_pool_client import TorPoolClient
 from captchamonitor.fetchers.opera_browser import OperaBrowser
 from captchamonitor.fetchers.chrome_browser import ChromeBrowser
 from captchamonitor.utils.container_manager import ContainerManager
 from captchamonitor.fetchers.firefox_browser import FirefoxBrowser
 
 
+def claim_jobs(
+    db_session: sessionmaker, worker_id: str, batch_size: int = 1
+) -> List[FetchQueue]:
+    """
+    Claims up to batch_size unclaimed jobs from the job queue for the given worker
+    and returns them. The claim is done in a single round trip using
+    SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never wait on or
+    claim the same rows.
+
+    :param db_session: Database session used to connect to the database
+    :type db_session: sessionmaker
+    :param worker_id: Worker ID to claim the jobs for
+    :type worker_id: str
+    :param batch_size: Maximum number of jobs to claim at once, defaults to 1
+    :type batch_size: int
+    :return: List of claimed jobs ordered by their IDs, empty if the queue is empty
+    :rtype: List[FetchQueue]
+    """
+    # pylint: disable=C0121
+    unclaimed = (
+        db_session.query(FetchQueue.id)
+        .filter(FetchQueue.claimed_by == None)
+        .order_by(FetchQueue.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .subquery()
+    )
+
+    # Mark the rows as claimed and get them back within the same statement
+    fetch_queue = FetchQueue.__table__  # pylint: disable=E1101
+    claimed = (
+        update(fetch_queue)
+        .where(FetchQueue.id.in_(unclaimed))
+        .values(claimed_by=worker_id)
+        .returning(*fetch_queue.columns)
+        .cte("claimed")
+    )
+
+    jobs = (
+        db_session.query(FetchQueue)
+        .select_entity_from(claimed)
+        .order_by(claimed.c.id)
+        .all()
+    )
+    db_session.commit()
+
+    return jobs
+
+
 class Worker:
     """
     Fetches a job from the database and processes it using Tor Browser or
@@ -33,6 +87,8 @@ class Worker:
         config: Config,
         db_session: sessionmaker,
         loop: Optional[bool] = True,
+        job_batch_size: int = 1,
+        concurrency: int = 1,
     ) -> None:
         """
         Initializes a new worker
@@ -45,121 +101,316 @@ class Worker:
         :type db_session: sessionmaker
         :param loop: Should I process a single job or loop over all jobs, defaults to True
         :type loop: bool, optional
+        :param job_batch_size: Number of jobs to claim from the queue at once, defaults to 1
+        :type job_batch_size: int
+        :param concurrency: Number of jobs to fetch in parallel, defaults to 1
+        :type concurrency: int
         """
         # Private class attributes
         self.__logger = logging.getLogger(__name__)
         self.__config: Config = config
         self.__db_session: sessionmaker = db_session
         self.__worker_id: str = worker_id
-        self.__tor_launcher: TorLauncher = TorLauncher(self.__config)
         self.__job_queue_delay: float = float(self.__config["job_queue_delay"])
-        self.__fetcher: Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser]
+        self.__concurrency: int = max(1, concurrency)
+        self.__job_batch_size: int = max(job_batch_size, self.__concurrency)
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=self.__concurrency
+        )
+
+        # Browser sessions are reused across the jobs with the same settings
+        self.__session_pool: SessionPool = SessionPool(
+            max_uses=int(self.__config["worker_session_max_uses"])
+        )
+
+        # Page sources and HARs are stored compressed and deduplicated
+        self.__blob_store: BlobStore = BlobStore(
+            db_session,
+            compression_level=int(self.__config["blob_compression_level"]),
+            dictionary_samples=int(self.__config["blob_dictionary_samples"]),
+        )
+
+        # Tor containers are leased from the Tor pool for each fetch if there is
+        # one, otherwise each fetcher slot gets its own Tor container. Either way
+        # parallel fetches can use different circuits at the same time.
+        self.__tor_pool: Optional[TorPoolClient] = None
+        self.__tor_launchers: Queue = Queue()
+        if self.__config["tor_pool_url"]:
+            self.__tor_pool = TorPoolClient(self.__config)
+        else:
+            for _ in range(self.__concurrency):
+                self.__tor_launchers.put(TorLauncher(self.__config))
+
+        # Resume the jobs claimed by this worker before it was restarted
+        self.__claimed_jobs: List[FetchQueue] = (
+            self.__db_session.query(FetchQueue)
+            .filter(FetchQueue.claimed_by == self.__worker_id)
+            .order_by(FetchQueue.id)
+            .all()
+        )
 
         # Loop over the jobs
         while loop:
-            self.process_next_job()
-            time.sleep(self.__job_queue_delay)
+            # Only wait if the queue was empty
+            if self.process_next_jobs() == 0:
+                time.sleep(self.__job_queue_delay)
 
-    def process_next_job(self) -> None:
+    def process_next_job(self) -> bool:
         """
-        Processes the next available job in the job queue. Claims the job, tries
-        fetching the URL specified in the job with the specified fetcher. If
-        successfull, inserts the results into the FetchCompleted table. Otherwise,
-        inserts the results into the FetchFailed table. Finally, removes the
-        claimed job from the queue.
+        Processes the next available job in the job queue. See process_next_jobs
+        for the details.
 
-        :raises FetcherNotFound: If requested fetcher is not available
+        :return: True if a job was processed, False if the queue was empty
+        :rtype: bool
         """
-        # pylint: disable=R0912,R0915
-        # Get claimed jobs by this worker
-        db_job = self.__db_session.query(FetchQueue).filter(
-            FetchQueue.claimed_by == self.__worker_id
-        )
+        return self.process_next_jobs(num_jobs=1) > 0
 
-        # Claim a new job if not already claimed
-        if db_job.count() == 0:
-            # TODO: Yes, the following is a bad practice, please use an ORM statement instead
-            table = FetchQueue.__tablename__.lower()
-            query = f"UPDATE {table} SET claimed_by = :worker_id WHERE id = (SELECT min(id) FROM {table} WHERE claimed_by IS NULL)"
-            params = {"worker_id": self.__worker_id}
-            self.__db_session.execute(text(query), params)
-            self.__db_session.commit()
+    def process_next_jobs(self, num_jobs: Optional[int] = None) -> int:
+        """
+        Processes the next available jobs in the job queue. Claims a batch of jobs
+        if the local batch is empty, tries fetching the URLs specified in the jobs
+        with the specified fetchers, running up to `concurrency` fetchers in
+        parallel. If successfull, inserts the results into the FetchCompleted
+        table. Otherwise, inserts the results into the FetchFailed table. Finally,
+        removes the claimed jobs from the queue. The jobs that couldn't get a Tor
+        container from the Tor pool are put back to the queue instead.
 
-        # Get the claimed job
-        job = db_job.first()
+        :param num_jobs: Maximum number of jobs to process, defaults to the concurrency level
+        :type num_jobs: Optional[int], optional
+        :return: Number of jobs processed
+        :rtype: int
+        """
+        if num_jobs is None:
+            num_jobs = self.__concurrency
 
-        # Don't do anything if there is no job in the queue
-        if job is None:
-            return
+        # Claim a new batch of jobs if we are done with the local batch
+        if len(self.__claimed_jobs) == 0:
+            self.__claimed_jobs = claim_jobs(
+                self.__db_session, self.__worker_id, self.__job_batch_size
+            )
 
-        try:
-            # Create the options based on the ones described within the job
-            options_dict = {}
-            if job.options is not None:
-                options_dict = job.options
+        # Get the next claimed jobs
+        jobs = self.__claimed_jobs[: min(num_jobs, self.__concurrency)]
+        del self.__claimed_jobs[: len(jobs)]
 
-            # Create a new circuit if we will be using Tor
-            proxy = None
-            if job.ref_fetcher.uses_proxy_type == "tor":
-                self.__tor_launcher.create_new_circuit_to(job.ref_relay.fingerprint)
-                proxy = (
-                    self.__tor_launcher.ip_address,
-                    self.__tor_launcher.socks_port,
-                )
+        # Start fetching the jobs in parallel, each with its own Tor container
+        futures: Dict[
+            Future,
+            Tuple[
+                FetchQueue,
+                Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser],
+                Optional[TorLauncher],
+            ],
+        ] = {}
+        num_processed = len(jobs)
+        for job in jobs:
+            tor_launcher = None
 
-            # Check if the proxy type is http, if so: add host and port into the proxy tuple
-            elif job.ref_fetcher.uses_proxy_type == "http":
-                proxy = (job.ref_proxy.host, job.ref_proxy.port)
-
-            # Fetch it using a fetcher
-            if job.ref_fetcher.method == TorBrowser.method_name_in_db:
-                options_dict.update({"tbb_security_level": job.tbb_security_level})
-                self.__fetcher = TorBrowser(
-                    config=self.__config,
-                    url=job.url,
-                    proxy=proxy,
-                    options=options_dict,
-                    use_proxy_type=job.ref_fetcher.uses_proxy_type,
-                )
+            # pylint: disable=W0703
+            try:
+                if job.ref_fetcher.uses_proxy_type == "tor":
+                    tor_launcher = self.__get_tor_launcher()
 
-            elif job.ref_fetcher.method == FirefoxBrowser.method_name_in_db:
-                self.__fetcher = FirefoxBrowser(
-                    config=self.__config,
-                    url=job.url,
-                    proxy=proxy,
-                    options=options_dict,
-                    use_proxy_type=job.ref_fetcher.uses_proxy_type,
-                )
+                fetcher, exit_relay = self.__create_fetcher(job, tor_launcher)
 
-            elif job.ref_fetcher.method == ChromeBrowser.method_name_in_db:
-                self.__fetcher = ChromeBrowser(
-                    config=self.__config,
-                    url=job.url,
-                    proxy=proxy,
-                    options=options_dict,
-                    use_proxy_type=job.ref_fetcher.uses_proxy_type,
-                )
+            except TorPoolLeaseError:
+                # The fetch wasn't tried, so try it again later
+                self.__release_job(job)
+                num_processed -= 1
 
-            elif job.ref_fetcher.method == OperaBrowser.method_name_in_db:
-                self.__fetcher = OperaBrowser(
-                    config=self.__config,
-                    url=job.url,
-                    proxy=proxy,
-                    options=options_dict,
-                    use_proxy_type=job.ref_fetcher.uses_proxy_type,
-                )
+            except Exception:
+                if tor_launcher is not None:
+                    self.__put_tor_launcher(tor_launcher)
+                self.__insert_result(job, None, get_traceback_information())
 
             else:
-                raise FetcherNotFound
+                future = self.__executor.submit(
+                    self.__fetch, fetcher, tor_launcher, exit_relay
+                )
+                futures[future] = (job, fetcher, tor_launcher)
+
+        # Insert the results into the database as the fetches complete
+        for future in as_completed(futures):
+            job, fetcher, tor_launcher = futures[future]
+            if tor_launcher is not None:
+                self.__put_tor_launcher(tor_launcher)
+            self.__insert_result(job, fetcher, future.result())
+
+        return num_processed
+
+    def __get_tor_launcher(self) -> TorLauncher:
+        """
+        Gets a Tor container for a fetch, from the Tor pool if there is one. The
+        TorPoolLeaseError of TorPoolClient.lease() is passed on if no Tor
+        container was available in the Tor pool.
+
+        :return: Tor launcher of the Tor container
+        :rtype: TorLauncher
+        """
+        if self.__tor_pool is not None:
+            return self.__tor_pool.lease()
+
+        return self.__tor_launchers.get()
 
-            self.__fetcher.setup()
-            self.__fetcher.connect()
-            self.__fetcher.fetch()
+    def __put_tor_launcher(self, tor_launcher: TorLauncher) -> None:
+        """
+        Returns the Tor container of a fetch once the fetch is done
+
+        :param tor_launcher: Tor launcher returned by __get_tor_launcher()
+        :type tor_launcher: TorLauncher
+        """
+        if self.__tor_pool is not None:
+            self.__tor_pool.release(tor_launcher)
+        else:
+            self.__tor_launchers.put(tor_launcher)
+
+    def __release_job(self, job: FetchQueue) -> None:
+        """
+        Puts a claimed job back to the queue, so that it's claimed again
+
+        :param job: The claimed job
+        :type job: FetchQueue
+        """
+        job.claimed_by = None
+        self.__db_session.commit()
+
+        self.__logger.debug(
+            "Worker %s put %s back to the queue", self.__worker_id, job.url
+        )
+
+    def __create_fetcher(
+        self, job: FetchQueue, tor_launcher: Optional[TorLauncher]
+    ) -> Tuple[
+        Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser], Optional[str]
+    ]:
+        """
+        Creates the fetcher described within the job. The job is only accessed
+        here, so that the fetching threads don't need to touch the database session.
 
+        :param job: The job to create the fetcher for
+        :type job: FetchQueue
+        :param tor_launcher: Tor container to use, None if the fetcher doesn't use Tor
+        :type tor_launcher: Optional[TorLauncher]
+        :raises FetcherNotFound: If requested fetcher is not available
+        :return: The fetcher and the exit relay fingerprint to use if the fetcher uses Tor
+        :rtype: Tuple[Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser], Optional[str]]
+        """
+        # Create the options based on the ones described within the job
+        options_dict = {}
+        if job.options is not None:
+            options_dict = dict(job.options)
+
+        # Use the Tor container if we will be using Tor
+        proxy = None
+        exit_relay = None
+        if tor_launcher is not None:
+            exit_relay = job.ref_relay.fingerprint
+            proxy = (tor_launcher.ip_address, tor_launcher.socks_port)
+
+        # Check if the proxy type is http, if so: add host and port into the proxy tuple
+        elif job.ref_fetcher.uses_proxy_type == "http":
+            proxy = (job.ref_proxy.host, job.ref_proxy.port)
+
+        fetcher_class: type
+        if job.ref_fetcher.method == TorBrowser.method_name_in_db:
+            options_dict.update({"tbb_security_level": job.tbb_security_level})
+            fetcher_class = TorBrowser
+
+        elif job.ref_fetcher.method == FirefoxBrowser.method_name_in_db:
+            fetcher_class = FirefoxBrowser
+
+        elif job.ref_fetcher.method == ChromeBrowser.method_name_in_db:
+            fetcher_class = ChromeBrowser
+
+        elif job.ref_fetcher.method == OperaBrowser.method_name_in_db:
+            fetcher_class = OperaBrowser
+
+        else:
+            raise FetcherNotFound
+
+        fetcher = fetcher_class(
+            config=self.__config,
+            url=job.url,
+            proxy=proxy,
+            options=options_dict,
+            use_proxy_type=job.ref_fetcher.uses_proxy_type,
+            session_pool=self.__session_pool,
+        )
+
+        return fetcher, exit_relay
+
+    @staticmethod
+    def __fetch(
+        fetcher: Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser],
+        tor_launcher: Optional[TorLauncher],
+        exit_relay: Optional[str],
+    ) -> Optional[str]:
+        """
+        Fetches the URL with the given fetcher. Runs in a separate thread, so it
+        must not access the database session.
+
+        :param fetcher: The fetcher to use
+        :type fetcher: Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser]
+        :param tor_launcher: Tor container assigned to this fetch, None if the fetcher doesn't use Tor
+        :type tor_launcher: Optional[TorLauncher]
+        :param exit_relay: Fingerprint of the exit relay to use if the fetcher uses Tor
+        :type exit_relay: Optional[str]
+        :return: The error if the fetch failed, None otherwise
+        :rtype: Optional[str]
+        """
         # pylint: disable=W0703
+        try:
+            # Create a new circuit if we will be using Tor
+            if tor_launcher is not None and exit_relay is not None:
+                tor_launcher.create_new_circuit_to(exit_relay)
+
+            fetcher.setup()
+            fetcher.connect()
+            fetcher.fetch()
+
         except Exception:
             error = get_traceback_information()
 
+            # If fetcher was set up correctly, check if container is healthy
+            if hasattr(fetcher, "container_host"):
+                ContainerManager(
+                    fetcher.container_host
+                ).restart_browser_container_if_unhealthy()
+
+            return error
+
+        finally:
+            # Close the fetcher
+            fetcher.close()
+
+            # Reset the changes
+            if tor_launcher is not None:
+                tor_launcher.reset_configuration()
+
+        return None
+
+    def __insert_result(
+        self,
+        job: FetchQueue,
+        fetcher: Optional[
+            Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser]
+        ],
+        error: Optional[str],
+    ) -> None:
+        """
+        Inserts the result of the job into the FetchCompleted or FetchFailed table
+        and removes the job from the queue
+
+        :param job: The processed job
+        :type job: FetchQueue
+        :param fetcher: The fetcher used for the job, None if it couldn't be created
+        :type fetcher: Optional[Union[TorBrowser, FirefoxBrowser, ChromeBrowser, OperaBrowser]]
+        :param error: The error if the job failed, None otherwise
+        :type error: Optional[str]
+        """
+        options_dict = fetcher.options if fetcher is not None else job.options or {}
+
+        if fetcher is None or error is not None:
             # If failed, put into the failed table
             failed = FetchFailed(
                 url=job.url,
@@ -181,14 +432,6 @@ class Worker:
                 str(error),
             )
 
-            # If fetcher was initialized correctly
-            if hasattr_private(self, "__fetcher"):
-                # Check if container is healthy
-                self.__logger.debug("Checking if the container is healthy")
-                ContainerManager(
-                    self.__fetcher.container_host
-                ).restart_browser_container_if_unhealthy()
-
         else:
             # If successful, put into the completed table
             completed = FetchCompleted(
@@ -196,8 +439,12 @@ class Worker:
                 options=options_dict,
                 tbb_security_level=job.tbb_security_level,
                 captcha_monitor_version=self.__config["version"],
-                html_data=self.__fetcher.page_source,
-                http_requests=self.__fetcher.page_har,
+                html_data_blob_id=self.__blob_store.put(
+                    fetcher.page_source, job.domain_id
+                ),
+                http_requests_blob_id=self.__blob_store.put(
+                    fetcher.page_har, job.domain_id
+                ),
                 fetcher_id=job.fetcher_id,
                 domain_id=job.domain_id,
                 relay_id=job.relay_id,
@@ -205,30 +452,35 @@ class Worker:
             )
             self.__db_session.add(completed)
             self.__logger.debug(
-                "Worker %s successfully fetched %s with %s",
+                "Worker %s successfully fetched %s with %s after waiting %.2f seconds",
                 self.__worker_id,
                 job.url,
                 job.fetcher_id,
+                fetcher.waited_duration,
             )
 
-        finally:
-            # Close the fetcher
-            if hasattr_private(self, "__fetcher"):
-                self.__fetcher.close()
-
-            # Reset the changes
-            self.__tor_launcher.reset_configuration()
-
-            # Delete job from the job queue
-            self.__db_session.delete(job)
+        # Delete job from the job queue
+        self.__db_session.delete(job)
 
-            # Commit changes to the database
-            self.__db_session.commit()
+        # Commit changes to the database
+        self.__db_session.commit()
 
     def __del__(self) -> None:
         """
         Perform cleanup before going out of scope
         """
-        if hasattr_private(self, "__tor_launcher"):
+        if hasattr_private(self, "__executor"):
+            self.__executor.shutdown(wait=True)
+
+        if hasattr_private(self, "__session_pool"):
+            # Close the idle browser sessions
+            self.__session_pool.close()
+
+        if hasattr_private(self, "__tor_pool") and self.__tor_pool is not None:
+            # Return the leased Tor containers
+            self.__tor_pool.close()
+
+        if hasattr_private(self, "__tor_launchers"):
             # Stop the containers
-            self.__tor_launcher.close()
+            while not self.__tor_launchers.empty():
+                self.__tor_launchers.get().close()
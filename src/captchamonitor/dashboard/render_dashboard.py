@@ -5,7 +5,7 @@ from typing import Any, List, Tuple, Optional
 
 import matplotlib.pyplot as plt
 from jinja2 import Environment, FileSystemLoader
-from sqlalchemy import Date, or_, cast
+from sqlalchemy import or_
 from sqlalchemy.orm import sessionmaker
 
 from captchamonitor.utils.config import Config
@@ -196,17 +196,13 @@ class RenderDashboard:
         relay_db_data = self.__db_session.query(Relay).all()
 
         for _ in relay_db_data:
-            fetch_relay = (
-                self.__db_session.query(FetchCompleted).filter(
+            # IDs of the fetches completed through this relay
+            fetch_ids = [
+                fetch_id
+                for (fetch_id,) in self.__db_session.query(FetchCompleted.id).filter(
                     FetchCompleted.relay_id == _.id  # pylint: disable=W0143
                 )
-            ).all()
-
-            fetch_ids = []
-
-            # Relays which are Fetched successfully
-            for y in fetch_relay:
-                fetch_ids.append(y.id)
+            ]
 
             relay_fingerprint = _.fingerprint
 
@@ -214,10 +210,9 @@ class RenderDashboard:
                 total_query_ = (
                     self.__db_session.query(AnalyzeCompleted)
                     .filter(
-                        cast(AnalyzeCompleted.created_at, Date)
-                        >= f"{time[1]} 00:00:00",
-                        cast(AnalyzeCompleted.created_at, Date)
-                        <= f"{time[1]} 23:59:59",
+                        # Compare the timestamps directly so that the index is used
+                        AnalyzeCompleted.created_at >= f"{time[1]} 00:00:00",
+                        AnalyzeCompleted.created_at <= f"{time[1]} 23:59:59.999999",
                         AnalyzeCompleted.fetch_completed_id.in_(
                             fetch_ids
                         ),  # pylint: disable=E1101
@@ -228,10 +223,9 @@ class RenderDashboard:
                 job_query = (
                     self.__db_session.query(AnalyzeCompleted)
                     .filter(
-                        cast(AnalyzeCompleted.created_at, Date)
-                        >= f"{time[1]} 00:00:00",
-                        cast(AnalyzeCompleted.created_at, Date)
-                        <= f"{time[1]} 23:59:59",
+                        # Compare the timestamps directly so that the index is used
+                        AnalyzeCompleted.created_at >= f"{time[1]} 00:00:00",
+                        AnalyzeCompleted.created_at <= f"{time[1]} 23:59:59.999999",
                         AnalyzeCompleted.fetch_completed_id.in_(fetch_ids),
                     )
                     .filter(or_(*filters))
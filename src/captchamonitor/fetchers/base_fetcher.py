@@ -3,7 +3,8 @@ import json
 import time
 import shutil
 import logging
-from typing import Any, Tuple, Union, Optional
+from typing import Any, Set, Tuple, Union, Optional
+from urllib.parse import urlparse
 
 from selenium import webdriver
 from selenium.common.exceptions import WebDriverException
@@ -13,6 +14,7 @@ from selenium.webdriver.firefox.firefox_profile import FirefoxProfile
 
 from captchamonitor.utils.config import Config
 from captchamonitor.utils.exceptions import MissingProxy, HarExportExtensionError
+from captchamonitor.fetchers.session_pool import SessionPool, PooledSession
 
 
 class BaseFetcher:
@@ -31,11 +33,13 @@ class BaseFetcher:
         script_timeout: int = 30,
         url_change_timeout: int = 30,
         explicit_wait_duration: int = 5,
+        network_idle_duration: float = 2,
         export_har: bool = True,
         remove_gdpr: bool = True,
         disable_javascript: bool = False,
         disable_cookies: bool = False,
         options: Optional[dict] = None,
+        session_pool: Optional[SessionPool] = None,
     ) -> None:
         """
         Initializes the fetcher with given arguments and tries to fetch the given URL
@@ -54,8 +58,10 @@ class BaseFetcher:
         :type script_timeout: int
         :param url_change_timeout: Maximum time allowed in seconds while waiting for driver URL to change, defaults to 30
         :type url_change_timeout: int
-        :param explicit_wait_duration: Amount of time in seconds to wait after fetching a page, defaults to 5
+        :param explicit_wait_duration: Maximum amount of time in seconds to wait for the page to finish its network activity after fetching it, defaults to 5
         :type explicit_wait_duration: int
+        :param network_idle_duration: Amount of time in seconds without network activity after which the page is considered loaded, defaults to 2
+        :type network_idle_duration: float
         :param export_har: Should I record and export the HAR file?, defaults to True
         :type export_har: bool
         :param remove_gdpr: Should I click or remove GDPR cookie related popups?, defaults to True
@@ -66,8 +72,12 @@ class BaseFetcher:
         :type disable_cookies: bool
         :param options: Dictionary of additional options to pass to the fetcher, defaults to None
         :type options: Optional[dict], optional
+        :param session_pool: Pool to reuse Selenium sessions from, defaults to None
+        :type session_pool: Optional[SessionPool], optional
         :raises MissingProxy: If use_proxy_type is not None but no proxy provided
         """
+        # pylint: disable=R0914,R0915
+
         # Public class attributes
         self.url: str = url
         self.use_proxy_type: Optional[str] = use_proxy_type
@@ -75,6 +85,8 @@ class BaseFetcher:
         self.script_timeout: int = script_timeout
         self.url_change_timeout: int = url_change_timeout
         self.explicit_wait_duration: int = explicit_wait_duration
+        self.network_idle_duration: float = network_idle_duration
+        self.waited_duration: float = 0
         self.export_har: bool = export_har
         self.remove_gdpr: bool = remove_gdpr
         self.disable_javascript: bool = disable_javascript
@@ -97,6 +109,10 @@ class BaseFetcher:
         self._selenium_options: Any
         self._selenium_executor_url: str
         self._desired_capabilities: webdriver.DesiredCapabilities
+        self._session_pool: Optional[SessionPool] = session_pool
+        self._pooled_session: Optional[PooledSession] = None
+        self._is_session_reused: bool = False
+        self._is_session_reusable: bool = False
 
         # Check if use_proxy_type is set to True but proxy is not passed
         if (self.use_proxy_type is not None) and (self._proxy is None):
@@ -125,6 +141,9 @@ class BaseFetcher:
             self.explicit_wait_duration = self.options.get(
                 "explicit_wait_duration", explicit_wait_duration
             )
+            self.network_idle_duration = self.options.get(
+                "network_idle_duration", network_idle_duration
+            )
 
         # Add the extensions only if JavaScript is enabled
         if not self.disable_javascript:
@@ -210,9 +229,195 @@ class BaseFetcher:
         # Set timeout for HAR export trigger extension
         self.driver.set_script_timeout(self.script_timeout)
 
+        # Keep track of the new session if we can reuse it later
+        if self._session_pool is not None:
+            self._pooled_session = PooledSession(driver=self.driver)
+
         # Log the current status
         self._logger.debug("Connected to the %s container", container_name)
 
+    def _get_session_pool_key(self) -> Tuple[Any, ...]:
+        """
+        Returns the settings that a pooled session needs to match to be reused
+        by this fetcher. These are the settings that are applied while creating
+        the session and can't be changed afterwards.
+
+        :return: Session pool key
+        :rtype: Tuple[Any, ...]
+        """
+        tbb_security_level = None
+        if self.options is not None:
+            tbb_security_level = self.options.get("tbb_security_level", None)
+
+        return (
+            type(self).__name__,
+            self.container_host,
+            self.container_port,
+            self.use_proxy_type,
+            self._proxy,
+            self.export_har,
+            self.remove_gdpr,
+            self.disable_javascript,
+            self.disable_cookies,
+            tbb_security_level,
+        )
+
+    def _acquire_pooled_session(self) -> bool:
+        """
+        Tries to take an idle session with matching settings from the session
+        pool, so that setting up and connecting to a new session can be skipped
+
+        :return: True if a pooled session will be reused, False otherwise
+        :rtype: bool
+        """
+        if self._session_pool is None:
+            return False
+
+        key = self._get_session_pool_key()
+        while True:
+            session = self._session_pool.acquire(key)
+            if session is None:
+                return False
+
+            try:
+                # Apply the timeouts of this job, which also checks that the
+                # session is still alive
+                session.driver.set_page_load_timeout(self.page_timeout)
+                session.driver.set_script_timeout(self.script_timeout)
+
+            except WebDriverException:
+                # The session might have timed out or the container was restarted
+                self._session_pool.quit_session(session)
+                continue
+
+            self.driver = session.driver
+            self._pooled_session = session
+            self._is_session_reused = True
+            return True
+
+    def _reset_session(self) -> None:
+        """
+        Removes the traces of the previous job from the current session, so that
+        it can be reused for another job. The data of all websites is cleared,
+        not only the data of the last page, since the pages of the previous job
+        might have stored data for other domains, such as the CAPTCHA providers.
+        """
+        # Close the windows opened by the page
+        handles = self.driver.window_handles
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
+
+        # Clear the session storage of the tab while we are still on the same origin
+        origins = set()
+        if not self.disable_javascript:
+            origins.update(
+                self.driver.execute_script(
+                    """
+                    try {
+                        window.localStorage.clear();
+                        window.sessionStorage.clear();
+                    } catch (error) {
+                        // The storage isn't available if the cookies are disabled
+                    }
+                    return [location.origin].concat(
+                        performance.getEntriesByType("resource").map(
+                            (entry) => new URL(entry.name).origin
+                        )
+                    );
+                    """
+                )
+            )
+        for url in [self.url, self.driver.current_url]:
+            parsed_url = urlparse(url)
+            origins.add(f"{parsed_url.scheme}://{parsed_url.netloc}")
+
+        # Leave the page, the next job waits for the URL to change
+        self.driver.get("about:blank")
+
+        # Tor Browser is also reported as Firefox
+        if self.driver.name == "firefox":
+            self._clear_firefox_based_browser_data()
+        else:
+            self._clear_chromium_based_browser_data(
+                {origin for origin in origins if origin.startswith("http")}
+            )
+
+    def _clear_firefox_based_browser_data(self) -> None:
+        """
+        Clears the cookies, the storage, and the caches of all websites in
+        Firefox based browsers using privileged JavaScript
+        """
+        # pylint: disable=W0212
+        self.driver.command_executor._commands["SET_CONTEXT"] = (
+            "POST",
+            "/session/$sessionId/moz/context",
+        )
+
+        self.driver.execute("SET_CONTEXT", {"context": "chrome"})
+        try:
+            self.driver.execute_async_script(
+                """
+                var callback = arguments[arguments.length - 1];
+
+                // Some of the flags don't exist in the older versions
+                var flags = [
+                    "CLEAR_COOKIES",
+                    "CLEAR_ALL_CACHES",
+                    "CLEAR_DOM_STORAGES",
+                    "CLEAR_AUTH_TOKENS",
+                    "CLEAR_AUTH_CACHE",
+                    "CLEAR_HISTORY",
+                    "CLEAR_SESSION_HISTORY",
+                    "CLEAR_PREDICTOR_NETWORK_DATA",
+                    "CLEAR_MEDIA_DEVICES",
+                ].reduce(
+                    (flags, flag) => flags | (Ci.nsIClearDataService[flag] || 0),
+                    0
+                );
+
+                // Tor Browser keeps the data of its private windows separately
+                Services.obs.notifyObservers(null, "last-pb-context-exited");
+                Services.clearData.deleteData(flags, {
+                    onDataDeleted: () => callback(),
+                });
+                """
+            )
+        finally:
+            self.driver.execute("SET_CONTEXT", {"context": "content"})
+
+    def _clear_chromium_based_browser_data(self, origins: Set[str]) -> None:
+        """
+        Clears the cookies and the cache of all websites, and the storage of the
+        given origins in Chromium based browsers using the DevTools protocol
+
+        :param origins: Origins to clear the storage of
+        :type origins: Set[str]
+        """
+        # pylint: disable=W0212
+        self.driver.command_executor._commands["executeCdpCommand"] = (
+            "POST",
+            "/session/$sessionId/goog/cdp/execute",
+        )
+
+        self.driver.execute(
+            "executeCdpCommand", {"cmd": "Network.clearBrowserCookies", "params": {}}
+        )
+        self.driver.execute(
+            "executeCdpCommand", {"cmd": "Network.clearBrowserCache", "params": {}}
+        )
+
+        # The storage can only be cleared origin by origin
+        for origin in origins:
+            self.driver.execute(
+                "executeCdpCommand",
+                {
+                    "cmd": "Storage.clearDataForOrigin",
+                    "params": {"origin": origin, "storageTypes": "all"},
+                },
+            )
+
     def _check_extension_validity(self, extension: str, endswith: str) -> None:
         """
         Checks if given extension file exists and is valid
@@ -429,7 +634,7 @@ class BaseFetcher:
         )
 
         # Wait more to allow finalizing any ongoing background connections
-        time.sleep(self.explicit_wait_duration)
+        self._wait_for_network_idle()
 
         self.page_source = self.driver.page_source
         self.page_cookies = self.driver.get_cookies()
@@ -444,6 +649,84 @@ class BaseFetcher:
             )
             self.page_har = json.dumps({"log": har_dict})
 
+        # The session is in a known state and can be reset for reuse
+        self._is_session_reusable = True
+
+    def _wait_for_network_idle(self, poll_interval: float = 0.25) -> None:
+        """
+        Waits until the page stops loading new resources for network_idle_duration
+        seconds, but not longer than explicit_wait_duration seconds in total. The
+        network activity is tracked using the Resource Timing API of the page, so
+        it falls back to waiting for explicit_wait_duration seconds if JavaScript
+        is disabled or the page doesn't allow running scripts.
+
+        :param poll_interval: Time in seconds between checking the network activity, defaults to 0.25
+        :type poll_interval: float
+        """
+        start_time = time.monotonic()
+        deadline = start_time + self.explicit_wait_duration
+
+        # Returns the number of resources loaded by the page so far, or null
+        # if the page itself hasn't finished loading yet. The observer is not
+        # limited by the size of the resource timing buffer.
+        script = """
+            if (document.readyState !== "complete") {
+                return null;
+            }
+            var state = window.__captchaMonitorNetwork;
+            if (state === undefined) {
+                state = window.__captchaMonitorNetwork = {count: 0, observer: true};
+                try {
+                    new PerformanceObserver(function (list) {
+                        state.count += list.getEntries().length;
+                    }).observe({type: "resource", buffered: true});
+                } catch (error) {
+                    state.observer = false;
+                }
+            }
+            if (!state.observer) {
+                return performance.getEntriesByType("resource").length;
+            }
+            return state.count;
+            """
+
+        if self.disable_javascript:
+            time.sleep(self.explicit_wait_duration)
+
+        last_count = None
+        last_change = start_time
+
+        while not self.disable_javascript:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            try:
+                count = self.driver.execute_script(script)
+
+            except WebDriverException:
+                # Wait until the deadline if we can't track the network activity
+                self._logger.debug("Could not track the network activity of the page")
+                time.sleep(max(0, deadline - time.monotonic()))
+                break
+
+            if count is None or count != last_count:
+                last_count = count
+                last_change = now
+
+            elif now - last_change >= self.network_idle_duration:
+                break
+
+            time.sleep(min(poll_interval, max(0, deadline - time.monotonic())))
+
+        self.waited_duration = time.monotonic() - start_time
+        self._logger.debug(
+            "Waited %.2f out of %s seconds for %s to become idle",
+            self.waited_duration,
+            self.explicit_wait_duration,
+            self.url,
+        )
+
     def get_selenium_logs(self) -> dict:
         """
         Obtains and returns all kinds of available Selenium logs
@@ -474,8 +757,26 @@ class BaseFetcher:
 
     def close(self) -> None:
         """
-        Clean up before going out of scope
+        Clean up before going out of scope. Puts the session back into the
+        session pool if the fetch was successful, closes it otherwise.
         """
+        if (
+            self._session_pool is not None
+            and self._pooled_session is not None
+            and self._is_session_reusable
+        ):
+            try:
+                self._reset_session()
+
+            except WebDriverException:
+                self._logger.debug("Could not reset the session, closing it")
+
+            else:
+                self._session_pool.release(
+                    self._get_session_pool_key(), self._pooled_session
+                )
+                return
+
         if hasattr(self, "driver"):
             try:
                 self.driver.quit()
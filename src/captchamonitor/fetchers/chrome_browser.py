@@ -22,6 +22,10 @@ class ChromeBrowser(BaseFetcher):
         self.container_host = self._config["docker_chrome_browser_container_name"]
         self.container_port = self._config["docker_chrome_browser_container_port"]
 
+        # Skip the rest of the setup if we can reuse a pooled session
+        if self._acquire_pooled_session():
+            return
+
         self._desired_capabilities = webdriver.DesiredCapabilities.CHROME.copy()
 
         # Perform the rest of the common setup
@@ -31,6 +35,10 @@ class ChromeBrowser(BaseFetcher):
         """
         Connects Selenium driver to Chrome Browser Container
         """
+        # Pooled sessions are already connected
+        if self._is_session_reused:
+            return
+
         self._connect_to_selenium_remote_web_driver(
             container_name="Chrome Browser",
             desired_capabilities=self._desired_capabilities,
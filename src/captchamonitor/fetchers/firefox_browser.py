@@ -20,6 +20,10 @@ class FirefoxBrowser(BaseFetcher):
         self.container_host = self._config["docker_firefox_browser_container_name"]
         self.container_port = self._config["docker_firefox_browser_container_port"]
 
+        # Skip the rest of the setup if we can reuse a pooled session
+        if self._acquire_pooled_session():
+            return
+
         # Create new Firefox profile
         ff_profile = FirefoxProfile()
 
@@ -30,6 +34,10 @@ class FirefoxBrowser(BaseFetcher):
         """
         Connects Selenium driver to Firefox Browser Container
         """
+        # Pooled sessions are already connected
+        if self._is_session_reused:
+            return
+
         self._connect_to_selenium_remote_web_driver(
             container_name="Firefox Browser",
             desired_capabilities=self._desired_capabilities,
@@ -22,6 +22,10 @@ class OperaBrowser(BaseFetcher):
         self.container_host = self._config["docker_opera_browser_container_name"]
         self.container_port = self._config["docker_opera_browser_container_port"]
 
+        # Skip the rest of the setup if we can reuse a pooled session
+        if self._acquire_pooled_session():
+            return
+
         self._desired_capabilities = webdriver.DesiredCapabilities.OPERA.copy()
 
         # Perform the rest of the common setup
@@ -31,6 +35,10 @@ class OperaBrowser(BaseFetcher):
         """
         Connects Selenium driver to Opera Browser Container
         """
+        # Pooled sessions are already connected
+        if self._is_session_reused:
+            return
+
         self._connect_to_selenium_remote_web_driver(
             container_name="Opera Browser",
             desired_capabilities=self._desired_capabilities,
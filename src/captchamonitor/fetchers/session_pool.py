@@ -0,0 +1,137 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Tuple, Optional
+from dataclasses import field, dataclass
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+
+@dataclass
+class PooledSession:
+    """
+    Stores a Selenium remote webdriver session kept in the session pool
+
+    :param driver: The Selenium remote webdriver connected to the session
+    :type driver: webdriver.Remote
+    :param uses: Number of jobs this session was used for
+    :type uses: int
+    :param last_used: Unix timestamp of the last time this session was released
+    :type last_used: float
+
+    :returns: PooledSession object
+    """
+
+    driver: webdriver.Remote
+    uses: int = 0
+    last_used: float = field(default_factory=time.time)
+
+
+class SessionPool:
+    """
+    Keeps idle Selenium sessions around so that the following jobs with the same
+    fetcher settings can reuse them instead of creating new browser sessions.
+    Sessions are keyed by everything that can't be changed once a session is
+    created, such as the fetcher type, the proxy and the browser preferences.
+    """
+
+    def __init__(self, max_uses: int = 10, max_idle_time: float = 60) -> None:
+        """
+        Initializes the session pool
+
+        :param max_uses: Number of jobs a session can be used for before it is recycled, defaults to 10
+        :type max_uses: int
+        :param max_idle_time: Maximum time in seconds a session can wait in the pool, defaults to 60
+        :type max_idle_time: float
+        """
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
+        self.__max_uses: int = max_uses
+        self.__max_idle_time: float = max_idle_time
+        self.__idle_sessions: Dict[Tuple[Any, ...], List[PooledSession]] = {}
+        self.__lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def quit_session(session: PooledSession) -> None:
+        """
+        Closes the given session without raising any Selenium errors
+
+        :param session: The session to close
+        :type session: PooledSession
+        """
+        try:
+            session.driver.quit()
+        except WebDriverException:
+            # We can safely ignore "No active session with ID XXXXX" exceptions
+            pass
+
+    def acquire(self, key: Tuple[Any, ...]) -> Optional[PooledSession]:
+        """
+        Takes an idle session with the given key out of the pool
+
+        :param key: Settings of the fetcher that will use the session
+        :type key: Tuple[Any, ...]
+        :return: An idle session if there is one, None otherwise
+        :rtype: Optional[PooledSession]
+        """
+        expired = []
+        session = None
+
+        with self.__lock:
+            sessions = self.__idle_sessions.get(key, [])
+            while len(sessions) > 0:
+                candidate = sessions.pop()
+                if time.time() - candidate.last_used > self.__max_idle_time:
+                    expired.append(candidate)
+                else:
+                    session = candidate
+                    break
+
+        # Close the expired sessions outside of the lock, quitting might be slow
+        for candidate in expired:
+            self.quit_session(candidate)
+
+        return session
+
+    def release(self, key: Tuple[Any, ...], session: PooledSession) -> None:
+        """
+        Puts a session that was reset after use back into the pool, or closes
+        it if it reached the maximum number of uses
+
+        :param key: Settings of the fetcher that used the session
+        :type key: Tuple[Any, ...]
+        :param session: The session to put back
+        :type session: PooledSession
+        """
+        session.uses += 1
+        session.last_used = time.time()
+
+        if session.uses >= self.__max_uses:
+            self.__logger.debug("Recycling session after %s uses", session.uses)
+            self.quit_session(session)
+            return
+
+        with self.__lock:
+            self.__idle_sessions.setdefault(key, []).append(session)
+
+    def close(self) -> None:
+        """
+        Closes all idle sessions in the pool
+        """
+        with self.__lock:
+            sessions = [s for idle in self.__idle_sessions.values() for s in idle]
+            self.__idle_sessions = {}
+
+        for session in sessions:
+            self.quit_session(session)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of idle sessions in the pool
+
+        :return: Number of idle sessions
+        :rtype: int
+        """
+        with self.__lock:
+            return sum(len(idle) for idle in self.__idle_sessions.values())
@@ -25,6 +25,10 @@ class TorBrowser(BaseFetcher):
         self.container_host = self._config["docker_tor_browser_container_name"]
         self.container_port = self._config["docker_tor_browser_container_port"]
 
+        # Skip the rest of the setup if we can reuse a pooled session
+        if self._acquire_pooled_session():
+            return
+
         profile_location = self._config["docker_tor_browser_container_profile_location"]
 
         # Check if the profile location makes sense
@@ -72,6 +76,10 @@ class TorBrowser(BaseFetcher):
         """
         Connects Selenium driver to Tor Browser Container
         """
+        # Pooled sessions are already connected
+        if self._is_session_reused:
+            return
+
         self._connect_to_selenium_remote_web_driver(
             container_name="Tor Browser",
             desired_capabilities=self._desired_capabilities,
@@ -0,0 +1,86 @@
+import random
+from typing import Any, List, Optional, Sequence
+
+
+class AliasTable:
+    """
+    Samples items from a discrete probability distribution in constant time
+    using Vose's alias method. Building the table takes linear time, so it is
+    meant to be built once and sampled many times.
+
+    See https://www.keithschwarz.com/darts-dice-coins/ for the details
+    """
+
+    def __init__(
+        self,
+        items: Sequence[Any],
+        weights: Sequence[float],
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        """
+        Builds the alias table for the given items. Falls back to a uniform
+        distribution if none of the items has a positive weight.
+
+        :param items: Items to sample from
+        :type items: Sequence[Any]
+        :param weights: Weights of the items, not required to add up to one
+        :type weights: Sequence[float]
+        :param rng: Random number generator to use, defaults to a new one
+        :type rng: Optional[random.Random], optional
+        :raises ValueError: If there are no items or the number of items and weights don't match
+        """
+        if len(items) == 0 or len(items) != len(weights):
+            raise ValueError("Expected the same non-zero number of items and weights")
+
+        # Private class attributes
+        self.__items: List[Any] = list(items)
+        self.__rng: random.Random = rng if rng is not None else random.Random()
+        self.__probabilities: List[float] = [0.0] * len(items)
+        self.__aliases: List[int] = [0] * len(items)
+
+        weights = [max(0.0, float(weight or 0)) for weight in weights]
+        total_weight = sum(weights)
+        if total_weight == 0:
+            weights = [1.0] * len(items)
+            total_weight = float(len(items))
+
+        # Scale the weights so that the average weight is one
+        scaled = [weight * len(items) / total_weight for weight in weights]
+        small = [i for i, weight in enumerate(scaled) if weight < 1]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1]
+
+        # Fill each column with one small item and the rest from a large item
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.__probabilities[less] = scaled[less]
+            self.__aliases[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # The remaining columns are full, up to the floating point errors
+        for i in small + large:
+            self.__probabilities[i] = 1.0
+
+    def sample(self) -> Any:
+        """
+        Picks a random item according to the weights
+
+        :return: The picked item
+        :rtype: Any
+        """
+        column = self.__rng.randrange(len(self.__items))
+        if self.__rng.random() < self.__probabilities[column]:
+            return self.__items[column]
+        return self.__items[self.__aliases[column]]
+
+    def __len__(self) -> int:
+        """
+        Returns the number of items in the table
+
+        :return: Number of items
+        :rtype: int
+        """
+        return len(self.__items)
@@ -0,0 +1,250 @@
+import time
+import hashlib
+import logging
+from typing import Dict, List, Tuple, Optional
+
+import zstandard
+from sqlalchemy import or_, func
+from sqlalchemy.orm import undefer, sessionmaker
+from sqlalchemy.dialects.postgresql import insert
+
+from captchamonitor.utils.models import Blob, BlobDictionary, FetchCompleted
+from captchamonitor.utils.compression import compress
+
+
+class BlobStore:
+    """
+    Stores the bodies of the fetches in the blob table, compressed with zstd and
+    deduplicated by their SHA256 hash, so that identical pages and HARs are only
+    stored once. Optionally trains a zstd dictionary for each domain once it has
+    enough stored bodies and compresses its following bodies with it.
+    """
+
+    def __init__(
+        self,
+        db_session: sessionmaker,
+        compression_level: int = 3,
+        dictionary_samples: int = 0,
+        dictionary_size: int = 65536,
+        dictionary_check_interval: float = 3600,
+    ) -> None:
+        """
+        Initializes the blob store
+
+        :param db_session: Database session used to connect to the database
+        :type db_session: sessionmaker
+        :param compression_level: The zstd compression level, defaults to 3
+        :type compression_level: int
+        :param dictionary_samples: Number of bodies of a domain to train its dictionary with, 0 disables the dictionaries, defaults to 0
+        :type dictionary_samples: int
+        :param dictionary_size: Maximum size of a dictionary in bytes, defaults to 65536
+        :type dictionary_size: int
+        :param dictionary_check_interval: Time in seconds to wait before checking again if a domain has enough bodies for training, defaults to 3600
+        :type dictionary_check_interval: float
+        """
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
+        self.__db_session: sessionmaker = db_session
+        self.__compression_level: int = compression_level
+        self.__dictionary_samples: int = dictionary_samples
+        self.__dictionary_size: int = dictionary_size
+        self.__dictionary_check_interval: float = dictionary_check_interval
+
+        # ID and data of the dictionary of each domain, and the time to check again
+        # if a domain without a dictionary has enough bodies for training
+        self.__dictionaries: Dict[int, Tuple[Optional[Tuple[int, bytes]], float]] = {}
+
+    def put(
+        self, content: Optional[str], domain_id: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Stores the given body unless an identical one was already stored
+
+        :param content: The body to store
+        :type content: Optional[str]
+        :param domain_id: ID of the domain the body was fetched from, defaults to None
+        :type domain_id: Optional[int]
+        :return: ID of the blob that stores the body, None if there is no body
+        :rtype: Optional[int]
+        """
+        if content is None:
+            return None
+
+        data = content.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+
+        blob_id = self.__get_blob_id(sha256)
+        if blob_id is not None:
+            return blob_id
+
+        dictionary_id = None
+        dictionary_data = None
+        dictionary = self.__get_dictionary(domain_id)
+        if dictionary is not None:
+            dictionary_id, dictionary_data = dictionary
+
+        # Another worker might insert the same body at the same time
+        blob = Blob.__table__  # pylint: disable=E1101
+        blob_id = self.__db_session.execute(
+            insert(blob)
+            .values(
+                sha256=sha256,
+                size=len(data),
+                data=compress(data, dictionary_data, self.__compression_level),
+                dictionary_id=dictionary_id,
+            )
+            .on_conflict_do_nothing(index_elements=["sha256"])
+            .returning(blob.c.id)
+        ).scalar()
+
+        if blob_id is None:
+            blob_id = self.__get_blob_id(sha256)
+
+        return blob_id
+
+    def __get_blob_id(self, sha256: str) -> Optional[int]:
+        """
+        Gets the ID of the blob with the given hash
+
+        :param sha256: SHA256 hash of the uncompressed body
+        :type sha256: str
+        :return: ID of the blob if it exists, None otherwise
+        :rtype: Optional[int]
+        """
+        # Keep the blob from being deleted by the retention period until the
+        # fetch that uses it is committed
+        return (
+            self.__db_session.query(Blob.id)
+            .filter(Blob.sha256 == sha256)
+            .with_for_update(read=True, key_share=True)
+            .scalar()
+        )
+
+    def __get_dictionary(self, domain_id: Optional[int]) -> Optional[Tuple[int, bytes]]:
+        """
+        Gets the latest dictionary of the given domain, trains one if the domain
+        has enough bodies but no dictionary yet
+
+        :param domain_id: ID of the domain
+        :type domain_id: Optional[int]
+        :return: ID and data of the dictionary if there is one, None otherwise
+        :rtype: Optional[Tuple[int, bytes]]
+        """
+        # pylint: disable=W0143
+        if domain_id is None or self.__dictionary_samples <= 0:
+            return None
+
+        dictionary, next_check = self.__dictionaries.get(domain_id, (None, 0))
+        if dictionary is not None or time.time() < next_check:
+            return dictionary
+
+        dictionary = (
+            self.__db_session.query(BlobDictionary)
+            .filter(BlobDictionary.domain_id == domain_id)
+            .order_by(BlobDictionary.id.desc())
+            .first()
+        )
+
+        if dictionary is None:
+            dictionary = self.train_dictionary(domain_id)
+
+        dictionary_tuple = None
+        if dictionary is not None:
+            dictionary_tuple = (dictionary.id, dictionary.data)
+
+        self.__dictionaries[domain_id] = (
+            dictionary_tuple,
+            time.time() + self.__dictionary_check_interval,
+        )
+
+        return dictionary_tuple
+
+    def __get_samples(self, domain_id: int) -> List[Blob]:
+        """
+        Gets the latest blobs stored for the given domain
+
+        :param domain_id: ID of the domain
+        :type domain_id: int
+        :return: The latest blobs of the domain
+        :rtype: List[Blob]
+        """
+        # pylint: disable=W0143
+        blob_ids = (
+            self.__db_session.query(
+                FetchCompleted.html_data_blob_id, FetchCompleted.http_requests_blob_id
+            )
+            .filter(FetchCompleted.domain_id == domain_id)
+            .filter(
+                or_(
+                    FetchCompleted.html_data_blob_id.isnot(None),
+                    FetchCompleted.http_requests_blob_id.isnot(None),
+                )
+            )
+            .order_by(FetchCompleted.id.desc())
+            .limit(self.__dictionary_samples)
+            .all()
+        )
+
+        return (
+            self.__db_session.query(Blob)
+            .options(undefer(Blob.data))
+            .filter(Blob.id.in_([i for ids in blob_ids for i in ids if i is not None]))
+            .order_by(Blob.id.desc())
+            .limit(self.__dictionary_samples)
+            .all()
+        )
+
+    def train_dictionary(self, domain_id: int) -> Optional[BlobDictionary]:
+        """
+        Trains a new dictionary on the latest bodies of the given domain. The
+        dictionary is stored within a savepoint, so that the transaction of the
+        caller isn't committed halfway, and the other workers can use it once the
+        caller commits
+
+        :param domain_id: ID of the domain
+        :type domain_id: int
+        :return: The new dictionary, None if the domain doesn't have enough bodies
+        :rtype: Optional[BlobDictionary]
+        """
+        samples = self.__get_samples(domain_id)
+
+        if len(samples) < self.__dictionary_samples:
+            return None
+
+        try:
+            trained = zstandard.train_dictionary(
+                self.__dictionary_size,
+                [sample.content.encode("utf-8") for sample in samples],
+            )
+        except zstandard.ZstdError as e:
+            self.__logger.debug(
+                "Couldn't train a dictionary for domain %s: %s", domain_id, e
+            )
+            return None
+
+        dictionary = BlobDictionary(domain_id=domain_id, data=trained.as_bytes())
+        with self.__db_session.begin_nested():
+            self.__db_session.add(dictionary)
+
+        self.__logger.debug(
+            "Trained a %s byte dictionary for domain %s on %s bodies",
+            len(dictionary.data),
+            domain_id,
+            len(samples),
+        )
+
+        return dictionary
+
+    def size(self) -> Tuple[int, int]:
+        """
+        Gets the total size of the stored bodies
+
+        :return: Total uncompressed and compressed sizes of the stored bodies in bytes
+        :rtype: Tuple[int, int]
+        """
+        uncompressed, compressed = self.__db_session.query(
+            func.coalesce(func.sum(Blob.size), 0),
+            func.coalesce(func.sum(func.length(Blob.data)), 0),
+        ).one()
+
+        return int(uncompressed), int(compressed)
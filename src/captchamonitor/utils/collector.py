@@ -1,11 +1,15 @@
 import os
+import re
+import json
 import time
+import fcntl
 import shutil
-import fnmatch
 import logging
 import tarfile
 import tempfile
-from datetime import datetime
+from typing import Any, Set, Dict, Tuple, Iterator, Optional
+from datetime import datetime, timedelta
+from contextlib import contextmanager
 
 import requests
 
@@ -14,16 +18,30 @@ from captchamonitor.utils.exceptions import (
     CollectorConnectionError,
 )
 
+# Names of the consensus files, starting with their valid-after hours
+_CONSENSUS_FILE_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})-consensus$")
+
 
 class Collector:
     """
     Gets the absolute path to the consensus file from cache or downloads it from
-    Collector if it doesn't exist
+    Collector if it doesn't exist. The cached consensuses are indexed by their
+    valid-after hours in a manifest, and the least recently used ones are
+    evicted when the cache grows larger than its maximum size.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        consensus_dir: str = "/tmp/cm-consensus",
+        max_cache_size: int = 4 * 1024**3,
+    ) -> None:
         """
         Initialize Collector
+
+        :param consensus_dir: Directory to cache the consensuses in, defaults to "/tmp/cm-consensus"
+        :type consensus_dir: str
+        :param max_cache_size: Maximum total size of the cached consensuses in bytes, defaults to 4 GiB
+        :type max_cache_size: int
         """
         # Private class attributes
         self.__logger = logging.getLogger(__name__)
@@ -33,7 +51,13 @@ class Collector:
         self.__url_consensuses_archive: str = (
             "https://collector.torproject.org/archive/relay-descriptors/consensuses/"
         )
-        self.__consensus_dir: str = "/tmp/cm-consensus"
+        self.__consensus_dir: str = consensus_dir
+        self.__manifest_path: str = os.path.join(consensus_dir, "manifest.json")
+        self.__lock_path: str = os.path.join(consensus_dir, ".manifest.lock")
+        self.__manifest: Dict[str, Dict[str, Any]] = {}
+        self.__manifest_version: Optional[Tuple[int, int, int]] = None
+        self.__max_cache_size: int = max_cache_size
+        self.__manifest_update_interval: int = 24
         self.__num_retries_on_fail: int = 3
         self.__delay_in_seconds_between_retries: int = 3
 
@@ -57,6 +81,252 @@ class Collector:
         """
         return consensus_date.strftime("%Y-%m-%d-%H-00-00")
 
+    @contextmanager
+    def __lock_manifest(self) -> Iterator[None]:
+        """
+        Holds an exclusive lock on the manifest, so the processes sharing the
+        cache don't overwrite each other's changes
+
+        :yield: Nothing, the lock is held until the context exits
+        :rtype: Iterator[None]
+        """
+        with open(self.__lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __scan_consensus_dir(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Builds the manifest from the files in the consensus directory, used when
+        the manifest doesn't exist yet or is corrupted
+
+        :return: Manifest entries by valid-after hour
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        manifest = {}
+        for entry in os.scandir(self.__consensus_dir):
+            match = _CONSENSUS_FILE_NAME.match(entry.name)
+            if match is not None and entry.is_file():
+                manifest[match.group(1)] = {
+                    "file_name": entry.name,
+                    "size": entry.stat().st_size,
+                }
+
+        self.__logger.debug("Indexed %s cached consensus files", len(manifest))
+        return manifest
+
+    def __get_manifest_version(self) -> Tuple[int, int, int]:
+        """
+        Gets the inode, modification time, and size of the manifest, which change
+        every time the manifest is replaced
+
+        :return: The inode, modification time, and size of the manifest
+        :rtype: Tuple[int, int, int]
+        """
+        stat = os.stat(self.__manifest_path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def __load_manifest(self, force: bool = False) -> bool:
+        """
+        Loads the manifest if it was changed since it was last loaded. The
+        manifest is replaced atomically, so it can be loaded without the lock.
+
+        :param force: Load the manifest even if it wasn't changed, defaults to False
+        :type force: bool
+        :return: False if the manifest doesn't exist or is corrupted, True otherwise
+        :rtype: bool
+        """
+        try:
+            version = self.__get_manifest_version()
+            if force or version != self.__manifest_version:
+                with open(self.__manifest_path, "r") as file:
+                    self.__manifest = json.load(file)
+                self.__manifest_version = version
+
+        except (FileNotFoundError, ValueError):
+            return False
+
+        return True
+
+    def __read_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Gets the manifest, builds it if it doesn't exist or is corrupted
+
+        :return: Manifest entries by valid-after hour
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        if not self.__load_manifest():
+            with self.__lock_manifest():
+                if not self.__load_manifest():
+                    self.__write_manifest(self.__scan_consensus_dir())
+
+        return self.__manifest
+
+    def __read_manifest_for_update(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Gets a copy of the latest manifest to change, should be called while
+        holding the lock
+
+        :return: Manifest entries by valid-after hour
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        if not self.__load_manifest(force=True):
+            return self.__scan_consensus_dir()
+
+        return dict(self.__manifest)
+
+    def __write_manifest(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Writes the manifest to a temporary file and renames it over the old one,
+        should be called while holding the lock
+
+        :param manifest: Manifest entries by valid-after hour
+        :type manifest: Dict[str, Dict[str, Any]]
+        """
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.__consensus_dir, prefix=".manifest-", delete=False
+        ) as file:
+            json.dump(manifest, file)
+
+        os.replace(file.name, self.__manifest_path)
+        self.__manifest = manifest
+        self.__manifest_version = self.__get_manifest_version()
+
+    def __store_consensus_file(self, file_name: str, source: Any) -> int:
+        """
+        Copies a consensus file into the cache. The file is written to a
+        temporary file first and renamed, so it's never read half-written.
+
+        :param file_name: Name of the consensus file
+        :type file_name: str
+        :param source: File-like object to read the consensus file from
+        :type source: Any
+        :return: Size of the consensus file in bytes
+        :rtype: int
+        """
+        file_path = os.path.join(self.__consensus_dir, file_name)
+        file = tempfile.NamedTemporaryFile(
+            "wb", dir=self.__consensus_dir, prefix=".download-", delete=False
+        )
+        try:
+            with file:
+                shutil.copyfileobj(source, file)
+            os.replace(file.name, file_path)
+
+        finally:
+            # The temporary file is only left behind if copying it failed
+            if os.path.exists(file.name):
+                os.remove(file.name)
+
+        return os.path.getsize(file_path)
+
+    def __add_to_manifest(
+        self, entries: Dict[str, Dict[str, Any]], keep: Optional[str] = None
+    ) -> None:
+        """
+        Adds the stored consensus files to the manifest and evicts the least
+        recently used ones if the cache grew larger than its maximum size
+
+        :param entries: Manifest entries of the stored files by valid-after hour
+        :type entries: Dict[str, Dict[str, Any]]
+        :param keep: Valid-after hour of the consensus that shouldn't be evicted, defaults to None
+        :type keep: Optional[str]
+        """
+        with self.__lock_manifest():
+            manifest = self.__read_manifest_for_update()
+            manifest.update(entries)
+            self.__evict(manifest, keep)
+            self.__write_manifest(manifest)
+
+    def __evict(self, manifest: Dict[str, Dict[str, Any]], keep: Optional[str]) -> None:
+        """
+        Removes the least recently used consensus files until the cache fits in
+        its maximum size. The files are touched when they are looked up, so their
+        modification times are their last use times.
+
+        :param manifest: Manifest entries by valid-after hour, updated in place
+        :type manifest: Dict[str, Dict[str, Any]]
+        :param keep: Valid-after hour of the consensus that shouldn't be evicted
+        :type keep: Optional[str]
+        """
+        total_size = sum(entry["size"] for entry in manifest.values())
+        if total_size <= self.__max_cache_size:
+            return
+
+        last_used = {}
+        for date_str, entry in list(manifest.items()):
+            try:
+                last_used[date_str] = os.stat(
+                    os.path.join(self.__consensus_dir, entry["file_name"])
+                ).st_mtime_ns
+            except FileNotFoundError:
+                total_size -= manifest.pop(date_str)["size"]
+
+        for date_str in sorted(last_used, key=last_used.__getitem__):
+            if total_size <= self.__max_cache_size:
+                break
+            if date_str == keep:
+                continue
+
+            entry = manifest.pop(date_str)
+            total_size -= entry["size"]
+            try:
+                os.remove(os.path.join(self.__consensus_dir, entry["file_name"]))
+            except FileNotFoundError:
+                pass
+
+            self.__logger.debug("Evicted the consensus file %s", entry["file_name"])
+
+    def __remove_stale_entry(self, date_str: str, file_name: str) -> None:
+        """
+        Removes the manifest entry of a consensus file that was deleted outside
+        of the cache, so the consensus can be cached again
+
+        :param date_str: Valid-after hour of the consensus
+        :type date_str: str
+        :param file_name: Name of the deleted consensus file
+        :type file_name: str
+        """
+        with self.__lock_manifest():
+            manifest = self.__read_manifest_for_update()
+            entry = manifest.get(date_str)
+
+            # Another process might have cached the consensus again meanwhile
+            if entry is None or entry["file_name"] != file_name:
+                return
+            if os.path.exists(os.path.join(self.__consensus_dir, file_name)):
+                return
+
+            del manifest[date_str]
+            self.__write_manifest(manifest)
+
+        self.__logger.debug("Removed the stale manifest entry of %s", file_name)
+
+    def __find_consensus(self, date_str: str) -> Optional[str]:
+        """
+        Looks up a consensus in the manifest and marks it as recently used. The
+        entry is removed if its file was deleted outside of the cache.
+
+        :param date_str: Valid-after hour of the consensus
+        :type date_str: str
+        :return: Absolute path to the consensus file, or None if it isn't cached
+        :rtype: Optional[str]
+        """
+        entry = self.__read_manifest().get(date_str)
+        if entry is None:
+            return None
+
+        file_path = os.path.join(self.__consensus_dir, entry["file_name"])
+        try:
+            os.utime(file_path)
+        except FileNotFoundError:
+            self.__remove_stale_entry(date_str, entry["file_name"])
+            return None
+
+        return file_path
+
     def __download_consensus_from_recent(self, consensus_date: datetime) -> None:
         """
         Downloads from the Collector's recent page
@@ -71,12 +341,13 @@ class Collector:
 
         file_name = f"{date_str}-consensus"
         url = f"{self.__url_consensuses_recent}{file_name}"
-        file_path = os.path.join(self.__consensus_dir, file_name)
 
         try:
             # Download the consensus file directly to the consensus directory
-            with open(file_path, "wb") as file:
-                file.write(requests.get(url).content)
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                size = self.__store_consensus_file(file_name, response.raw)
 
         except Exception as exception:
             self.__logger.debug(
@@ -85,67 +356,133 @@ class Collector:
             )
             raise CollectorDownloadError from exception
 
-    def __download_consensus_from_archive(self, consensus_date: datetime) -> None:
+        self.__add_to_manifest(
+            {date_str: {"file_name": file_name, "size": size}}, keep=date_str
+        )
+
+    def __extract_consensuses_from_archive(
+        self,
+        archive_file: Any,
+        consensus_date: datetime,
+        end_date: Optional[datetime] = None,
+    ) -> None:
+        """
+        Extracts the consensuses that aren't cached yet from a monthly archive,
+        while the archive is read as a stream. Each consensus is written
+        directly into the cache, nothing else is written to disk. The extracted
+        consensuses are added to the manifest every few files, so they are
+        visible to the other processes and the cache stays within its maximum
+        size while the archive is read.
+
+        :param archive_file: File-like object to read the .tar.xz archive from
+        :type archive_file: Any
+        :param consensus_date: The date for valid-after timestamp of the requested consensus document
+        :type consensus_date: datetime
+        :param end_date: Extract the consensuses from consensus_date to end_date only, defaults to None to extract the whole month
+        :type end_date: Optional[datetime]
+        """
+        manifest = self.__read_manifest()
+
+        # Hours of the archive's month to extract, all of them if it's None
+        wanted: Optional[Set[str]] = None
+        if end_date is not None:
+            wanted = set()
+            hour = consensus_date.replace(minute=0, second=0, microsecond=0)
+            while hour <= end_date and hour.month == consensus_date.month:
+                if self.__get_date_str(hour) not in manifest:
+                    wanted.add(self.__get_date_str(hour))
+                hour += timedelta(hours=1)
+
+            if not wanted:
+                return
+
+        keep = self.__get_date_str(consensus_date)
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with tarfile.open(fileobj=archive_file, mode="r|xz") as archive:
+                for member in archive:
+                    # Only the file names are used, so the paths in the archive
+                    # can't point outside of the cache
+                    match = _CONSENSUS_FILE_NAME.match(os.path.basename(member.name))
+                    if not member.isfile() or match is None:
+                        continue
+
+                    date_str = match.group(1)
+                    if date_str in manifest or (
+                        wanted is not None and date_str not in wanted
+                    ):
+                        continue
+
+                    entries[date_str] = {
+                        "file_name": match.group(0),
+                        "size": self.__store_consensus_file(
+                            match.group(0), archive.extractfile(member)
+                        ),
+                    }
+
+                    if len(entries) >= self.__manifest_update_interval:
+                        self.__add_to_manifest(entries, keep=keep)
+                        entries = {}
+
+                    if wanted is not None:
+                        wanted.discard(date_str)
+
+                        # Stop reading the archive once the requested hours are
+                        # extracted
+                        if not wanted:
+                            break
+
+        finally:
+            # The extracted consensuses are complete even if the download fails
+            if entries:
+                self.__add_to_manifest(entries, keep=keep)
+
+    def __download_consensus_from_archive(
+        self, consensus_date: datetime, end_date: Optional[datetime] = None
+    ) -> None:
         """
         Downloads from the Collector's archive page
 
         :param consensus_date: The date for valid-after timestamp of the consensus document
         :type consensus_date: datetime
+        :param end_date: Download the consensuses from consensus_date to end_date only, defaults to None to download the whole month
+        :type end_date: Optional[datetime]
         :raises CollectorDownloadError: If cannot connect to Collector
         """
         self.__logger.debug("Using the list from consensuses archive")
 
-        # Create a temporary directory and download the consensus archive
-        with tempfile.TemporaryDirectory() as download_dir:
-            folder_name = "consensuses-%s-%s" % (
-                consensus_date.strftime("%Y"),
-                consensus_date.strftime("%m"),
-            )
-            archive_name = folder_name + ".tar.xz"
-            archive_path = os.path.join(download_dir, archive_name)
-            extracted_path = os.path.join(download_dir, folder_name)
-            url = f"{self.__url_consensuses_archive}{archive_name}"
+        archive_name = "consensuses-%s-%s.tar.xz" % (
+            consensus_date.strftime("%Y"),
+            consensus_date.strftime("%m"),
+        )
+        url = f"{self.__url_consensuses_archive}{archive_name}"
 
-            try:
-                # Download the consensus archive to a temporary location
-                with open(archive_path, "wb") as file:
-                    file.write(requests.get(url).content)
-
-            except Exception as exception:
-                self.__logger.debug(
-                    "Cannot download requested consensus file: %s",
-                    exception,
+        try:
+            # Extract the consensus archive while it's being downloaded
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                self.__extract_consensuses_from_archive(
+                    response.raw, consensus_date, end_date
                 )
-                raise CollectorDownloadError from exception
-
-            # Extract the archive
-            with tarfile.open(archive_path) as archive:
-                archive.extractall(download_dir)
-
-            # Recursively move files
-            for day_folder in os.listdir(extracted_path):
-                for consensus_file in os.listdir(
-                    os.path.join(extracted_path, day_folder)
-                ):
-                    try:
-                        shutil.move(
-                            os.path.join(extracted_path, day_folder, consensus_file),
-                            self.__consensus_dir,
-                        )
-
-                    except shutil.Error as exception:
-                        # We can simply skip already existing files
-                        self.__logger.debug(
-                            "This consensus file already exists: %s",
-                            exception,
-                        )
-
-    def get_consensus(self, consensus_date: datetime) -> str:
+
+        except Exception as exception:
+            self.__logger.debug(
+                "Cannot download requested consensus file: %s",
+                exception,
+            )
+            raise CollectorDownloadError from exception
+
+    def get_consensus(
+        self, consensus_date: datetime, end_date: Optional[datetime] = None
+    ) -> str:
         """
         Gets the absolute path to the consensus file from cache or downloads it if it doesn't exist
 
         :param consensus_date: The date for valid-after timestamp of the consensus document
         :type consensus_date: datetime
+        :param end_date: Download the archived consensuses from consensus_date to end_date only, defaults to None
+        :type end_date: Optional[datetime]
         :raises CollectorDownloadError: If requested configuration wasn't found locally and downloaded from Collector
         :return: Absolute path to the consensus file
         :rtype: str
@@ -155,15 +492,15 @@ class Collector:
         # Try multiple times
         for _ in range(self.__num_retries_on_fail):
             # Find the requested consensus from the cache
-            for file in os.listdir(self.__consensus_dir):
-                if fnmatch.fnmatch(file, "*" + date_str + "*"):
-                    return os.path.join(self.__consensus_dir, file)
+            file_path = self.__find_consensus(date_str)
+            if file_path is not None:
+                return file_path
 
             # If we are here, it means that the requested consensus is not cached yet
             self.__logger.debug(
                 "Requested consensus file is not cached yet, downloading from Collector"
             )
-            self.download_consensus(consensus_date)
+            self.download_consensus(consensus_date, end_date)
             time.sleep(self.__delay_in_seconds_between_retries)
 
         self.__logger.warning(
@@ -171,12 +508,32 @@ class Collector:
         )
         raise CollectorDownloadError
 
-    def download_consensus(self, consensus_date: datetime) -> None:
+    def find_consensus(self, consensus_date: datetime) -> Optional[str]:
         """
-        Downloads the consensus document for the specified date from CollecTor
+        Gets the absolute path to the consensus file from cache, without
+        downloading it
 
         :param consensus_date: The date for valid-after timestamp of the consensus document
         :type consensus_date: datetime
+        :return: Absolute path to the consensus file, or None if it isn't cached
+        :rtype: Optional[str]
+        """
+        return self.__find_consensus(self.__get_date_str(consensus_date))
+
+    def download_consensus(
+        self, consensus_date: datetime, end_date: Optional[datetime] = None
+    ) -> None:
+        """
+        Downloads the consensus document for the specified date from CollecTor.
+        The consensuses that are only in the monthly archives are downloaded
+        together with the rest of their month, unless end_date is given. If
+        end_date is given, the recent consensuses until end_date that aren't
+        cached yet are downloaded too.
+
+        :param consensus_date: The date for valid-after timestamp of the consensus document
+        :type consensus_date: datetime
+        :param end_date: Download the consensuses from consensus_date to end_date, defaults to None to download the whole archived month
+        :type end_date: Optional[datetime]
         :raises CollectorConnectionError: If cannot connect to Collector
         """
         date_str = self.__get_date_str(consensus_date)
@@ -192,10 +549,30 @@ class Collector:
             )
             raise CollectorConnectionError from exception
 
-        if date_str in recent_consensuses:
-            self.__download_consensus_from_recent(consensus_date)
-        else:
-            self.__download_consensus_from_archive(consensus_date)
+        if date_str not in recent_consensuses:
+            self.__download_consensus_from_archive(consensus_date, end_date)
+            return
+
+        self.__download_consensus_from_recent(consensus_date)
+
+        if end_date is None:
+            return
+
+        # Download the rest of the range from the same list, the consensuses
+        # that can't be downloaded are left out
+        hour = consensus_date.replace(minute=0, second=0, microsecond=0)
+        hour += timedelta(hours=1)
+        while hour <= end_date:
+            date_str = self.__get_date_str(hour)
+            if (
+                date_str in recent_consensuses
+                and self.__find_consensus(date_str) is None
+            ):
+                try:
+                    self.__download_consensus_from_recent(hour)
+                except CollectorDownloadError:
+                    pass
+            hour += timedelta(hours=1)
 
     def remove_consensus_file(self, consensus_date: datetime) -> None:
         """
@@ -208,10 +585,16 @@ class Collector:
 
         if os.path.exists(self.__consensus_dir):
             file = os.path.join(self.__consensus_dir, f"{date_str}-consensus")
-            try:
-                os.remove(file)
 
-            except FileNotFoundError:
-                pass
+            with self.__lock_manifest():
+                manifest = self.__read_manifest_for_update()
+                manifest.pop(date_str, None)
+                self.__write_manifest(manifest)
+
+                try:
+                    os.remove(file)
+
+                except FileNotFoundError:
+                    pass
 
             self.__logger.debug("Removed the consensus file %s", file)
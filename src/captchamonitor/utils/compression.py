@@ -0,0 +1,62 @@
+from typing import Optional
+from functools import lru_cache
+
+import zstandard
+
+
+@lru_cache(maxsize=64)
+def get_compression_dictionary(dictionary: bytes) -> zstandard.ZstdCompressionDict:
+    """
+    Loads the given zstd dictionary, caching it since loading a dictionary is
+    more expensive than compressing a small body with it
+
+    :param dictionary: The zstd dictionary
+    :type dictionary: bytes
+    :return: The loaded dictionary
+    :rtype: zstandard.ZstdCompressionDict
+    """
+    return zstandard.ZstdCompressionDict(dictionary)
+
+
+def compress(data: bytes, dictionary: Optional[bytes] = None, level: int = 3) -> bytes:
+    """
+    Compresses the given data with zstd
+
+    :param data: Data to compress
+    :type data: bytes
+    :param dictionary: The zstd dictionary to compress with, defaults to None
+    :type dictionary: Optional[bytes]
+    :param level: The zstd compression level, defaults to 3
+    :type level: int
+    :return: The compressed data
+    :rtype: bytes
+    """
+    if dictionary is None:
+        compressor = zstandard.ZstdCompressor(level=level)
+    else:
+        compressor = zstandard.ZstdCompressor(
+            level=level, dict_data=get_compression_dictionary(dictionary)
+        )
+
+    return compressor.compress(data)
+
+
+def decompress(data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    """
+    Decompresses the given zstd compressed data
+
+    :param data: Data to decompress
+    :type data: bytes
+    :param dictionary: The zstd dictionary the data was compressed with, defaults to None
+    :type dictionary: Optional[bytes]
+    :return: The decompressed data
+    :rtype: bytes
+    """
+    if dictionary is None:
+        decompressor = zstandard.ZstdDecompressor()
+    else:
+        decompressor = zstandard.ZstdDecompressor(
+            dict_data=get_compression_dictionary(dictionary)
+        )
+
+    return decompressor.decompress(data)
@@ -33,6 +33,19 @@ ENV_VARS = {
     "asset_gdpr_extension_xpi_id": "CM_ASSET_GDPR_EXTENSION_XPI_ID",
     "asset_gdpr_extension_crx": "CM_ASSET_GDPR_EXTENSION_CRX",
     "job_queue_delay": "CM_JOB_QUEUE_DELAY",
+    "job_queue_max_depth": "CM_JOB_QUEUE_MAX_DEPTH",
+    "relay_rotation_period": "CM_RELAY_ROTATION_PERIOD",
+    "worker_concurrency": "CM_WORKER_CONCURRENCY",
+    "worker_session_max_uses": "CM_WORKER_SESSION_MAX_USES",
+    "tor_pool_url": "CM_TOR_POOL_URL",
+    "tor_pool_size": "CM_TOR_POOL_SIZE",
+    "tor_pool_lease_timeout": "CM_TOR_POOL_LEASE_TIMEOUT",
+    "analyzer_processes": "CM_ANALYZER_PROCESSES",
+    "backfill_processes": "CM_BACKFILL_PROCESSES",
+    "blob_compression_level": "CM_BLOB_COMPRESSION_LEVEL",
+    "blob_dictionary_samples": "CM_BLOB_DICTIONARY_SAMPLES",
+    "db_retention_months": "CM_DB_RETENTION_MONTHS",
+    "db_retention_archive_schema": "CM_DB_RETENTION_ARCHIVE_SCHEMA",
     "fixture_location": "CM_FIXTURE_LOCATION",
     "dashboard_location": "CM_DASHBOARD_LOCATION",
     "dashboard_www_location": "CM_DASHBOARD_WWW_LOCATION",
@@ -1,8 +1,11 @@
+import sys
+import mmap
 import logging
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Iterator, Optional
 from datetime import datetime
-from dataclasses import dataclass
+from functools import lru_cache
 
+import numpy as np
 import stem.descriptor
 
 from captchamonitor.utils.exceptions import (
@@ -10,19 +13,194 @@ from captchamonitor.utils.exceptions import (
     ConsensusParserFileNotFoundError,
 )
 
+# Relay flags in the order of their bits, the path selection probabilities
+# depend on the first four. See the "known-flags" line in dir-spec.txt. The
+# bitmasks are stored in the database, so new flags have to be appended. The
+# flags that were removed from Tor are kept for parsing the old consensuses.
+FLAG_NAMES = [
+    "Running",
+    "Guard",
+    "Exit",
+    "BadExit",
+    "Authority",
+    "Fast",
+    "HSDir",
+    "MiddleOnly",
+    "NoEdConsensus",
+    "Stable",
+    "StaleDesc",
+    "Sybil",
+    "V2Dir",
+    "Valid",
+    "BadDirectory",
+    "Named",
+    "Unnamed",
+]
+
+FLAG_BITS: Dict[str, int] = {name: 1 << i for i, name in enumerate(FLAG_NAMES)}
+
+FLAG_RUNNING = FLAG_BITS["Running"]
+FLAG_GUARD = FLAG_BITS["Guard"]
+FLAG_EXIT = FLAG_BITS["Exit"]
+FLAG_BAD_EXIT = FLAG_BITS["BadExit"]
+
+# Prefixes of the lines that the parser uses, the rest of the lines are skipped
+_PARSED_PREFIXES = frozenset([b"r ", b"a ", b"s ", b"w ", b"va", b"fr", b"di", b"ba"])
+
+
+@lru_cache(maxsize=None)
+def _warn_unknown_flag(flag: str) -> None:
+    """
+    Warns about a relay flag that isn't in FLAG_NAMES, only once for each flag
+
+    :param flag: The unknown relay flag
+    :type flag: str
+    """
+    logging.getLogger(__name__).warning(
+        "Ignoring the %s relay flag, it needs to be added to FLAG_NAMES", flag
+    )
+
+
+def encode_flags(flags: Optional[List[str]]) -> int:
+    """
+    Encodes the relay flags as a bitmask. The flags that aren't in FLAG_NAMES,
+    such as the ones added to Tor later, are left out with a warning, since the
+    bitmasks are stored and need the same bits for the same flags everywhere.
+
+    :param flags: The relay flags
+    :type flags: Optional[List[str]]
+    :return: Bitmask of the FLAG_BITS of the flags
+    :rtype: int
+    """
+    mask = 0
+    for flag in flags or ():
+        bit = FLAG_BITS.get(flag)
+        if bit is None:
+            _warn_unknown_flag(flag)
+        else:
+            mask |= bit
+    return mask
+
+
+def decode_flags(mask: int) -> List[str]:
+    """
+    Decodes a bitmask of relay flags
+
+    :param mask: Bitmask of the FLAG_BITS of the flags
+    :type mask: int
+    :return: The relay flags, in lexical order like in the consensus
+    :rtype: List[str]
+    """
+    return sorted(name for name, bit in FLAG_BITS.items() if mask & bit)
+
+
+def get_position_weights(
+    flag_masks: np.ndarray, bandwidths: np.ndarray, bandwidth_weights: Dict
+) -> Dict[str, np.ndarray]:
+    """
+    Calculates the weights of the relays for being selected in each position of
+    a circuit. The probability of a relay being selected is its weight divided
+    by the total weight of all relays in the consensus.
+
+    Adapted from the function called calculatePathSelectionProbabilities() in
+    https://gitweb.torproject.org/onionoo.git/tree/src/main/java/org/torproject/metrics/onionoo/updater/NodeDetailsStatusUpdater.java#n597
+
+    :param flag_masks: Bitmasks of the relays' flags
+    :type flag_masks: np.ndarray
+    :param bandwidths: Bandwidths of the relays in the consensus
+    :type bandwidths: np.ndarray
+    :param bandwidth_weights: A dictionary of bandwidth weights parsed from consensus
+    :type bandwidth_weights: Dict
+    :return: The consensus, guard, middle and exit weights of the relays, in this order
+    :rtype: Dict[str, np.ndarray]
+    """
+    # pylint: disable=R0914
+    wgg = bandwidth_weights["Wgg"] / 10000.0
+    wgd = bandwidth_weights["Wgd"] / 10000.0
+    wmg = bandwidth_weights["Wmg"] / 10000.0
+    wmm = bandwidth_weights["Wmm"] / 10000.0
+    wme = bandwidth_weights["Wme"] / 10000.0
+    wmd = bandwidth_weights["Wmd"] / 10000.0
+    wee = bandwidth_weights["Wee"] / 10000.0
+    wed = bandwidth_weights["Wed"] / 10000.0
+
+    is_running = (flag_masks & FLAG_RUNNING) != 0
+    is_guard = (flag_masks & FLAG_GUARD) != 0
+    is_exit = ((flag_masks & FLAG_EXIT) != 0) & ((flag_masks & FLAG_BAD_EXIT) == 0)
+    is_guard_and_exit = is_guard & is_exit
+
+    # Only the running relays can be selected
+    consensus_weights = np.where(is_running, bandwidths, 0.0)
+
+    return {
+        "consensus": consensus_weights,
+        "guard": consensus_weights
+        * np.select([is_guard_and_exit, is_guard], [wgd, wgg], 0.0),
+        "middle": consensus_weights
+        * np.select([is_guard_and_exit, is_guard, is_exit], [wmd, wmg, wme], wmm),
+        "exit": consensus_weights
+        * np.select([is_guard_and_exit, is_exit], [wed, wee], 0.0),
+    }
+
+
+@lru_cache(maxsize=1 << 14)
+def _identity_to_fingerprint(identity: str) -> str:
+    """
+    Converts relay's identity to its fingerprint. The results are cached, since
+    the same relays are in the consecutive consensuses.
+
+    :param identity: hash of relay's identity key, encoded in base64
+    :type identity: str
+    :return: HEX version of the relay's identity key
+    :rtype: str
+    """
+    # pylint: disable=W0212
+    return sys.intern(stem.descriptor.router_status_entry._base64_to_hex(identity))
+
+
+@lru_cache(maxsize=1 << 14)
+def _parse_publication(publication: str) -> datetime:
+    """
+    Parses the publication time of a relay's descriptor. The results are cached,
+    so the entries of the same descriptor in different consensuses share them.
+
+    :param publication: Publication time in the form YYYY-MM-DD HH:MM:SS
+    :type publication: str
+    :return: Publication time
+    :rtype: datetime
+    """
+    return datetime.fromisoformat(publication)
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """
+    Interns the given string, so the entries of the same relay in different
+    consensuses share it
+
+    :param value: The string to intern
+    :type value: Optional[str]
+    :return: The interned string, or None if the given value is None
+    :rtype: Optional[str]
+    """
+    if value is None:
+        return None
+    return sys.intern(value)
+
 
-@dataclass
 class ConsensusRelayEntry:
     """
     Stores a router/relay/node entry
     See https://gitweb.torproject.org/torspec.git/tree/dir-spec.txt#n2337 for
     exact details
 
+    The entries don't have a __dict__ and store their flags as a bitmask to keep
+    many consensuses in memory at once
+
     :param nickname: OR's nickname
     :type nickname: str
     :param identity: hash of relay's identity key, encoded in base64, with trailing equals sign(s) removed
     :type identity: str
-    :param fingerprint: HEX version of the relay's identity key
+    :param fingerprint: HEX version of the relay's identity key, calculated from the identity
     :type fingerprint: str
     :param digest:  hash of relay's most recent descriptor as signed (that is, not including the signature) by the RSA identity key, encoded in base64
     :type digest: str
@@ -42,8 +220,10 @@ class ConsensusRelayEntry:
     :type DirPort: int, optional
     :param bandwidth: an estimate of the bandwidth of this relay
     :type bandwidth: float, optional
-    :param flags: relay's flags
+    :param flags: relay's flags, stored as flag_mask
     :type flags: list, optional
+    :param flag_mask: bitmask of relay's flags, used when flags isn't given
+    :type flag_mask: int, optional
     :param guard_probability: relay's guard probability
     :type guard_probability: float, optional
     :param middle_probability: relay's middle probability
@@ -56,29 +236,98 @@ class ConsensusRelayEntry:
     :returns: ConsensusRelayEntry object
     """
 
-    nickname: str
-    identity: str
-    digest: str
-    publication: datetime
-    IP: str
-    IPv6: Optional[str]
-    IPv6ORPort: Optional[str]
-    is_exit: bool
-    ORPort: int
-    DirPort: int
-    bandwidth: float
-    flags: List
-    fingerprint: Optional[str] = None
-    guard_probability: float = 0.0
-    middle_probability: float = 0.0
-    exit_probability: float = 0.0
-    consensus_weight_fraction: float = 0.0
-    captcha_percentage: float = 0.0
-
-    def __post_init__(self) -> None:
-        # pylint: disable=W0212
-        self.fingerprint = stem.descriptor.router_status_entry._base64_to_hex(
-            self.identity
+    __slots__ = (
+        "nickname",
+        "identity",
+        "digest",
+        "publication",
+        "IP",
+        "IPv6",
+        "IPv6ORPort",
+        "is_exit",
+        "ORPort",
+        "DirPort",
+        "bandwidth",
+        "flag_mask",
+        "fingerprint",
+        "guard_probability",
+        "middle_probability",
+        "exit_probability",
+        "consensus_weight_fraction",
+        "captcha_percentage",
+    )
+
+    def __init__(
+        self,
+        nickname: str,
+        identity: str,
+        digest: str,
+        publication: datetime,
+        IP: str,
+        IPv6: Optional[str],
+        IPv6ORPort: Optional[str],
+        is_exit: bool,
+        ORPort: int,
+        DirPort: int,
+        bandwidth: float,
+        flags: Optional[List] = None,
+        fingerprint: Optional[str] = None,
+        flag_mask: int = 0,
+        guard_probability: float = 0.0,
+        middle_probability: float = 0.0,
+        exit_probability: float = 0.0,
+        consensus_weight_fraction: float = 0.0,
+        captcha_percentage: float = 0.0,
+    ) -> None:
+        # pylint: disable=C0103,R0913,R0914,W0613
+        self.nickname: str = sys.intern(nickname)
+        self.identity: str = sys.intern(identity)
+        self.digest: str = sys.intern(digest)
+        self.publication: datetime = publication
+        self.IP: str = sys.intern(IP)
+        self.IPv6: Optional[str] = _intern(IPv6)
+        self.IPv6ORPort: Optional[str] = _intern(IPv6ORPort)
+        self.is_exit: bool = is_exit
+        self.ORPort: int = ORPort
+        self.DirPort: int = DirPort
+        self.bandwidth: float = bandwidth
+        self.flag_mask: int = flag_mask if flags is None else encode_flags(flags)
+        self.guard_probability: float = guard_probability
+        self.middle_probability: float = middle_probability
+        self.exit_probability: float = exit_probability
+        self.consensus_weight_fraction: float = consensus_weight_fraction
+        self.captcha_percentage: float = captcha_percentage
+        self.fingerprint: Optional[str] = _identity_to_fingerprint(identity)
+
+    @property
+    def flags(self) -> List[str]:
+        """
+        Gets relay's flags
+
+        :return: relay's flags, decoded from flag_mask
+        :rtype: List[str]
+        """
+        return decode_flags(self.flag_mask)
+
+    @flags.setter
+    def flags(self, flags: List[str]) -> None:
+        """
+        Sets relay's flags
+
+        :param flags: relay's flags, encoded into flag_mask
+        :type flags: List[str]
+        """
+        self.flag_mask = encode_flags(flags)
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self.__class__.__name__}({values})"
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
         )
 
 
@@ -87,178 +336,199 @@ class ConsensusV3Parser:
     Parses a given V3 consensus file
     """
 
-    def __init__(self, consensus_file: str) -> None:
+    def __init__(self, consensus_file: str, stream: bool = False) -> None:
         """
-        Initializes the parser
+        Initializes the parser, and parses the consensus right away unless it is
+        streamed. The errors of iter_relay_entries() are raised here for the
+        consensuses that aren't streamed.
 
         :param consensus_file: The absolute path to the consensus file
         :type consensus_file: str
-        :raises ConsensusParserFileNotFoundError: If given file does not exist
+        :param stream: Don't parse the relay entries until they are iterated with iter_relay_entries(), defaults to False
+        :type stream: bool
         """
         # Public class attributes
         self.valid_after: datetime
         self.fresh_until: datetime
-        self.bandwidth_weights: Dict
-        self.relay_entries: List[ConsensusRelayEntry]
+        self.bandwidth_weights: Dict = {}
+        self.relay_entries: List[ConsensusRelayEntry] = []
 
         # Private class attributes
         self.__logger = logging.getLogger(__name__)
-        self.__consensus_lines: List
+        self.__consensus_file: str = consensus_file
+
+        # Parse the consensus, the path selection probabilities depend on all of
+        # the relays and the bandwidth weights in the footer
+        if not stream:
+            self.relay_entries = list(self.iter_relay_entries())
+            self.relay_entries = self.__calculate_path_selection_probabilities(
+                self.relay_entries, self.bandwidth_weights
+            )
 
+    def iter_relay_entries(self) -> Iterator[ConsensusRelayEntry]:
+        """
+        Parses the consensus in a single pass over the memory map of the file,
+        and yields the relay entries as they are parsed. The valid after and
+        fresh until dates are set before the first relay entry is yielded, and
+        the bandwidth weights are set once all of the relay entries are yielded.
+        See https://gitweb.torproject.org/torspec.git/tree/dir-spec.txt#n2337 for
+        the exact format of the relay entries.
+
+        :raises ConsensusParserFileNotFoundError: If given file does not exist
+        :raises ConsensusParserInvalidDocument: If given file is invalid
+        :yield: Relay entries without their path selection probabilities
+        :rtype: Iterator[ConsensusRelayEntry]
+        """
+        # pylint: disable=R0912
         try:
-            # Read the file
-            with open(consensus_file, "r") as file:
-                self.__consensus_lines = [line.strip() for line in file.readlines()]
+            with open(self.__consensus_file, "rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped:
+                valid_after: Optional[datetime] = None
+                fresh_until: Optional[datetime] = None
+                relay: Dict[str, Any] = {}
+
+                for raw_line in iter(mapped.readline, b""):
+                    # Most of the lines of a relay entry aren't used, so skip them
+                    # before decoding
+                    if raw_line[:2] not in _PARSED_PREFIXES:
+                        continue
+
+                    line = raw_line.decode().strip()
+
+                    if line.startswith("r "):
+                        if relay:
+                            yield ConsensusRelayEntry(**relay)
+                        elif valid_after is None or fresh_until is None:
+                            raise ConsensusParserInvalidDocument
+
+                        relay = self.__parse_router_line(line)
+
+                    elif relay and self.__parse_relay_entry_line(relay, line):
+                        # Stop parsing the entry since bandwidth comes the last
+                        yield ConsensusRelayEntry(**relay)
+                        relay = {}
+
+                    elif line.startswith("valid-after "):
+                        valid_after = self.__parse_datetime(line)
+                        self.valid_after = valid_after
+
+                    elif line.startswith("fresh-until "):
+                        fresh_until = self.__parse_datetime(line)
+                        self.fresh_until = fresh_until
+
+                    elif line.startswith("directory-footer") and relay:
+                        yield ConsensusRelayEntry(**relay)
+                        relay = {}
+
+                    elif line.startswith("bandwidth-weights "):
+                        if not self.bandwidth_weights:
+                            self.bandwidth_weights = self.__parse_bandwidth_weights(
+                                line
+                            )
+
+                if relay:
+                    yield ConsensusRelayEntry(**relay)
+
+                if valid_after is None or fresh_until is None:
+                    raise ConsensusParserInvalidDocument
 
         except FileNotFoundError as exception:
             self.__logger.warning("Given consensus file doesn't exist: %s", exception)
             raise ConsensusParserFileNotFoundError from exception
 
-        # Parse the consensus
-        self.valid_after = self.__parse_valid_after(self.__consensus_lines)
-        self.fresh_until = self.__parse_fresh_until(self.__consensus_lines)
-        self.bandwidth_weights = self.__parse_bandwidth_weights(self.__consensus_lines)
-        self.relay_entries = self.__parse_relay_entries(self.__consensus_lines)
-        self.relay_entries = self.__calculate_path_selection_probabilities(
-            self.relay_entries, self.bandwidth_weights
-        )
-
-    @staticmethod
-    def __parse_valid_after(consensus_lines: List) -> datetime:
-        """
-        Parses the valid after date from consensus
-
-        :param consensus_lines: Rows of the consensus
-        :type consensus_lines: List
-        :raises ConsensusParserInvalidDocument: If given file is invalid
-        :return: "valid-after" timestamp
-        :rtype: datetime
-        """
-        for line in consensus_lines:
-            if line.startswith("valid-after"):
-                date = line.split(" ", 1)[1]
-                return datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-
-        raise ConsensusParserInvalidDocument
+        except ValueError as exception:
+            # Empty files can't be memory mapped, and malformed lines can't be parsed
+            self.__logger.warning("Given consensus file is not valid: %s", exception)
+            raise ConsensusParserInvalidDocument from exception
 
     @staticmethod
-    def __parse_fresh_until(consensus_lines: List) -> datetime:
+    def __parse_datetime(line: str) -> datetime:
         """
-        Parses the fresh until date from consensus
+        Parses the date of a "valid-after" or "fresh-until" line
 
-        :param consensus_lines: Rows of the consensus
-        :type consensus_lines: List
-        :raises ConsensusParserInvalidDocument: If given file is invalid
-        :return: "fresh-until" timestamp
+        :param line: The line of the consensus
+        :type line: str
+        :return: The date in the line
         :rtype: datetime
         """
-        for line in consensus_lines:
-            if line.startswith("fresh-until"):
-                date = line.split(" ", 1)[1]
-                return datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-
-        raise ConsensusParserInvalidDocument
+        date = line.split(" ", 1)[1]
+        return datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
 
     @staticmethod
-    def __parse_bandwidth_weights(consensus_lines: List) -> Dict:
+    def __parse_bandwidth_weights(line: str) -> Dict:
         """
-        Parses the fresh until date from consensus
+        Parses the bandwidth weights from the footer of the consensus
 
-        :param consensus_lines: Rows of the consensus
-        :type consensus_lines: List
+        :param line: The "bandwidth-weights" line of the consensus
+        :type line: str
         :return: A dictionary of weight values
         :rtype: Dict
         """
-        weights = []
-        for line in consensus_lines[::-1]:
-            if line.startswith("bandwidth-weights "):
-                weights = line.split(" ")[1:]
-
         weights_dict = {}
-        for weight in weights:
+        for weight in line.split(" ")[1:]:
             values = weight.split("=")
             weights_dict.update({values[0]: float(values[1])})
 
         return weights_dict
 
     @staticmethod
-    def __parse_relay_entries(
-        consensus_lines: List,
-    ) -> List[ConsensusRelayEntry]:
+    def __parse_relay_entry_line(relay: Dict[str, Any], line: str) -> bool:
+        """
+        Parses the "a", "s", and "w" lines of a relay entry into the keyword
+        arguments of its ConsensusRelayEntry
+
+        :param relay: Keyword arguments of ConsensusRelayEntry parsed so far
+        :type relay: Dict[str, Any]
+        :param line: The line of the consensus
+        :type line: str
+        :return: True if the line was the "w" line that ends the entry, False otherwise
+        :rtype: bool
         """
-        Parses relay entries in the consensus
+        if line.startswith("a "):
+            address = line.split(" ")[1].rsplit(":", 1)
+            relay["IPv6"] = address[0]
+            relay["IPv6ORPort"] = address[1]
 
-        :param consensus_lines: Rows of the consensus
-        :type consensus_lines: List
-        :return: A list of ConsensusRelayEntry objects
-        :rtype: List[ConsensusRelayEntry]
+        elif line.startswith("s "):
+            flags = line.split(" ")[1:]
+            relay["flags"] = flags
+            relay["is_exit"] = "Exit" in flags and "BadExit" not in flags
+
+        elif line.startswith("w "):
+            relay["bandwidth"] = float(line.split(" ")[1].split("=")[1])
+            return True
+
+        return False
+
+    @staticmethod
+    def __parse_router_line(line: str) -> Dict[str, Any]:
         """
-        # TODO: Please refactor me into smaller functions
-        # pylint: disable=R0914
-        relays = []
-
-        for idx, line in enumerate(consensus_lines):
-            params = []
-            # Find relay entries
-            if line.startswith("r "):
-                # Split the line into separate parameters
-                params = line.split(" ")[1:]
-
-                # See https://gitweb.torproject.org/torspec.git/tree/dir-spec.txt#n2337
-                #   for the exact order of the params
-                nickname = params[0]
-                identity = params[1]
-                digest = params[2]
-                publication = datetime.strptime(
-                    params[3] + " " + params[4], "%Y-%m-%d %H:%M:%S"
-                )
-                IP = params[5]
-                ORPort = int(params[6])
-                DirPort = int(params[7])
-
-                # Parse the flags and bandwidth for this relay
-                flags = []
-                bandwidth = 0.0
-                is_exit = False
-                IPv6 = None
-                IPv6ORPort = None
-                for i in range(1, 10):
-
-                    temp_line = consensus_lines[idx + i]
-
-                    if temp_line.startswith("a "):
-                        cur_line = temp_line.split(" ")[1:][0].rsplit(":", 1)
-                        IPv6 = cur_line[0]
-                        IPv6ORPort = cur_line[1]
-
-                    elif temp_line.startswith("s "):
-                        flags = temp_line.split(" ")[1:]
-                        is_exit = "Exit" in flags and "BadExit" not in flags
-
-                    elif temp_line.startswith("w "):
-                        bandwidth = float(temp_line.split(" ")[1].split("=")[1])
-
-                        # Stop searching since bandwidth comes the last
-                        break
-
-                # Add relay to the list
-                relays.append(
-                    ConsensusRelayEntry(
-                        nickname=nickname,
-                        identity=identity,
-                        digest=digest,
-                        publication=publication,
-                        IP=IP,
-                        is_exit=is_exit,
-                        IPv6=IPv6,
-                        IPv6ORPort=IPv6ORPort,
-                        ORPort=ORPort,
-                        DirPort=DirPort,
-                        bandwidth=bandwidth,
-                        flags=flags,
-                    )
-                )
-        return relays
+        Parses the "r" line that starts a relay entry
+
+        :param line: The "r" line of the consensus
+        :type line: str
+        :return: Keyword arguments of ConsensusRelayEntry with the defaults of the rest of the entry
+        :rtype: Dict[str, Any]
+        """
+        # See https://gitweb.torproject.org/torspec.git/tree/dir-spec.txt#n2337
+        #   for the exact order of the params
+        params = line.split(" ")[1:]
+
+        return {
+            "nickname": params[0],
+            "identity": params[1],
+            "digest": params[2],
+            "publication": _parse_publication(params[3] + " " + params[4]),
+            "IP": params[5],
+            "ORPort": int(params[6]),
+            "DirPort": int(params[7]),
+            "IPv6": None,
+            "IPv6ORPort": None,
+            "is_exit": False,
+            "bandwidth": 0.0,
+            "flags": [],
+        }
 
     @staticmethod
     def __calculate_path_selection_probabilities(
@@ -266,11 +536,9 @@ class ConsensusV3Parser:
         bandwidth_weights: Dict,
     ) -> List[ConsensusRelayEntry]:
         """
-        Calculates guard, middle, and exit probabilities for relays
-
-        Adapted from the function called calculatePathSelectionProbabilities() in
-        https://gitweb.torproject.org/onionoo.git/tree/src/main/java/org/torproject/metrics/onionoo/updater/NodeDetailsStatusUpdater.java#n597
-
+        Calculates guard, middle, and exit probabilities for relays. The flags
+        are encoded as bitmasks and the weights of all relays are calculated at
+        once with array operations.
 
         :param relay_entries: List of relay entries
         :type relay_entries: List[ConsensusRelayEntry]
@@ -279,90 +547,34 @@ class ConsensusV3Parser:
         :return: List of relay entry objects
         :rtype: List[ConsensusRelayEntry]
         """
-        # TODO: Please refactor me into smaller functions
-        # pylint: disable=R0914
-        # pylint: disable=R0915
-        wgg = bandwidth_weights["Wgg"] / 10000.0
-        wgd = bandwidth_weights["Wgd"] / 10000.0
-        wmg = bandwidth_weights["Wmg"] / 10000.0
-        wmm = bandwidth_weights["Wmm"] / 10000.0
-        wme = bandwidth_weights["Wme"] / 10000.0
-        wmd = bandwidth_weights["Wmd"] / 10000.0
-        wee = bandwidth_weights["Wee"] / 10000.0
-        wed = bandwidth_weights["Wed"] / 10000.0
-
-        consensusWeights = {}
-        guardWeights = {}
-        middleWeights = {}
-        exitWeights = {}
-
-        totalConsensusWeight = 0.0
-        totalGuardWeight = 0.0
-        totalMiddleWeight = 0.0
-        totalExitWeight = 0.0
-
-        running_relays = []
-        for relay in relay_entries:
-            if "Running" in relay.flags:
-                running_relays.append(relay)
-
-        for relay in running_relays:
-            isExit = (
-                relay.flags is not None
-                and "Exit" in relay.flags
-                and "BadExit" not in relay.flags
-            )
-            isGuard = relay.flags is not None and "Guard" in relay.flags
-            consensusWeight = float(relay.bandwidth)
-            consensusWeights.update({relay.fingerprint: consensusWeight})
-            totalConsensusWeight += consensusWeight
-
-            guardWeight = consensusWeight
-            middleWeight = consensusWeight
-            exitWeight = consensusWeight
-
-            if isGuard and isExit:
-                guardWeight *= wgd
-                middleWeight *= wmd
-                exitWeight *= wed
-            elif isGuard:
-                guardWeight *= wgg
-                middleWeight *= wmg
-                exitWeight = 0.0
-            elif isExit:
-                guardWeight = 0.0
-                middleWeight *= wme
-                exitWeight *= wee
-            else:
-                guardWeight = 0.0
-                middleWeight *= wmm
-                exitWeight = 0.0
-
-            guardWeights.update({relay.fingerprint: guardWeight})
-            middleWeights.update({relay.fingerprint: middleWeight})
-            exitWeights.update({relay.fingerprint: exitWeight})
-
-            totalGuardWeight += guardWeight
-            totalMiddleWeight += middleWeight
-            totalExitWeight += exitWeight
-
-        for relay in relay_entries:
-            fingerprint = relay.fingerprint
-
-            if fingerprint in consensusWeights:
-                fraction = float(consensusWeights[fingerprint] / totalConsensusWeight)
-                relay.consensus_weight_fraction = fraction
-
-            if fingerprint in guardWeights:
-                probability = float(guardWeights[fingerprint] / totalGuardWeight)
-                relay.guard_probability = probability
-
-            if fingerprint in middleWeights:
-                probability = float(middleWeights[fingerprint] / totalMiddleWeight)
-                relay.middle_probability = probability
-
-            if fingerprint in exitWeights:
-                probability = float(exitWeights[fingerprint] / totalExitWeight)
-                relay.exit_probability = probability
+        if len(relay_entries) == 0:
+            return relay_entries
+
+        flag_masks = np.fromiter(
+            (relay.flag_mask for relay in relay_entries),
+            dtype=np.int64,
+            count=len(relay_entries),
+        )
+        bandwidths = np.fromiter(
+            (relay.bandwidth for relay in relay_entries),
+            dtype=np.float64,
+            count=len(relay_entries),
+        )
+
+        fractions = [
+            weights / total if total > 0 else np.zeros_like(weights)
+            for weights in get_position_weights(
+                flag_masks, bandwidths, bandwidth_weights
+            ).values()
+            for total in (weights.sum(),)
+        ]
+
+        for relay, consensus, guard, middle, exit_ in zip(
+            relay_entries, *(fraction.tolist() for fraction in fractions)
+        ):
+            relay.consensus_weight_fraction = consensus
+            relay.guard_probability = guard
+            relay.middle_probability = middle
+            relay.exit_probability = exit_
 
         return relay_entries
@@ -1,12 +1,20 @@
 import logging
 from typing import Optional
+from datetime import datetime
 
-from sqlalchemy import create_engine
+import pytz
+from sqlalchemy import inspect, create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy_utils import create_database, database_exists
 
 from captchamonitor.utils.models import Model
 from captchamonitor.utils.exceptions import DatabaseInitError
+from captchamonitor.utils.partitions import (
+    is_partitioned,
+    create_partitions,
+    supports_partitioning,
+    get_partitioned_tables,
+)
 
 
 class Database:
@@ -47,7 +55,10 @@ class Database:
         )
 
         try:
-            self.engine = create_engine(self.__connection_string, echo=verbose)
+            # Use execute_values for bulk inserts instead of one INSERT per row
+            self.engine = create_engine(
+                self.__connection_string, echo=verbose, executemany_mode="values"
+            )
 
             if not database_exists(self.engine.url):
                 self.__logger.info("Database doesn't exist, creating it now")
@@ -63,7 +74,90 @@ class Database:
         self.model = Model
 
         # Process models
-        self.model.metadata.create_all(self.engine)
+        self.__create_tables()
+        self.__add_missing_columns()
+        self.__add_missing_indexes()
 
         # Create session
         self.session = sessionmaker(bind=self.engine)
+
+    def __create_tables(self) -> None:
+        """
+        Creates the missing tables. The tables that are partitioned by month are
+        created as partitioned tables if the database supports it, together with
+        the partitions of the current and the next month. The existing tables are
+        left as they are.
+        """
+        with self.engine.connect() as connection:
+            partitioning = supports_partitioning(connection)
+
+        for table in get_partitioned_tables(self.model.metadata):
+            table.dialect_options["postgresql"]["partition_by"] = (
+                f"RANGE ({table.info['partition_by']})" if partitioning else None
+            )
+
+        self.model.metadata.create_all(self.engine)
+
+        with self.engine.connect() as connection:
+            for table in get_partitioned_tables(self.model.metadata):
+                if is_partitioned(connection, table.name):
+                    create_partitions(
+                        connection, table, datetime.now(pytz.utc).date(), 2
+                    )
+
+    def __add_missing_columns(self) -> None:
+        """
+        Adds the columns that were added to the models after their tables were
+        created, since create_all only creates the missing tables. The new columns
+        are added as nullable columns without defaults.
+        """
+        inspector = inspect(self.engine)
+        quote = self.engine.dialect.identifier_preparer.quote
+
+        with self.engine.begin() as connection:
+            for table in self.model.metadata.sorted_tables:
+                existing_columns = {
+                    column["name"] for column in inspector.get_columns(table.name)
+                }
+
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    connection.execute(
+                        f"ALTER TABLE {quote(table.name)} ADD COLUMN IF NOT EXISTS "
+                        f"{quote(column.name)} {column_type}"
+                    )
+                    self.__logger.info(
+                        "Added the missing %s column to the %s table",
+                        column.name,
+                        table.name,
+                    )
+
+    def __add_missing_indexes(self) -> None:
+        """
+        Creates the indexes that were added to the models after their tables were
+        created, since create_all only creates the indexes of the missing tables
+        """
+        for table in self.model.metadata.sorted_tables:
+            # The inspector doesn't list the indexes of the partitioned tables
+            existing_indexes = {
+                name
+                for (name,) in self.engine.execute(
+                    "SELECT indexname FROM pg_indexes "
+                    "WHERE schemaname = current_schema() AND tablename = %s",
+                    table.name,
+                )
+            }
+
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+
+                index.create(bind=self.engine)
+                self.__logger.info(
+                    "Added the missing %s index to the %s table",
+                    index.name,
+                    table.name,
+                )
@@ -0,0 +1,129 @@
+import re
+from typing import Dict, List, Tuple, Iterable, Optional, FrozenSet
+from collections import Counter
+from dataclasses import field, dataclass
+from html.parser import HTMLParser
+
+from captchamonitor.utils.keyword_matcher import KeywordMatcher, get_keyword_matcher
+
+
+@dataclass
+class DomFeatures:
+    """
+    Stores the features of an HTML document that are used by the analyzer
+
+    :param node_count: Number of elements in the document
+    :type node_count: int
+    :param tag_histogram: Number of elements in the document for each tag name
+    :type tag_histogram: Dict[str, int]
+    :param tokens: Lowercase words in the visible text of the document, in order
+    :type tokens: List[str]
+    :param keyword_matches: Keywords found in the HTML of the document
+    :type keyword_matches: FrozenSet[str]
+
+    :returns: DomFeatures object
+    """
+
+    node_count: int = 0
+    tag_histogram: Dict[str, int] = field(default_factory=dict)
+    tokens: List[str] = field(default_factory=list)
+    keyword_matches: FrozenSet[str] = frozenset()
+
+
+class DomFeatureExtractor(HTMLParser):
+    """
+    Extracts the DOM features of an HTML document in a single pass over the
+    parser events, without building the document tree
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the extractor
+        """
+        super().__init__(convert_charrefs=True)
+
+        # Private class attributes
+        self.__token_pattern = re.compile(r"\w+")
+        self.__non_text_tags: Tuple[str, ...] = ("script", "style")
+        self.__non_text_depth: int = 0
+        self.__tag_histogram: Counter = Counter()
+        self.__tokens: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        """
+        Counts the opened element
+
+        :param tag: Lowercase name of the tag
+        :type tag: str
+        :param attrs: Attributes of the element
+        :type attrs: List[Tuple[str, Optional[str]]]
+        """
+        self.__tag_histogram[tag] += 1
+        if tag in self.__non_text_tags:
+            self.__non_text_depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        """
+        Keeps track of leaving the elements that don't contain visible text
+
+        :param tag: Lowercase name of the tag
+        :type tag: str
+        """
+        if tag in self.__non_text_tags and self.__non_text_depth > 0:
+            self.__non_text_depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        """
+        Splits the visible text into lowercase tokens
+
+        :param data: Text content
+        :type data: str
+        """
+        if self.__non_text_depth == 0:
+            self.__tokens.extend(self.__token_pattern.findall(data.lower()))
+
+    def extract(
+        self, html_data: str, keyword_matcher: Optional[KeywordMatcher] = None
+    ) -> DomFeatures:
+        """
+        Extracts the features of the given HTML document
+
+        :param html_data: The HTML document
+        :type html_data: str
+        :param keyword_matcher: Matcher for the keywords to search for in the HTML, defaults to None
+        :type keyword_matcher: Optional[KeywordMatcher]
+        :return: Features of the document
+        :rtype: DomFeatures
+        """
+        self.reset()
+        self.__non_text_depth = 0
+        self.__tag_histogram = Counter()
+        self.__tokens = []
+
+        self.feed(html_data)
+        self.close()
+
+        keyword_matches: FrozenSet[str] = frozenset()
+        if keyword_matcher is not None:
+            keyword_matches = keyword_matcher.find_all(html_data)
+
+        return DomFeatures(
+            node_count=sum(self.__tag_histogram.values()),
+            tag_histogram=dict(self.__tag_histogram),
+            tokens=self.__tokens,
+            keyword_matches=keyword_matches,
+        )
+
+
+def extract_dom_features(html_data: str, keywords: Iterable[str] = ()) -> DomFeatures:
+    """
+    Extracts the features of the given HTML document
+
+    :param html_data: The HTML document
+    :type html_data: str
+    :param keywords: Keywords to search for in the HTML, defaults to ()
+    :type keywords: Iterable[str]
+    :return: Features of the document
+    :rtype: DomFeatures
+    """
+    return DomFeatureExtractor().extract(html_data, get_keyword_matcher(keywords))
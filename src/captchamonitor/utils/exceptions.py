@@ -19,6 +19,16 @@ class TorLauncherInitError(Error):
         return "TorLauncherInitError: Tor Launcher initialization error"
 
 
+class TorPoolInitError(Error):
+    def __str__(self) -> str:
+        return "TorPoolInitError: Tor pool initialization error"
+
+
+class TorPoolLeaseError(Error):
+    def __str__(self) -> str:
+        return "TorPoolLeaseError: Cannot lease a Tor container from the Tor pool"
+
+
 class OnionooConnectionError(Error):
     def __str__(self) -> str:
         return "OnionooConnectionError: Onionoo API connection error"
@@ -0,0 +1,91 @@
+import logging
+from typing import Any, List, Tuple, Iterator, Optional
+from dataclasses import field, dataclass
+
+import ijson
+
+
+@dataclass
+class HarStatuses:
+    """
+    Stores the HTTP status codes read from the beginning of a HAR
+
+    :param entries: URL and status code of each entry that was read, in order
+    :type entries: List[Tuple[str, int]]
+    :param document: URL and status code of the first response that isn't a redirect
+    :type document: Optional[Tuple[str, int]]
+
+    :returns: HarStatuses object
+    """
+
+    entries: List[Tuple[str, int]] = field(default_factory=list)
+    document: Optional[Tuple[str, int]] = None
+
+
+def _parse_events(
+    json_data: str, chunk_size: int = 65536
+) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Parses the given JSON string incrementally, encoding only one chunk of it
+    at a time instead of copying the whole string
+
+    :param json_data: The JSON string
+    :type json_data: str
+    :param chunk_size: Number of characters to parse at a time, defaults to 65536
+    :type chunk_size: int
+    :yield: Prefix, event and value of each parser event
+    :rtype: Iterator[Tuple[str, str, Any]]
+    """
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events)
+
+    for start in range(0, len(json_data), chunk_size):
+        parser.send(json_data[start : start + chunk_size].encode("utf-8"))
+        yield from events
+        del events[:]
+
+    parser.close()
+    yield from events
+
+
+def read_har_statuses(har_data: Optional[str]) -> HarStatuses:
+    """
+    Reads the HAR entries incrementally until the first response that isn't a
+    redirect, without loading the rest of the HAR into memory
+
+    :param har_data: The HAR as a JSON string
+    :type har_data: Optional[str]
+    :return: Status codes of the entries up to and including the first response
+        that isn't a redirect
+    :rtype: HarStatuses
+    """
+    statuses = HarStatuses()
+
+    if har_data is None:
+        return statuses
+
+    url: Optional[str] = None
+    status: Optional[int] = None
+
+    try:
+        for prefix, event, value in _parse_events(har_data):
+            if prefix == "log.entries.item.request.url":
+                url = value
+            elif prefix == "log.entries.item.response.status":
+                status = int(value)
+            elif prefix == "log.entries.item" and event == "end_map":
+                if url is not None and status is not None:
+                    statuses.entries.append((url, status))
+
+                    # Redirects are followed, the first other response is the document
+                    if not 300 <= status < 400:
+                        statuses.document = (url, status)
+                        break
+
+                url = None
+                status = None
+
+    except ijson.JSONError as e:
+        logging.getLogger(__name__).debug("Couldn't parse the HAR: %s", e)
+
+    return statuses
@@ -0,0 +1,119 @@
+from typing import Tuple, Iterable, FrozenSet
+from functools import lru_cache
+
+import ahocorasick
+
+# Markers that CAPTCHA and challenge pages of the common providers leave in the
+# HTML of the page and in the URLs of the requests they make
+CAPTCHA_SIGNATURES: FrozenSet[str] = frozenset(
+    [
+        "captcha",
+        # Google reCAPTCHA
+        "g-recaptcha",
+        "grecaptcha",
+        "recaptcha/api",
+        # hCaptcha
+        "h-captcha",
+        "hcaptcha.com",
+        # Cloudflare challenge pages
+        "cf-challenge",
+        "cf_chl_",
+        "cf-browser-verification",
+        "challenge-platform",
+        "challenges.cloudflare.com",
+        # DataDome
+        "captcha-delivery.com",
+        # PerimeterX
+        "px-captcha",
+        # Arkose Labs
+        "funcaptcha",
+        "arkoselabs.com",
+    ]
+)
+
+
+class KeywordMatcher:
+    """
+    Finds all of the given keywords in a text in a single pass, using an
+    Aho-Corasick automaton built once for the keyword list. Matching is case
+    insensitive and overlapping keywords are all reported.
+    """
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        """
+        Builds the automaton for the given keywords
+
+        :param keywords: Keywords to search for, empty ones are ignored
+        :type keywords: Iterable[str]
+        """
+        # Private class attributes
+        self.__keywords: FrozenSet[str] = frozenset(
+            keyword.lower() for keyword in keywords if len(keyword) > 0
+        )
+        # pylint: disable=I1101
+        self.__automaton: ahocorasick.Automaton = ahocorasick.Automaton()
+
+        for keyword in self.__keywords:
+            self.__automaton.add_word(keyword, keyword)
+
+        if len(self.__keywords) > 0:
+            self.__automaton.make_automaton()
+
+    @property
+    def keywords(self) -> FrozenSet[str]:
+        """
+        Returns the lowercase keywords this matcher searches for
+
+        :return: The keywords
+        :rtype: FrozenSet[str]
+        """
+        return self.__keywords
+
+    def find_all(self, text: str) -> FrozenSet[str]:
+        """
+        Finds the keywords that appear in the given text
+
+        :param text: The text to search in
+        :type text: str
+        :return: Keywords found in the text
+        :rtype: FrozenSet[str]
+        """
+        if len(self.__keywords) == 0:
+            return frozenset()
+
+        return frozenset(keyword for _, keyword in self.__automaton.iter(text.lower()))
+
+    def __len__(self) -> int:
+        """
+        Returns the number of keywords
+
+        :return: Number of keywords
+        :rtype: int
+        """
+        return len(self.__keywords)
+
+
+@lru_cache(maxsize=8)
+def _build_keyword_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    """
+    Builds and caches a matcher for the given sorted keywords
+
+    :param keywords: Sorted keywords
+    :type keywords: Tuple[str, ...]
+    :return: Matcher for the keywords
+    :rtype: KeywordMatcher
+    """
+    return KeywordMatcher(keywords)
+
+
+def get_keyword_matcher(keywords: Iterable[str]) -> KeywordMatcher:
+    """
+    Returns a matcher for the given keywords, reusing the one built for the
+    same keyword list before instead of building the automaton again
+
+    :param keywords: Keywords to search for
+    :type keywords: Iterable[str]
+    :return: Matcher for the keywords
+    :rtype: KeywordMatcher
+    """
+    return _build_keyword_matcher(tuple(sorted(set(keywords))))
@@ -1,8 +1,11 @@
+from typing import List, Optional
 from datetime import datetime
 
 import pytz
 from sqlalchemy import (
     JSON,
+    Float,
+    Index,
     Column,
     String,
     Boolean,
@@ -10,10 +13,14 @@ from sqlalchemy import (
     Unicode,
     DateTime,
     ForeignKey,
+    LargeBinary,
+    text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Load, undefer, deferred, relationship, selectinload
 from sqlalchemy.ext.declarative import declared_attr, declarative_base
 
+from captchamonitor.utils.compression import decompress
+
 Model = declarative_base()
 
 
@@ -33,6 +40,27 @@ class BaseModel(Model):  # type: ignore
     # fmt: on
 
 
+class PartitionedModel(BaseModel):
+    """
+    Base model for the append-only tables that are partitioned by month on their
+    creation time when the database supports it, the tables also need to have
+    {"info": {"partition_by": "created_at"}} in their table arguments
+    """
+
+    __abstract__ = True
+
+    # The partition key has to be a part of the primary key of a partitioned table
+    # fmt: off
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.utc), primary_key=True)
+    # fmt: on
+
+    # pylint: disable=E0213
+    @declared_attr
+    def __mapper_args__(cls) -> dict:
+        # The IDs are still unique on their own, so identify the rows only by them
+        return {"primary_key": [cls.id]}
+
+
 class MetaData(BaseModel):
     """
     Stores metadata related to CAPTCHA Monitor's progress accross runs and other
@@ -95,9 +123,63 @@ class Relay(BaseModel):
     asn_name = Column(String)                                             # Relay's autonomous system name
     platform = Column(String)                                             # The operating system of the relay
     comment = Column(String)                                              # Comments, if there is any
+    exit_probability = Column(Float)                                      # Probability of the relay being chosen as an exit by Tor clients
     # fmt: on
 
 
+class Consensus(BaseModel):
+    """
+    Stores the consensuses whose relays were recorded in the relay snapshots
+    """
+
+    __tablename__ = "consensus"
+
+    # fmt: off
+    valid_after = Column(DateTime(timezone=True), unique=True, nullable=False) # Valid-after time of the consensus
+    fresh_until = Column(DateTime(timezone=True), nullable=False)              # Fresh-until time of the consensus
+    relay_count = Column(Integer, nullable=False)                              # Number of relays in the consensus
+    bandwidth_weights = Column(JSON)                                           # Bandwidth weights in the footer of the consensus
+    consensus_weight_total = Column(Float)                                     # Total bandwidth of the running relays
+    guard_weight_total = Column(Float)                                         # Total weight of the relays for the guard position
+    middle_weight_total = Column(Float)                                        # Total weight of the relays for the middle position
+    exit_weight_total = Column(Float)                                          # Total weight of the relays for the exit position
+    # fmt: on
+
+
+class RelaySnapshot(BaseModel):
+    """
+    Stores the state of the relays in the recorded consensuses. A row is only
+    added when the state of a relay changes, and it covers the consecutive
+    consensuses the relay had the same state in.
+    """
+
+    __tablename__ = "relay_snapshot"
+
+    # fmt: off
+    valid_from = Column(DateTime(timezone=True), nullable=False)  # Valid-after time of the first consensus with this state
+    valid_until = Column(DateTime(timezone=True), nullable=False) # Fresh-until time of the last consensus with this state
+    fingerprint = Column(String, nullable=False)                  # HEX version of the relay's identity key
+    nickname = Column(String)                                     # Nickname of the relay
+    ipv4_address = Column(String)                                 # IPv4 address of the relay
+    ipv6_address = Column(String)                                 # IPv6 address of the relay
+    flags = Column(Integer, nullable=False)                       # Bitmask of the relay's flags, see FLAG_NAMES in consensus_parser
+    bandwidth = Column(Integer)                                   # Bandwidth of the relay in the consensus
+    # fmt: on
+
+    __table_args__ = (
+        # Point-in-time lookups of a relay
+        Index(
+            "ix_relay_snapshot_fingerprint_valid_from",
+            "fingerprint",
+            "valid_from",
+            unique=True,
+        ),
+        # The snapshots next to a consensus that is being recorded
+        Index("ix_relay_snapshot_valid_from", "valid_from"),
+        Index("ix_relay_snapshot_valid_until", "valid_until"),
+    )
+
+
 class Proxy(BaseModel):
     """
     Stores list of tracked proxies and metadata related to them
@@ -132,6 +214,64 @@ class Fetcher(BaseModel):
     # fmt: on
 
 
+class BlobDictionary(BaseModel):
+    """
+    Stores the zstd dictionaries trained on the fetched bodies of each domain
+    """
+
+    __tablename__ = "blob_dictionary"
+
+    # pylint: disable=E0213
+    @declared_attr
+    def domain_id(cls) -> Column:
+        # ID of the domain this dictionary was trained for
+        return Column(Integer, ForeignKey("domain.id"), nullable=False)
+
+    # fmt: off
+    data = Column(LargeBinary, nullable=False) # The zstd dictionary
+    # fmt: on
+
+    # References to the foreign keys, gives access to these tables
+    ref_domain = relationship("Domain", backref="BlobDictionary")
+
+
+class Blob(BaseModel):
+    """
+    Stores the zstd compressed bodies of the fetches, deduplicated by their hash
+    """
+
+    __tablename__ = "blob"
+
+    # pylint: disable=E0213
+    @declared_attr
+    def dictionary_id(cls) -> Column:
+        # ID of the dictionary used to compress the body, if any
+        return Column(Integer, ForeignKey("blob_dictionary.id"))
+
+    # fmt: off
+    sha256 = Column(String, unique=True, nullable=False) # SHA256 hash of the uncompressed body
+    size = Column(Integer, nullable=False)               # Size of the uncompressed body in bytes
+    data = deferred(Column(LargeBinary, nullable=False)) # The zstd compressed body, only loaded when accessed
+    # fmt: on
+
+    # References to the foreign keys, gives access to these tables
+    ref_dictionary = relationship("BlobDictionary", backref="Blob")
+
+    @property
+    def content(self) -> str:
+        """
+        Decompresses the body
+
+        :return: The uncompressed body
+        :rtype: str
+        """
+        dictionary = None
+        if self.ref_dictionary is not None:
+            dictionary = self.ref_dictionary.data
+
+        return decompress(self.data, dictionary).decode("utf-8")
+
+
 class FetchBaseModel(BaseModel):
     """
     Base model for fetcher related tables
@@ -176,6 +316,22 @@ class FetchQueue(FetchBaseModel):
     """
 
     __tablename__ = "fetch_queue"
+    __table_args__ = (
+        # Workers claim the unclaimed jobs in the order they were queued
+        Index(
+            "ix_fetch_queue_unclaimed",
+            "id",
+            postgresql_where=text("claimed_by IS NULL"),
+        ),
+        # Workers resume the jobs they claimed before they were restarted
+        Index(
+            "ix_fetch_queue_claimed_by",
+            "claimed_by",
+            postgresql_where=text("claimed_by IS NOT NULL"),
+        ),
+        # The scheduler skips the domains that are already queued for a fetcher
+        Index("ix_fetch_queue_domain_id_fetcher_id", "domain_id", "fetcher_id"),
+    )
 
     # fmt: off
     claimed_by = Column(String) # Workers use this field for assigning jobs to themselves
@@ -188,17 +344,49 @@ class FetchQueue(FetchBaseModel):
     ref_proxy = relationship("Proxy", backref="FetchQueue")
 
 
-class FetchCompleted(FetchBaseModel):
+class FetchCompleted(PartitionedModel, FetchBaseModel):
     """
     Contains jobs that are completed - inherits FetchBaseModel
     """
 
     __tablename__ = "fetch_completed"
+    __table_args__ = (
+        # The analyzer looks up the latest fetches of each domain
+        Index("ix_fetch_completed_domain_id_id", "domain_id", text("id DESC")),
+        # and the latest fetches of each domain through each of the proxies
+        Index(
+            "ix_fetch_completed_domain_id_proxy_id_id",
+            "domain_id",
+            "proxy_id",
+            text("id DESC"),
+            postgresql_where=text("proxy_id IS NOT NULL"),
+        ),
+        # The dashboard looks up the fetches completed through each relay
+        Index(
+            "ix_fetch_completed_relay_id",
+            "relay_id",
+            postgresql_where=text("relay_id IS NOT NULL"),
+        ),
+        # Partitioned by month when the database supports it
+        {"info": {"partition_by": "created_at"}},
+    )
+
+    # pylint: disable=E0213
+    @declared_attr
+    def html_data_blob_id(cls) -> Column:
+        # ID of the blob that stores the HTML data gathered as a result of the fetch
+        return Column(Integer, ForeignKey("blob.id"))
+
+    # pylint: disable=E0213
+    @declared_attr
+    def http_requests_blob_id(cls) -> Column:
+        # ID of the blob that stores the HTTP requests in JSON format made by the fetcher while fetching the URL
+        return Column(Integer, ForeignKey("blob.id"))
 
     # fmt: off
     captcha_monitor_version = Column(String, nullable=False) # Version of the CAPTCHA Monitor used to do fetching
-    html_data = Column(Unicode)                              # The HTML data gathered as a result of the fetch
-    http_requests = Column(JSON)                             # The HTTP requests in JSON format made by the fetcher while fetching the URL
+    inline_html_data = deferred(Column("html_data", Unicode))      # The HTML data of the fetches completed before the blob table was used, only loaded when accessed
+    inline_http_requests = deferred(Column("http_requests", JSON)) # The HTTP requests of the fetches completed before the blob table was used, only loaded when accessed
     # fmt: on
 
     # References to the foreign keys, gives access to these tables
@@ -206,14 +394,80 @@ class FetchCompleted(FetchBaseModel):
     ref_domain = relationship("Domain", backref="FetchCompleted")
     ref_relay = relationship("Relay", backref="FetchCompleted")
     ref_proxy = relationship("Proxy", backref="FetchCompleted")
-
-
-class FetchFailed(FetchBaseModel):
+    ref_html_data_blob = relationship(
+        "Blob", foreign_keys="FetchCompleted.html_data_blob_id"
+    )
+    ref_http_requests_blob = relationship(
+        "Blob", foreign_keys="FetchCompleted.http_requests_blob_id"
+    )
+
+    @property
+    def html_data(self) -> Optional[str]:
+        """
+        Gets the HTML data gathered as a result of the fetch, decompressing it
+        only when it is accessed
+
+        :return: The HTML data
+        :rtype: Optional[str]
+        """
+        if self.ref_html_data_blob is not None:
+            return self.ref_html_data_blob.content
+        return self.inline_html_data
+
+    @property
+    def http_requests(self) -> Optional[str]:
+        """
+        Gets the HTTP requests in JSON format made by the fetcher while fetching
+        the URL, decompressing them only when they are accessed
+
+        :return: The HTTP requests in JSON format
+        :rtype: Optional[str]
+        """
+        if self.ref_http_requests_blob is not None:
+            return self.ref_http_requests_blob.content
+        return self.inline_http_requests
+
+    @staticmethod
+    def load_bodies(html_data: bool = True, http_requests: bool = True) -> List[Load]:
+        """
+        Gets the query options that load the bodies of the fetches together with
+        the fetches, for the queries that will access them. Otherwise the bodies
+        are only loaded one by one when they are accessed.
+
+        :param html_data: Load the HTML data, defaults to True
+        :type html_data: bool
+        :param http_requests: Load the HTTP requests, defaults to True
+        :type http_requests: bool
+        :return: Query options to pass to Query.options()
+        :rtype: List[Load]
+        """
+        options = []
+
+        if html_data:
+            options.append(undefer(FetchCompleted.inline_html_data))
+            options.append(
+                selectinload(FetchCompleted.ref_html_data_blob).undefer(Blob.data)
+            )
+
+        if http_requests:
+            options.append(undefer(FetchCompleted.inline_http_requests))
+            options.append(
+                selectinload(FetchCompleted.ref_http_requests_blob).undefer(Blob.data)
+            )
+
+        return options
+
+
+class FetchFailed(PartitionedModel, FetchBaseModel):
     """
     Contains jobs that are failed - inherits FetchBaseModel
     """
 
     __tablename__ = "fetch_failed"
+    __table_args__ = (
+        # Partitioned by month when the database supports it
+        {"info": {"partition_by": "created_at"}},
+    )
 
     # fmt: off
     captcha_monitor_version = Column(String, nullable=False) # Version of the CAPTCHA Monitor used to do fetching
@@ -227,18 +481,28 @@ class FetchFailed(FetchBaseModel):
     ref_proxy = relationship("Proxy", backref="FetchFailed")
 
 
-class AnalyzeCompleted(BaseModel):
+class AnalyzeCompleted(PartitionedModel):
     """
     Contains the Analyzer table
     """
 
     __tablename__ = "analyze_completed"
+    __table_args__ = (
+        # The analyzer skips the fetches that were already analyzed
+        Index("ix_analyze_completed_fetch_completed_id", "fetch_completed_id"),
+        # The dashboard groups the results by day
+        Index("ix_analyze_completed_created_at", "created_at"),
+        # Partitioned by month when the database supports it
+        {"info": {"partition_by": "created_at"}},
+    )
 
     # pylint: disable=E0213
     @declared_attr
     def fetch_completed_id(cls) -> Column:
-        # ID of FetchCompleted table to use
-        return Column(Integer, ForeignKey("fetch_completed.id"), nullable=False)
+        # ID of FetchCompleted table to use, it isn't a foreign key since the IDs
+        # of a partitioned table can't be referenced and the old partitions of
+        # both tables are removed independently
+        return Column(Integer, nullable=False)
 
     # fmt: off
     captcha_checker = Column(Integer)        # Checks if the website contains CAPTCHA or not
@@ -249,4 +513,8 @@ class AnalyzeCompleted(BaseModel):
     # fmt: on
 
     # References to the foreign keys, gives access to these tables
-    ref_fetch_completed = relationship("FetchCompleted", backref="AnalyzeCompleted")
+    ref_fetch_completed = relationship(
+        "FetchCompleted",
+        primaryjoin="foreign(AnalyzeCompleted.fetch_completed_id) == FetchCompleted.id",
+        backref="AnalyzeCompleted",
+    )
@@ -1,14 +1,65 @@
-import json
 import logging
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timezone
+from functools import lru_cache
+from collections import OrderedDict
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import country_converter as coco
+from requests.adapters import HTTPAdapter
 
 from captchamonitor.utils.exceptions import OnionooConnectionError
 
+# Relays in the earlier responses and their Last-Modified headers by request URL,
+# used for making conditional requests
+_response_cache: "OrderedDict[str, Tuple[str, List[Dict]]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+_response_cache_size = 256
+
+
+@lru_cache(maxsize=1)
+def _get_session(pool_size: int = 8) -> requests.Session:
+    """
+    Gets the HTTP session shared by all of the Onionoo requests, so that the
+    connections to the API are pooled and reused
+
+    :param pool_size: Maximum number of connections to keep open, defaults to 8
+    :type pool_size: int
+    :return: The shared session
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+
+@lru_cache(maxsize=1)
+def _get_country_converter() -> coco.CountryConverter:
+    """
+    Gets the country converter shared by all of the lookups, since creating one
+    is slow and coco.convert creates a new one on every call
+
+    :return: The shared country converter
+    :rtype: coco.CountryConverter
+    """
+    return coco.CountryConverter()
+
+
+@lru_cache(maxsize=512)
+def _get_continent(country: str) -> str:
+    """
+    Gets the continent of the given country
+
+    :param country: ISO 3166 alpha-2 country code
+    :type country: str
+    :return: Name of the continent
+    :rtype: str
+    """
+    return _get_country_converter().convert(names=country, to="continent")
+
 
 @dataclass
 class OnionooRelayEntry:
@@ -38,12 +89,26 @@ class Onionoo:
     Uses Onionoo to get the details of the given relay
     """
 
-    def __init__(self, fingerprints: List[str]) -> None:
+    def __init__(
+        self,
+        fingerprints: List[str],
+        batch_size: int = 40,
+        max_workers: int = 4,
+        bulk_threshold: int = 1000,
+    ) -> None:
         """
-        Initialize, fetch, and parse the details
+        Initialize, fetch, and parse the details. The details of up to
+        bulk_threshold relays are looked up in concurrent batches, the details of
+        more relays are filtered out of a single request for all of the relays.
 
         :param fingerprints: List of BASE64 encoded SHA256 hash of the relays
         :type fingerprints: List[str]
+        :param batch_size: Number of relays to look up in a single request, defaults to 40
+        :type batch_size: int
+        :param max_workers: Maximum number of concurrent requests, defaults to 4
+        :type max_workers: int
+        :param bulk_threshold: Maximum number of relays to look up in batches, defaults to 1000
+        :type bulk_threshold: int
         """
         # Public class attributes
         self.fingerprint_list: List[str] = fingerprints
@@ -51,14 +116,15 @@ class Onionoo:
 
         # Private class attributes
         self.__logger = logging.getLogger(__name__)
-        self.__fingerprint_list_str: str = "".join(
-            f"{str(fpr)}," for fpr in self.fingerprint_list
-        )[:-1]
-        self.__lookup_fields: str = f"fingerprint,nickname,exit_policy_summary,exit_policy_v6_summary,first_seen,last_seen,country,country_name,as,as_name,version,platform&lookup={self.__fingerprint_list_str}"
-        self.__lookup_url: str = (
+        self.__batch_size: int = batch_size
+        self.__max_workers: int = max_workers
+        self.__bulk_threshold: int = bulk_threshold
+        self.__timeout: int = 60
+        self.__lookup_fields: str = "fingerprint,nickname,exit_policy_summary,exit_policy_v6_summary,first_seen,last_seen,country,country_name,as,as_name,version,platform"
+        self.__details_url: str = (
             f"https://onionoo.torproject.org/details?fields={self.__lookup_fields}"
         )
-        self.__relay_data: Dict
+        self.__relay_data: List[Dict] = []
         self.__onionoo_datetime_format: str = "%Y-%m-%d %H:%M:%S"
         self.__exit_ports: List[int] = [80, 443]
 
@@ -69,18 +135,78 @@ class Onionoo:
 
     def __get_details(self) -> None:
         """
-        Performs a request to Onioon API
+        Performs the requests to Onionoo API. The OnionooConnectionError raised
+        by __request() is passed on if it cannot connect to the API
+        """
+        if len(self.fingerprint_list) > self.__bulk_threshold:
+            fingerprints = {str(fpr).upper() for fpr in self.fingerprint_list}
+            self.__relay_data = [
+                relay
+                for relay in self.__request(f"{self.__details_url}&type=relay")
+                if str(relay.get("fingerprint", "")).upper() in fingerprints
+            ]
+            return
+
+        urls = [
+            f"{self.__details_url}&lookup="
+            + ",".join(
+                str(fpr) for fpr in self.fingerprint_list[i : i + self.__batch_size]
+            )
+            for i in range(0, len(self.fingerprint_list), self.__batch_size)
+        ]
+
+        if len(urls) <= 1:
+            responses = [self.__request(url) for url in urls]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(self.__max_workers, len(urls))
+            ) as executor:
+                responses = list(executor.map(self.__request, urls))
+
+        self.__relay_data = [relay for relays in responses for relay in relays]
+
+    def __request(self, url: str) -> List[Dict]:
+        """
+        Requests the given URL from Onionoo API, reusing the earlier response if
+        Onionoo says it wasn't modified since then
 
+        :param url: The URL to request
+        :type url: str
         :raises OnionooConnectionError: If cannot connect to the API
+        :return: Relays in the response
+        :rtype: List[Dict]
         """
+        with _response_cache_lock:
+            cached = _response_cache.get(url, None)
+
+        headers = {}
+        if cached is not None:
+            headers["If-Modified-Since"] = cached[0]
+
         try:
-            response = json.loads(requests.get(self.__lookup_url).text)
-            self.__relay_data = response["relays"]
+            response = _get_session().get(url, headers=headers, timeout=self.__timeout)
+
+            if response.status_code == 304 and cached is not None:
+                self.__logger.debug("Onionoo response wasn't modified, reusing it")
+                return cached[1]
+
+            response.raise_for_status()
+            relays = response.json()["relays"]
 
         except Exception as exception:
             self.__logger.debug("Could not connect to Onionoo: %s", exception)
             raise OnionooConnectionError from exception
 
+        last_modified = response.headers.get("Last-Modified", None)
+        if last_modified is not None:
+            with _response_cache_lock:
+                _response_cache[url] = (last_modified, relays)
+                _response_cache.move_to_end(url)
+                while len(_response_cache) > _response_cache_size:
+                    _response_cache.popitem(last=False)
+
+        return relays
+
     def __parse_details_of_relay(self, relay_data: Dict) -> OnionooRelayEntry:
         """
         Parses given Onionoo JSON response
@@ -97,7 +223,7 @@ class Onionoo:
         country = relay_data.get("country", None)
         country_name = relay_data.get("country_name", None)
         if country_name is not None:
-            continent = coco.convert(names=country, to="continent")
+            continent = _get_continent(country)
         else:
             continent = None
         nickname = relay_data.get("nickname", None)
@@ -0,0 +1,247 @@
+import re
+from typing import Dict, List
+from datetime import date
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.schema import MetaData
+
+
+def get_partitioned_tables(metadata: MetaData) -> List[Table]:
+    """
+    Gets the tables that are partitioned by month when the database supports it
+
+    :param metadata: Metadata of the models
+    :type metadata: MetaData
+    :return: The tables with a partition_by entry in their info
+    :rtype: List[Table]
+    """
+    return [table for table in metadata.sorted_tables if "partition_by" in table.info]
+
+
+def supports_partitioning(connection: Connection) -> bool:
+    """
+    Checks if the database supports partitioned tables with primary keys and
+    default partitions, which requires PostgreSQL 11 or later
+
+    :param connection: Connection to the database
+    :type connection: Connection
+    :return: True if the database supports partitioning, False otherwise
+    :rtype: bool
+    """
+    return connection.dialect.server_version_info >= (11,)
+
+
+def is_partitioned(connection: Connection, table_name: str) -> bool:
+    """
+    Checks if the given table was created as a partitioned table
+
+    :param connection: Connection to the database
+    :type connection: Connection
+    :param table_name: Name of the table
+    :type table_name: str
+    :return: True if the table is partitioned, False otherwise
+    :rtype: bool
+    """
+    if not supports_partitioning(connection):
+        return False
+
+    return bool(
+        connection.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%s))",
+            table_name,
+        ).scalar()
+    )
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Gets the first day of the month that is the given number of months away from
+    the given month
+
+    :param month: Any day of the month to start from
+    :type month: date
+    :param months: Number of months to move, can be negative
+    :type months: int
+    :return: First day of the resulting month
+    :rtype: date
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: date) -> str:
+    """
+    Gets the name of the partition that stores the given month of the table
+
+    :param table_name: Name of the partitioned table
+    :type table_name: str
+    :param month: Any day of the month
+    :type month: date
+    :return: Name of the partition
+    :rtype: str
+    """
+    return f"{table_name}_p{month.year:04d}_{month.month:02d}"
+
+
+def get_partitions(connection: Connection, table_name: str) -> Dict[str, date]:
+    """
+    Gets the monthly partitions of the given table, the default partition isn't
+    included
+
+    :param connection: Connection to the database
+    :type connection: Connection
+    :param table_name: Name of the partitioned table
+    :type table_name: str
+    :return: First day of the month stored by each partition, by partition name
+    :rtype: Dict[str, date]
+    """
+    pattern = re.compile(rf"^{re.escape(table_name)}_p(\d{{4}})_(\d{{2}})$")
+    partitions = {}
+
+    for (name,) in connection.execute(
+        "SELECT inhrelid::regclass::text FROM pg_inherits "
+        "WHERE inhparent = to_regclass(%s)",
+        table_name,
+    ):
+        match = pattern.match(name)
+        if match is not None:
+            partitions[name] = date(int(match.group(1)), int(match.group(2)), 1)
+
+    return partitions
+
+
+def get_archived_partitions(
+    connection: Connection, table_name: str, archive_schema: str
+) -> List[str]:
+    """
+    Gets the monthly partitions of the given table that were moved to the
+    archive schema
+
+    :param connection: Connection to the database
+    :type connection: Connection
+    :param table_name: Name of the partitioned table
+    :type table_name: str
+    :param archive_schema: Schema the old partitions were moved to
+    :type archive_schema: str
+    :return: Names of the archived partitions
+    :rtype: List[str]
+    """
+    pattern = re.compile(rf"^{re.escape(table_name)}_p(\d{{4}})_(\d{{2}})$")
+
+    return sorted(
+        name
+        for (name,) in connection.execute(
+            "SELECT tablename FROM pg_tables WHERE schemaname = %s", archive_schema
+        )
+        if pattern.match(name)
+    )
+
+
+def create_partitions(
+    connection: Connection, table: Table, month: date, count: int
+) -> List[str]:
+    """
+    Creates the default partition and the monthly partitions of the given
+    partitioned table that don't exist yet, starting from the given month. The
+    rows that ended up in the default partition because their partition didn't
+    exist yet are moved to the new partitions.
+
+    :param connection: Connection to the database
+    :type connection: Connection
+    :param table: The partitioned table
+    :type table: Table
+    :param month: Any day of the first month to create a partition for
+    :type month: date
+    :param count: Number of consecutive months to create partitions for
+    :type count: int
+    :return: Names of the created monthly partitions
+    :rtype: List[str]
+    """
+    # pylint: disable=R0914
+    quote = connection.dialect.identifier_preparer.quote
+    column = quote(table.info["partition_by"])
+    parent = quote(table.name)
+    default = quote(f"{table.name}_default")
+
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {default} PARTITION OF {parent} DEFAULT"
+    )
+
+    existing = get_partitions(connection, table.name)
+    created = []
+
+    for i in range(count):
+        start = add_months(month, i)
+        name = partition_name(table.name, start)
+        if name in existing:
+            continue
+
+        bounds = (
+            f"{start.isoformat()} 00:00:00+00",
+            f"{add_months(start, 1).isoformat()} 00:00:00+00",
+        )
+        in_range = f"{column} >= %s AND {column} < %s"
+
+        with connection.begin():
+            moved = connection.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})", *bounds
+            ).scalar()
+
+            # A new partition can't be created while the default one has its rows
+            if moved:
+                connection.execute(f"ALTER TABLE {parent} DETACH PARTITION {default}")
+
+            connection.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF {parent} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                *bounds,
+            )
+
+            if moved:
+                connection.execute(
+                    f"INSERT INTO {parent} SELECT * FROM {default} WHERE {in_range}",
+                    *bounds,
+                )
+                connection.execute(f"DELETE FROM {default} WHERE {in_range}", *bounds)
+                connection.execute(
+                    f"ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT"
+                )
+
+        created.append(name)
+
+    return created
+
+
+def remove_partition(
+    connection: Connection, table: Table, name: str, archive_schema: str = ""
+) -> None:
+    """
+    Detaches the given partition from its table, and either moves it to the
+    archive schema or drops it. Unlike deleting its rows, this doesn't depend on
+    the number of rows in the partition.
+
+    :param connection: Connection to the database
+    :type connection: Connection
+    :param table: The partitioned table
+    :type table: Table
+    :param name: Name of the partition
+    :type name: str
+    :param archive_schema: Schema to move the partition to, drops it if empty, defaults to ""
+    :type archive_schema: str
+    """
+    quote = connection.dialect.identifier_preparer.quote
+
+    with connection.begin():
+        connection.execute(
+            f"ALTER TABLE {quote(table.name)} DETACH PARTITION {quote(name)}"
+        )
+
+        if archive_schema:
+            connection.execute(f"CREATE SCHEMA IF NOT EXISTS {quote(archive_schema)}")
+            connection.execute(
+                f"ALTER TABLE {quote(name)} SET SCHEMA {quote(archive_schema)}"
+            )
+        else:
+            connection.execute(f"DROP TABLE {quote(name)}")
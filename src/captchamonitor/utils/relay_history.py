@@ -0,0 +1,266 @@
+from typing import Any, Dict, List, Tuple, Optional
+from datetime import datetime
+
+import pytz
+import numpy as np
+from sqlalchemy import func, select, update, bindparam
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import insert
+
+from captchamonitor.utils.models import Consensus, RelaySnapshot
+from captchamonitor.utils.consensus_parser import (
+    ConsensusV3Parser,
+    get_position_weights,
+)
+
+# Columns of a relay snapshot that start a new snapshot when they change
+_STATE_COLUMNS = ("nickname", "ipv4_address", "ipv6_address", "flags", "bandwidth")
+
+# Path selection probabilities by the position weights they are calculated from
+_PROBABILITY_COLUMNS = {
+    "consensus": "consensus_weight_fraction",
+    "guard": "guard_probability",
+    "middle": "middle_probability",
+    "exit": "exit_probability",
+}
+
+# Key of the advisory lock that is held while recording a consensus
+_RECORD_LOCK_KEY = 2021060112
+
+
+def get_consensus_snapshot(consensus: ConsensusV3Parser) -> Dict[str, Any]:
+    """
+    Gets the state of the relays in a parsed consensus, along with the total
+    weights that their path selection probabilities are calculated with
+
+    :param consensus: The parsed consensus
+    :type consensus: ConsensusV3Parser
+    :return: The consensus and the state of its relays
+    :rtype: Dict[str, Any]
+    """
+    relays = [
+        {
+            "fingerprint": relay.fingerprint,
+            "nickname": relay.nickname,
+            "ipv4_address": relay.IP,
+            "ipv6_address": relay.IPv6,
+            "flags": relay.flag_mask,
+            "bandwidth": int(relay.bandwidth),
+        }
+        for relay in consensus.relay_entries
+    ]
+
+    weights = get_position_weights(
+        np.array([relay["flags"] for relay in relays], dtype=np.int64),
+        np.array([relay["bandwidth"] for relay in relays], dtype=np.float64),
+        consensus.bandwidth_weights,
+    )
+
+    return {
+        "valid_after": consensus.valid_after.replace(tzinfo=pytz.utc),
+        "fresh_until": consensus.fresh_until.replace(tzinfo=pytz.utc),
+        "bandwidth_weights": consensus.bandwidth_weights,
+        "weight_totals": {
+            f"{position}_weight_total": float(position_weights.sum())
+            for position, position_weights in weights.items()
+        },
+        "relays": relays,
+    }
+
+
+def _get_state(snapshot: Dict[str, Any]) -> Tuple:
+    """
+    Gets the columns of a relay snapshot that are compared between consensuses
+
+    :param snapshot: The relay snapshot
+    :type snapshot: Dict[str, Any]
+    :return: Values of the state columns
+    :rtype: Tuple
+    """
+    return tuple(snapshot[column] for column in _STATE_COLUMNS)
+
+
+def _get_snapshots(db_session: sessionmaker, criterion: Any) -> Dict[str, Dict]:
+    """
+    Gets the relay snapshots that match the given criterion
+
+    :param db_session: Database session used to connect to the database
+    :type db_session: sessionmaker
+    :param criterion: Filter for the snapshots
+    :type criterion: Any
+    :return: The snapshots by relay fingerprint
+    :rtype: Dict[str, Dict]
+    """
+    columns = ("id", "valid_until", "fingerprint") + _STATE_COLUMNS
+    query = db_session.query(
+        *(getattr(RelaySnapshot, column) for column in columns)
+    ).filter(criterion)
+
+    return {row.fingerprint: dict(zip(columns, row)) for row in query}
+
+
+def record_consensus(
+    db_session: sessionmaker, consensus: Dict[str, Any], chunk_size: int = 1000
+) -> bool:
+    """
+    Records a consensus and the relays whose state is different than in the
+    consensuses right before and right after it, in a single transaction. The
+    snapshots of the relays whose state didn't change are extended to cover the
+    consensus instead, so the consensuses can be recorded in any order.
+
+    :param db_session: Database session used to connect to the database
+    :type db_session: sessionmaker
+    :param consensus: The consensus and the state of its relays, see get_consensus_snapshot()
+    :type consensus: Dict[str, Any]
+    :param chunk_size: Maximum number of snapshots to insert in a single statement, defaults to 1000
+    :type chunk_size: int
+    :return: False if the consensus was already recorded, True otherwise
+    :rtype: bool
+    """
+    # pylint: disable=R0914
+    valid_after = consensus["valid_after"]
+    fresh_until = consensus["fresh_until"]
+    updated_at = datetime.now(pytz.utc)
+
+    # Consensuses recorded at the same time can't see each other's snapshots,
+    # so they are recorded one by one to extend the snapshots of each other
+    db_session.execute(select([func.pg_advisory_xact_lock(_RECORD_LOCK_KEY)]))
+
+    consensus_id = db_session.execute(
+        insert(Consensus)
+        .values(
+            valid_after=valid_after,
+            fresh_until=fresh_until,
+            relay_count=len(consensus["relays"]),
+            bandwidth_weights=consensus["bandwidth_weights"],
+            **consensus["weight_totals"],
+        )
+        .on_conflict_do_nothing(index_elements=[Consensus.valid_after])
+        .returning(Consensus.id)
+    ).scalar()
+
+    if consensus_id is None:
+        db_session.rollback()
+        return False
+
+    previous = _get_snapshots(db_session, RelaySnapshot.valid_until == valid_after)
+    following = _get_snapshots(db_session, RelaySnapshot.valid_from == fresh_until)
+
+    extended: List[int] = []
+    started_earlier: List[int] = []
+    merged: List[Dict[str, Any]] = []
+    added: List[Dict[str, Any]] = []
+
+    for relay in consensus["relays"]:
+        state = _get_state(relay)
+        before = previous.get(relay["fingerprint"], {})
+        after = following.get(relay["fingerprint"], {})
+        same_before = bool(before) and _get_state(before) == state
+        same_after = bool(after) and _get_state(after) == state
+
+        if same_before and same_after:
+            merged.append(
+                {
+                    "snapshot_id": before["id"],
+                    "merged_id": after["id"],
+                    "merged_valid_until": after["valid_until"],
+                }
+            )
+        elif same_before:
+            extended.append(before["id"])
+        elif same_after:
+            started_earlier.append(after["id"])
+        else:
+            added.append(dict(relay, valid_from=valid_after, valid_until=fresh_until))
+
+    if extended:
+        db_session.query(RelaySnapshot).filter(RelaySnapshot.id.in_(extended)).update(
+            {
+                RelaySnapshot.valid_until: fresh_until,
+                RelaySnapshot.updated_at: updated_at,
+            },
+            synchronize_session=False,
+        )
+
+    if started_earlier:
+        db_session.query(RelaySnapshot).filter(
+            RelaySnapshot.id.in_(started_earlier)
+        ).update(
+            {
+                RelaySnapshot.valid_from: valid_after,
+                RelaySnapshot.updated_at: updated_at,
+            },
+            synchronize_session=False,
+        )
+
+    # The consensus fills the gap between two snapshots with the same state
+    if merged:
+        db_session.query(RelaySnapshot).filter(
+            RelaySnapshot.id.in_([merge["merged_id"] for merge in merged])
+        ).delete(synchronize_session=False)
+        db_session.execute(
+            update(RelaySnapshot)
+            .where(RelaySnapshot.id == bindparam("snapshot_id"))
+            .values(valid_until=bindparam("merged_valid_until"), updated_at=updated_at),
+            merged,
+        )
+
+    for i in range(0, len(added), chunk_size):
+        db_session.execute(insert(RelaySnapshot), added[i : i + chunk_size])
+
+    db_session.commit()
+    return True
+
+
+def get_relay_snapshot(
+    db_session: sessionmaker, fingerprint: str, date: datetime
+) -> Optional[Dict[str, Any]]:
+    """
+    Gets the state of a relay in the consensus that was valid at the given time,
+    including its path selection probabilities in that consensus
+
+    :param db_session: Database session used to connect to the database
+    :type db_session: sessionmaker
+    :param fingerprint: Fingerprint of the relay
+    :type fingerprint: str
+    :param date: The time to get the state of the relay at
+    :type date: datetime
+    :return: The state of the relay with its flags as a bitmask, see decode_flags(), or None if the relay or the consensus wasn't recorded
+    :rtype: Optional[Dict[str, Any]]
+    """
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=pytz.utc)
+
+    consensus = (
+        db_session.query(Consensus)
+        .filter(Consensus.valid_after <= date)
+        .order_by(Consensus.valid_after.desc())
+        .first()
+    )
+    if consensus is None or consensus.fresh_until <= date:
+        return None
+
+    snapshot = (
+        db_session.query(RelaySnapshot)
+        .filter(RelaySnapshot.fingerprint == fingerprint)
+        .filter(RelaySnapshot.valid_from <= consensus.valid_after)
+        .order_by(RelaySnapshot.valid_from.desc())
+        .first()
+    )
+    if snapshot is None or snapshot.valid_until <= consensus.valid_after:
+        return None
+
+    state = {column: getattr(snapshot, column) for column in _STATE_COLUMNS}
+    state["fingerprint"] = fingerprint
+    state["valid_after"] = consensus.valid_after
+
+    weights = get_position_weights(
+        np.array([snapshot.flags], dtype=np.int64),
+        np.array([snapshot.bandwidth], dtype=np.float64),
+        consensus.bandwidth_weights,
+    )
+    for position, column in _PROBABILITY_COLUMNS.items():
+        total = getattr(consensus, f"{position}_weight_total")
+        state[column] = float(weights[position][0]) / total if total > 0 else 0.0
+
+    return state
@@ -1,3 +1,4 @@
+import re
 import time
 import random
 import logging
@@ -6,7 +7,7 @@ from typing import Any, List, Optional
 import docker
 import port_for
 import stem.control
-from stem import SocketError, DescriptorUnavailable
+from stem import SocketError, ControllerError, DescriptorUnavailable
 from stem.control import Controller
 from stem.util.log import get_logger
 
@@ -24,12 +25,25 @@ class TorLauncher:
     Launch Tor with given configuration values
     """
 
-    def __init__(self, config: Config) -> None:
+    def __init__(
+        self,
+        config: Config,
+        ip_address: Optional[str] = None,
+        socks_port: Optional[int] = None,
+        control_port: Optional[int] = None,
+    ) -> None:
         """
-        Initialize Tor Launcher
+        Initialize Tor Launcher, connects to the given Tor container instead of
+        launching a new one if its address is given
 
         :param config: The config class instance that contains global configuration values
         :type config: Config
+        :param ip_address: IP address of a running Tor container, defaults to None
+        :type ip_address: Optional[str]
+        :param socks_port: Socks port of the running Tor container, defaults to None
+        :type socks_port: Optional[int]
+        :param control_port: Control port of the running Tor container, defaults to None
+        :type control_port: Optional[int]
         :raises TorLauncherInitError: If Tor launcher wasn't able connect to the Tor container
         """
         # Public class attributes
@@ -57,7 +71,18 @@ class TorLauncher:
         stem_logger.propagate = False
 
         # Execute the private methods
-        self.__launch_tor_container()
+        if ip_address is None:
+            self.__launch_tor_container()
+
+        elif socks_port is not None and control_port is not None:
+            self.ip_address = ip_address
+            self.socks_port = socks_port
+            self.control_port = control_port
+
+        else:
+            self.__logger.warning("The ports of the Tor container are missing")
+            raise TorLauncherInitError
+
         self.__bind_stem_to_tor_container()
 
     def __launch_tor_container(self) -> None:
@@ -171,6 +196,55 @@ class TorLauncher:
             self.__controller.get_version(),
         )
 
+    def get_bootstrap_progress(self) -> int:
+        """
+        Gets the bootstrap progress of Tor from the Tor Container using stem
+
+        :return: Bootstrap progress in percent, 100 once Tor is ready to build circuits
+        :rtype: int
+        """
+        match = re.search(
+            r"PROGRESS=(\d+)", self.__controller.get_info("status/bootstrap-phase")
+        )
+        if match is None:
+            return 0
+
+        return int(match.group(1))
+
+    def wait_for_bootstrap(self, timeout: float = 300) -> None:
+        """
+        Waits until Tor is done bootstrapping in the Tor Container
+
+        :param timeout: Maximum number of seconds to wait, defaults to 300
+        :type timeout: float
+        :raises TorLauncherInitError: If Tor wasn't done bootstrapping in time
+        """
+        deadline = time.monotonic() + timeout
+        while self.get_bootstrap_progress() < 100:
+            if time.monotonic() > deadline:
+                self.__logger.warning("Tor did not bootstrap in %s seconds", timeout)
+                raise TorLauncherInitError
+            time.sleep(1)
+
+    def is_healthy(self) -> bool:
+        """
+        Checks if Tor in the Tor Container is still reachable over its control
+        port and is able to build circuits
+
+        :return: True if Tor is healthy, False otherwise
+        :rtype: bool
+        """
+        try:
+            return (
+                self.__controller.is_alive()
+                and self.get_bootstrap_progress() == 100
+                and self.__controller.get_info("status/circuit-established") == "1"
+            )
+
+        except ControllerError as exception:
+            self.__logger.debug("Tor Container is not healthy: %s", exception)
+            return False
+
     def update_relay_descriptors(self) -> None:
         """
         Gets a copy of the current relay descriptors from the Tor Container using
@@ -250,16 +324,27 @@ class TorLauncher:
         """
         Resets stem back to its original state
         """
+        # Close the circuit, so that the connections kept alive by a reused
+        # browser session can't carry the next fetch through the same exit relay
+        if hasattr_private(self, "__circuit_id"):
+            try:
+                self.__controller.close_circuit(self.__circuit_id)
+            except ControllerError:
+                # The circuit might have been closed already
+                pass
+
         self.__controller.remove_event_listener(self.__attach_stream)
         self.__controller.reset_conf("__LeaveStreamsUnattached")
 
     def close(self) -> None:
         """
-        Perform cleanup before going out of scope
+        Perform cleanup before going out of scope, kills the Tor Container only
+        if it was launched by this instance
         """
         if hasattr_private(self, "__controller"):
             # Close connection
             self.__controller.close()
 
+        if hasattr_private(self, "__container"):
             # Kill the container
             self.__container.kill()
@@ -0,0 +1,135 @@
+import time
+import logging
+from typing import Dict, Tuple
+
+import requests
+
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.exceptions import TorPoolLeaseError
+from captchamonitor.utils.tor_launcher import TorLauncher
+
+
+class TorPoolClient:
+    """
+    Leases Tor containers from the Tor pool. The connections to the control
+    ports of the Tor containers are kept open between the leases.
+    """
+
+    def __init__(self, config: Config, timeout: float = 60) -> None:
+        """
+        Initializes the Tor pool client
+
+        :param config: The config class instance that contains global configuration values
+        :type config: Config
+        :param timeout: Maximum number of seconds to wait for a Tor container, defaults to 60
+        :type timeout: float
+        """
+        # Private class attributes
+        self.__logger = logging.getLogger(__name__)
+        self.__config: Config = config
+        self.__url: str = str(self.__config["tor_pool_url"]).rstrip("/")
+        self.__timeout: float = timeout
+        self.__delay_in_seconds_between_retries: int = 3
+        self.__tor_launchers: Dict[Tuple[str, int, int], TorLauncher] = {}
+        self.__lease_ids: Dict[TorLauncher, str] = {}
+
+    def lease(self) -> TorLauncher:
+        """
+        Leases a Tor container from the Tor pool, waits until one is available
+
+        :raises TorPoolLeaseError: If no Tor container was available in time
+        :return: Tor launcher connected to the leased Tor container
+        :rtype: TorLauncher
+        """
+        deadline = time.monotonic() + self.__timeout
+
+        while True:
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                response = requests.post(
+                    f"{self.__url}/leases",
+                    params={"timeout": remaining},
+                    timeout=remaining + 10,
+                )
+                break
+
+            except requests.exceptions.ConnectionError as exception:
+                # The Tor pool might be still starting up
+                if (
+                    time.monotonic() + self.__delay_in_seconds_between_retries
+                    > deadline
+                ):
+                    self.__logger.warning("Could not connect to the Tor pool")
+                    raise TorPoolLeaseError from exception
+                time.sleep(self.__delay_in_seconds_between_retries)
+
+            except requests.exceptions.RequestException as exception:
+                self.__logger.warning("Could not connect to the Tor pool")
+                raise TorPoolLeaseError from exception
+
+        if response.status_code != 200:
+            self.__logger.warning(
+                "Could not lease a Tor container from the Tor pool: %s",
+                response.text,
+            )
+            raise TorPoolLeaseError
+
+        lease = response.json()
+        address = (lease["ip_address"], lease["socks_port"], lease["control_port"])
+
+        # Connect to the Tor container unless there is a healthy connection
+        tor_launcher = self.__tor_launchers.pop(address, None)
+        if tor_launcher is not None and not tor_launcher.is_healthy():
+            tor_launcher.close()
+            tor_launcher = None
+
+        # pylint: disable=W0703
+        try:
+            if tor_launcher is None:
+                tor_launcher = TorLauncher(self.__config, *address)
+
+        except Exception as exception:
+            self.__release(lease["lease_id"])
+            raise TorPoolLeaseError from exception
+
+        self.__tor_launchers[address] = tor_launcher
+        self.__lease_ids[tor_launcher] = lease["lease_id"]
+
+        return tor_launcher
+
+    def __release(self, lease_id: str) -> None:
+        """
+        Ends the given lease
+
+        :param lease_id: ID of the lease
+        :type lease_id: str
+        """
+        try:
+            requests.delete(f"{self.__url}/leases/{lease_id}", timeout=30)
+
+        except requests.exceptions.RequestException as exception:
+            # The Tor pool takes the Tor container back when the lease times out
+            self.__logger.warning("Could not release the Tor container: %s", exception)
+
+    def release(self, tor_launcher: TorLauncher) -> None:
+        """
+        Returns the given Tor container to the Tor pool
+
+        :param tor_launcher: Tor launcher returned by lease()
+        :type tor_launcher: TorLauncher
+        """
+        lease_id = self.__lease_ids.pop(tor_launcher, None)
+        if lease_id is not None:
+            self.__release(lease_id)
+
+    def close(self) -> None:
+        """
+        Returns the leased Tor containers and closes the connections to the Tor
+        containers
+        """
+        for tor_launcher in list(self.__lease_ids):
+            self.release(tor_launcher)
+
+        for tor_launcher in self.__tor_launchers.values():
+            tor_launcher.close()
+        self.__tor_launchers.clear()
@@ -1,10 +1,18 @@
-# pylint: disable=C0115,C0116,W0212
+# pylint: disable=C0115,C0116,W0212,W0621
 
 import pytest
 
 from captchamonitor.core.worker import Worker
-from captchamonitor.utils.models import FetchQueue, FetchCompleted, AnalyzeCompleted
+from captchamonitor.utils.models import (
+    Domain,
+    Fetcher,
+    MetaData,
+    FetchQueue,
+    FetchCompleted,
+    AnalyzeCompleted,
+)
 from captchamonitor.core.analyzer import Analyzer
+from captchamonitor.core.update_fetchers import UpdateFetchers
 
 
 @pytest.fixture()
@@ -82,7 +90,7 @@ class TestAnalyzer:
             config=config,
             db_session=db_session,
             loop=False,
-        ).process_next_batch_of_domains()
+        ).process_next_batch()
 
         assert db_session.query(AnalyzeCompleted).count() == 1
 
@@ -103,3 +111,140 @@ class TestAnalyzer:
 
         # Consensus Lite Captcha is not executed as site isn't suspicious
         assert db_session.query(AnalyzeCompleted).first().consensus_lite_captcha is None
+
+    @staticmethod
+    def test_analyzer_only_processes_new_fetches(config, db_session):
+        analyzer = Analyzer(
+            analyzer_id="0",
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+
+        # There is a single Tor fetch to analyze
+        assert analyzer.process_next_batch() == 1
+        assert analyzer.process_next_batch() == 0
+        assert db_session.query(AnalyzeCompleted).count() == 1
+
+        # The watermark doesn't move past the recent Tor fetch
+        watermark = (
+            db_session.query(MetaData)
+            .filter(MetaData.key == "analyzer_last_fetch_completed_id")
+            .one()
+        )
+        assert watermark.value == 0
+
+        # But it does once the Tor fetch is old enough
+        analyzer.watermark_delay = 0
+        db_session.query(AnalyzeCompleted).delete()
+        assert analyzer.process_next_batch() == 1
+        assert (
+            watermark.value
+            == db_session.query(AnalyzeCompleted).one().fetch_completed_id
+        )
+
+    @staticmethod
+    def test_analyzer_with_multiple_processes(config, db_session):
+        analyzer = Analyzer(
+            analyzer_id="0",
+            config=config,
+            db_session=db_session,
+            loop=False,
+            num_processes=2,
+        )
+
+        assert analyzer.process_next_batch() == 1
+        assert db_session.query(AnalyzeCompleted).count() == 1
+        assert db_session.query(AnalyzeCompleted).first().captcha_checker == 0
+
+    @staticmethod
+    def test_analyzer_rebuilds_keyword_matcher(config, db_session):
+        analyzer = Analyzer(
+            analyzer_id="0",
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+        keyword_matcher = analyzer.keyword_matcher
+
+        # The matcher isn't rebuilt while the match list stays the same
+        analyzer.process_next_batch()
+        assert analyzer.keyword_matcher is keyword_matcher
+
+        match_list = (
+            db_session.query(MetaData)
+            .filter(MetaData.key == "analyzer_match_list")
+            .one()
+        )
+        match_list.value = ["access denied", "unusual traffic"]
+        db_session.commit()
+
+        analyzer.process_next_batch()
+        assert analyzer.match_list == ["access denied", "unusual traffic"]
+        assert "unusual traffic" in analyzer.keyword_matcher.keywords
+        assert "captcha" in analyzer.keyword_matcher.keywords
+
+
+@pytest.fixture()
+def add_fetch(config, db_session):
+    UpdateFetchers(config=config, db_session=db_session)
+    db_session.add(
+        Domain(
+            domain="example.com",
+            supports_http=True,
+            supports_https=True,
+            supports_ftp=False,
+            supports_ipv4=True,
+            supports_ipv6=False,
+            requires_multiple_requests=False,
+        )
+    )
+    db_session.commit()
+
+    def add(fetch_id, uses_proxy_type):
+        # pylint: disable=W0143
+        fetcher_id = (
+            db_session.query(Fetcher.id)
+            .filter(Fetcher.uses_proxy_type == uses_proxy_type)
+            .first()[0]
+        )
+        db_session.add(
+            FetchCompleted(
+                id=fetch_id,
+                url="https://example.com",
+                captcha_monitor_version="0.0.0",
+                fetcher_id=fetcher_id,
+                domain_id=db_session.query(Domain.id).scalar(),
+                inline_html_data="<html><body>Example</body></html>",
+            )
+        )
+        db_session.commit()
+
+    return add
+
+
+class TestAnalyzerWatermark:
+    @staticmethod
+    def test_analyzer_processes_fetches_committed_out_of_order(
+        config, db_session, add_fetch
+    ):
+        analyzer = Analyzer(
+            analyzer_id="0",
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+        add_fetch(1, None)
+        add_fetch(3, "tor")
+
+        assert analyzer.process_next_batch() == 1
+
+        # Another worker commits a fetch with a lower ID after the analysis
+        add_fetch(2, "tor")
+
+        assert analyzer.process_next_batch() == 1
+        assert analyzer.process_next_batch() == 0
+        assert sorted(
+            analyzed.fetch_completed_id
+            for analyzed in db_session.query(AnalyzeCompleted)
+        ) == [2, 3]
@@ -0,0 +1,156 @@
+# pylint: disable=C0115,C0116,W0212
+
+import base64
+from datetime import datetime, timedelta
+
+import pytz
+
+from captchamonitor.utils.models import Consensus, RelaySnapshot
+from captchamonitor.utils.collector import Collector
+from captchamonitor.utils.relay_history import get_relay_snapshot
+from captchamonitor.core.backfill_relays import BackfillRelays
+from captchamonitor.utils.consensus_parser import (
+    FLAG_BITS,
+    ConsensusV3Parser,
+    encode_flags,
+)
+
+START_DATE = datetime(2021, 6, 1, 12)
+
+
+def write_consensus(consensus_dir, valid_after, relays):
+    lines = [
+        "network-status-version 3",
+        f"valid-after {valid_after:%Y-%m-%d %H:%M:%S}",
+        f"fresh-until {valid_after + timedelta(hours=1):%Y-%m-%d %H:%M:%S}",
+    ]
+    for i, (nickname, flags, bandwidth) in enumerate(relays):
+        identity = base64.b64encode(bytes([i]) * 20).decode().rstrip("=")
+        lines += [
+            f"r {nickname} {identity} digest 2021-06-01 11:00:00 127.0.0.1 9001 0",
+            f"s {flags}",
+            f"w Bandwidth={bandwidth}",
+        ]
+    lines += [
+        "directory-footer",
+        "bandwidth-weights Wed=5000 Wee=10000 Wgd=2500 Wgg=6000 Wmd=2500 "
+        "Wme=0 Wmg=4000 Wmm=10000",
+    ]
+    (consensus_dir / f"{valid_after:%Y-%m-%d-%H-%M-%S}-consensus").write_text(
+        "\n".join(lines) + "\n"
+    )
+
+
+class TestBackfillRelays:
+    relays = [
+        ("guardexit", "Exit Fast Guard Running Valid", 4000),
+        ("middle", "Fast Running Unknown Valid", 1000),
+    ]
+
+    def test_backfill_relays(self, config, db_session, tmp_path):
+        write_consensus(tmp_path, START_DATE, self.relays)
+        write_consensus(tmp_path, START_DATE + timedelta(hours=1), self.relays[:1])
+
+        BackfillRelays(
+            config=config,
+            db_session=db_session,
+            start_date=START_DATE,
+            end_date=START_DATE + timedelta(hours=1),
+            collector=Collector(str(tmp_path)),
+        )
+
+        consensuses = db_session.query(Consensus).order_by(Consensus.valid_after).all()
+        assert [c.valid_after for c in consensuses] == [
+            START_DATE.replace(tzinfo=pytz.utc),
+            START_DATE.replace(hour=13, tzinfo=pytz.utc),
+        ]
+        assert [c.relay_count for c in consensuses] == [2, 1]
+        assert consensuses[0].bandwidth_weights["Wgg"] == 6000
+
+        middle = db_session.query(RelaySnapshot).filter_by(nickname="middle").one()
+        assert middle.valid_from == START_DATE.replace(tzinfo=pytz.utc)
+        assert middle.valid_until == START_DATE.replace(hour=13, tzinfo=pytz.utc)
+        assert middle.ipv4_address == "127.0.0.1"
+        assert middle.bandwidth == 1000
+
+        # The flags that aren't known are left out of the stored bitmask
+        assert middle.flags == encode_flags(["Fast", "Running", "Valid"])
+        assert middle.flags & FLAG_BITS["Guard"] == 0
+
+        # The state of the other relay didn't change
+        assert db_session.query(RelaySnapshot).count() == 2
+
+        # The probabilities are the same as the ones calculated by the parser
+        parsed = ConsensusV3Parser(
+            str(tmp_path / "2021-06-01-12-00-00-consensus")
+        ).relay_entries
+        for relay in parsed:
+            snapshot = get_relay_snapshot(
+                db_session, relay.fingerprint, START_DATE.replace(minute=30)
+            )
+            assert snapshot["consensus_weight_fraction"] == (
+                relay.consensus_weight_fraction
+            )
+            assert snapshot["guard_probability"] == relay.guard_probability
+            assert snapshot["middle_probability"] == relay.middle_probability
+            assert snapshot["exit_probability"] == relay.exit_probability
+
+    def test_backfill_relays_resumes(self, config, db_session, tmp_path):
+        for hour in range(4):
+            write_consensus(tmp_path, START_DATE + timedelta(hours=hour), self.relays)
+
+        BackfillRelays(
+            config=config,
+            db_session=db_session,
+            start_date=START_DATE,
+            end_date=START_DATE,
+            collector=Collector(str(tmp_path)),
+        )
+
+        assert db_session.query(Consensus).count() == 1
+
+        BackfillRelays(
+            config=config,
+            db_session=db_session,
+            start_date=START_DATE,
+            end_date=START_DATE + timedelta(hours=3),
+            num_processes=2,
+            collector=Collector(str(tmp_path)),
+        )
+
+        assert db_session.query(Consensus).count() == 4
+        assert [
+            (snapshot.valid_from, snapshot.valid_until)
+            for snapshot in db_session.query(RelaySnapshot)
+        ] == [
+            (
+                START_DATE.replace(tzinfo=pytz.utc),
+                START_DATE.replace(hour=16, tzinfo=pytz.utc),
+            )
+        ] * 2
+
+    def test_backfill_relays_downloads_each_month_once(
+        self, config, db_session, tmp_path
+    ):
+        write_consensus(tmp_path, START_DATE, self.relays)
+        write_consensus(tmp_path, START_DATE + timedelta(hours=3), self.relays)
+
+        class OfflineCollector(Collector):
+            downloads = []
+
+            def download_consensus(self, consensus_date, end_date=None):
+                self.downloads.append((consensus_date, end_date))
+
+        BackfillRelays(
+            config=config,
+            db_session=db_session,
+            start_date=START_DATE,
+            end_date=START_DATE + timedelta(hours=3),
+            collector=OfflineCollector(str(tmp_path)),
+        )
+
+        # The missing hours are skipped after the month was downloaded once
+        assert OfflineCollector.downloads == [
+            (START_DATE + timedelta(hours=1), START_DATE + timedelta(hours=3))
+        ]
+        assert db_session.query(Consensus).count() == 2
@@ -0,0 +1,210 @@
+# pylint: disable=C0115,C0116,W0212,W0621
+
+import pytest
+from sqlalchemy import inspect
+
+from captchamonitor.utils.models import (
+    Blob,
+    Domain,
+    Fetcher,
+    BlobDictionary,
+    FetchCompleted,
+)
+from captchamonitor.utils.blob_store import BlobStore
+from captchamonitor.core.update_fetchers import UpdateFetchers
+
+
+@pytest.fixture()
+def domain_and_fetcher_ids(config, db_session):
+    UpdateFetchers(config=config, db_session=db_session)
+    db_session.add(
+        Domain(
+            domain="example.com",
+            supports_http=True,
+            supports_https=True,
+            supports_ftp=False,
+            supports_ipv4=True,
+            supports_ipv6=False,
+            requires_multiple_requests=False,
+        )
+    )
+    db_session.commit()
+
+    return db_session.query(Domain).one().id, db_session.query(Fetcher).first().id
+
+
+def html_page(i):
+    items = "".join(
+        f'<li class="item"><a href="/article/{i * 97 + j}">Article {j}</a></li>'
+        for j in range(30)
+    )
+    return f"<html><head><title>Page {i}</title></head><body><ul>{items}</ul></body></html>"
+
+
+class TestBlobStore:
+    @staticmethod
+    def test_blob_store_deduplicates(db_session):
+        blob_store = BlobStore(db_session)
+        html_data = html_page(0) * 10
+
+        blob_id = blob_store.put(html_data)
+        db_session.commit()
+
+        assert blob_store.put(html_data) == blob_id
+        assert blob_store.put(html_page(1)) != blob_id
+        assert blob_store.put(None) is None
+        assert db_session.query(Blob).count() == 2
+
+        blob = db_session.query(Blob).get(blob_id)
+        assert blob.content == html_data
+        assert blob.size == len(html_data)
+        assert len(blob.data) < blob.size
+
+        uncompressed, compressed = blob_store.size()
+        assert uncompressed == len(html_data) + len(html_page(1))
+        assert compressed < uncompressed
+
+    @staticmethod
+    def test_fetch_completed_reads_blobs(db_session, domain_and_fetcher_ids):
+        domain_id, fetcher_id = domain_and_fetcher_ids
+        blob_store = BlobStore(db_session)
+
+        db_session.add(
+            FetchCompleted(
+                url="https://example.com",
+                captcha_monitor_version="0.0.0",
+                domain_id=domain_id,
+                fetcher_id=fetcher_id,
+                html_data_blob_id=blob_store.put(html_page(0), domain_id),
+                http_requests_blob_id=blob_store.put('{"log": {}}', domain_id),
+            )
+        )
+        # Fetches completed before the blob table was used
+        db_session.add(
+            FetchCompleted(
+                url="https://example.com",
+                captcha_monitor_version="0.0.0",
+                domain_id=domain_id,
+                fetcher_id=fetcher_id,
+                inline_html_data=html_page(1),
+                inline_http_requests='{"log": {}}',
+            )
+        )
+        db_session.commit()
+
+        fetches = db_session.query(FetchCompleted).order_by(FetchCompleted.id).all()
+
+        assert fetches[0].html_data == html_page(0)
+        assert fetches[0].http_requests == '{"log": {}}'
+        assert fetches[1].html_data == html_page(1)
+        assert fetches[1].http_requests == '{"log": {}}'
+
+    @staticmethod
+    def test_fetch_completed_defers_bodies(db_session, domain_and_fetcher_ids):
+        domain_id, fetcher_id = domain_and_fetcher_ids
+        blob_store = BlobStore(db_session)
+
+        db_session.add(
+            FetchCompleted(
+                url="https://example.com",
+                captcha_monitor_version="0.0.0",
+                domain_id=domain_id,
+                fetcher_id=fetcher_id,
+                html_data_blob_id=blob_store.put(html_page(0), domain_id),
+                inline_http_requests='{"log": {}}',
+            )
+        )
+        db_session.commit()
+        db_session.expunge_all()
+
+        # The bodies aren't loaded by default
+        fetch = db_session.query(FetchCompleted).one()
+        unloaded = inspect(fetch).unloaded
+        assert "inline_html_data" in unloaded
+        assert "inline_http_requests" in unloaded
+        assert "ref_html_data_blob" in unloaded
+        db_session.expunge_all()
+
+        # Unless they are requested
+        fetch = (
+            db_session.query(FetchCompleted)
+            .options(*FetchCompleted.load_bodies())
+            .one()
+        )
+        unloaded = inspect(fetch).unloaded
+        assert "inline_html_data" not in unloaded
+        assert "inline_http_requests" not in unloaded
+        assert "data" not in inspect(fetch.ref_html_data_blob).unloaded
+        assert fetch.html_data == html_page(0)
+        assert fetch.http_requests == '{"log": {}}'
+
+    @staticmethod
+    def test_blob_store_trains_dictionaries(db_session, domain_and_fetcher_ids):
+        domain_id, fetcher_id = domain_and_fetcher_ids
+        num_samples = 32
+        blob_store = BlobStore(
+            db_session,
+            dictionary_samples=num_samples,
+            dictionary_size=4096,
+            dictionary_check_interval=0,
+        )
+
+        for i in range(num_samples * 2):
+            db_session.add(
+                FetchCompleted(
+                    url="https://example.com",
+                    captcha_monitor_version="0.0.0",
+                    domain_id=domain_id,
+                    fetcher_id=fetcher_id,
+                    html_data_blob_id=blob_store.put(html_page(i), domain_id),
+                )
+            )
+            db_session.commit()
+
+        dictionary = db_session.query(BlobDictionary).one()
+        assert dictionary.domain_id == domain_id
+
+        # The bodies stored after the training are compressed with the dictionary
+        blobs = db_session.query(Blob).order_by(Blob.id).all()
+        assert blobs[0].dictionary_id is None
+        assert blobs[-1].dictionary_id == dictionary.id
+
+        fetches = db_session.query(FetchCompleted).order_by(FetchCompleted.id).all()
+        assert [fetch.html_data for fetch in fetches] == [
+            html_page(i) for i in range(num_samples * 2)
+        ]
+
+    @staticmethod
+    def test_blob_store_training_keeps_transaction(db_session, domain_and_fetcher_ids):
+        domain_id, fetcher_id = domain_and_fetcher_ids
+        num_samples = 8
+        blob_store = BlobStore(
+            db_session,
+            dictionary_samples=num_samples,
+            dictionary_size=4096,
+        )
+
+        for i in range(num_samples):
+            db_session.add(
+                FetchCompleted(
+                    url="https://example.com",
+                    captcha_monitor_version="0.0.0",
+                    domain_id=domain_id,
+                    fetcher_id=fetcher_id,
+                    inline_html_data=html_page(i),
+                    html_data_blob_id=blob_store.put(html_page(i)),
+                )
+            )
+        db_session.commit()
+
+        # The second body of a result triggers the training of the dictionary
+        blob_ids = [
+            blob_store.put(html_page(num_samples)),
+            blob_store.put(html_page(num_samples + 1), domain_id),
+        ]
+        assert db_session.query(BlobDictionary).count() == 1
+
+        # The training didn't commit the first body of the result
+        db_session.rollback()
+        assert db_session.query(Blob).filter(Blob.id.in_(blob_ids)).count() == 0
+        assert db_session.query(BlobDictionary).count() == 0
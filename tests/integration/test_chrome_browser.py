@@ -2,6 +2,7 @@
 
 import pytest
 
+from captchamonitor.fetchers.session_pool import SessionPool
 from captchamonitor.fetchers.chrome_browser import ChromeBrowser
 
 
@@ -62,3 +63,50 @@ class TestChromeBrowser:
         assert http_proxy[0] in chrome_browser.page_source
 
         chrome_browser.close()
+
+    def test_chrome_browser_session_reset_clears_other_domains(self, config):
+        session_pool = SessionPool(max_uses=2)
+
+        # Store a cookie and some data for the first domain
+        chrome_browser_1 = ChromeBrowser(
+            config=config,
+            url=self.target_url,
+            explicit_wait_duration=0,
+            session_pool=session_pool,
+        )
+        chrome_browser_1.setup()
+        chrome_browser_1.connect()
+        chrome_browser_1.fetch()
+        chrome_browser_1.driver.add_cookie({"name": "cm_test", "value": "1"})
+        chrome_browser_1.driver.execute_script("localStorage.setItem('cm_test', '1');")
+
+        # Leave the first domain, like a redirect would
+        chrome_browser_1.driver.get("https://www.torproject.org/")
+        chrome_browser_1.close()
+
+        # Reuse the session for the second domain
+        chrome_browser_2 = ChromeBrowser(
+            config=config,
+            url="https://www.torproject.org/",
+            explicit_wait_duration=0,
+            session_pool=session_pool,
+        )
+        chrome_browser_2.setup()
+        chrome_browser_2.connect()
+        chrome_browser_2.fetch()
+
+        assert chrome_browser_2._is_session_reused
+
+        # The data of the first domain should be gone too
+        chrome_browser_2.driver.get(self.target_url)
+        assert "cm_test" not in [
+            cookie["name"] for cookie in chrome_browser_2.driver.get_cookies()
+        ]
+        assert (
+            chrome_browser_2.driver.execute_script(
+                "return localStorage.getItem('cm_test');"
+            )
+            is None
+        )
+
+        chrome_browser_2.close()
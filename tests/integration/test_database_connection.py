@@ -1,6 +1,7 @@
 # pylint: disable=C0115,C0116,W0212
 
 import pytest
+from sqlalchemy import inspect
 
 from captchamonitor.utils.database import Database
 from captchamonitor.utils.exceptions import DatabaseInitError
@@ -21,3 +22,49 @@ class TestDatabaseConnection:
     def test_connection_with_wrong_credentials():
         with pytest.raises(DatabaseInitError):
             Database("db_host", 1231, "db_name", "db_user", "db_password")
+
+    @staticmethod
+    def test_add_missing_columns(config):
+        database = Database(
+            config["db_host"],
+            config["db_port"],
+            config["db_name"],
+            config["db_user"],
+            config["db_password"],
+        )
+        database.engine.execute("ALTER TABLE relay DROP COLUMN exit_probability")
+
+        # Should add the dropped column back
+        database = Database(
+            config["db_host"],
+            config["db_port"],
+            config["db_name"],
+            config["db_user"],
+            config["db_password"],
+        )
+        columns = inspect(database.engine).get_columns("relay")
+
+        assert "exit_probability" in [column["name"] for column in columns]
+
+    @staticmethod
+    def test_add_missing_indexes(config):
+        database = Database(
+            config["db_host"],
+            config["db_port"],
+            config["db_name"],
+            config["db_user"],
+            config["db_password"],
+        )
+        database.engine.execute("DROP INDEX ix_fetch_queue_unclaimed")
+
+        # Should add the dropped index back
+        database = Database(
+            config["db_host"],
+            config["db_port"],
+            config["db_name"],
+            config["db_user"],
+            config["db_password"],
+        )
+        indexes = inspect(database.engine).get_indexes("fetch_queue")
+
+        assert "ix_fetch_queue_unclaimed" in [index["name"] for index in indexes]
@@ -2,6 +2,7 @@
 
 import pytest
 
+from captchamonitor.fetchers.session_pool import SessionPool
 from captchamonitor.fetchers.firefox_browser import FirefoxBrowser
 
 
@@ -62,3 +63,107 @@ class TestFirefoxBrowser:
         assert http_proxy[0] in firefox_browser.page_source
 
         firefox_browser.close()
+
+    def test_firefox_browser_session_reuse(self, config):
+        session_pool = SessionPool(max_uses=2)
+
+        firefox_browser_1 = FirefoxBrowser(
+            config=config,
+            url=self.target_url,
+            explicit_wait_duration=0,
+            session_pool=session_pool,
+        )
+        firefox_browser_1.setup()
+        firefox_browser_1.connect()
+        firefox_browser_1.fetch()
+        session_id = firefox_browser_1.driver.session_id
+        firefox_browser_1.close()
+
+        assert len(session_pool) == 1
+
+        firefox_browser_2 = FirefoxBrowser(
+            config=config,
+            url=self.target_url,
+            explicit_wait_duration=0,
+            session_pool=session_pool,
+        )
+        firefox_browser_2.setup()
+        firefox_browser_2.connect()
+
+        assert len(session_pool) == 0
+        assert firefox_browser_2.driver.session_id == session_id
+        assert firefox_browser_2.driver.get_cookies() == []
+
+        firefox_browser_2.fetch()
+
+        assert "Sorry. You are not using Tor." in firefox_browser_2.page_source
+
+        # The session reached the maximum number of uses and should be recycled
+        firefox_browser_2.close()
+
+        assert len(session_pool) == 0
+
+    def test_firefox_browser_network_idle(self, config):
+        firefox_browser = FirefoxBrowser(
+            config=config,
+            url=self.target_url,
+            explicit_wait_duration=30,
+            network_idle_duration=1,
+        )
+
+        firefox_browser.setup()
+        firefox_browser.connect()
+        firefox_browser.fetch()
+
+        # The page is static, so it shouldn't need the whole explicit wait
+        assert 1 <= firefox_browser.waited_duration < 30
+        assert "Sorry. You are not using Tor." in firefox_browser.page_source
+
+        firefox_browser.close()
+
+    def test_firefox_browser_session_reset_clears_other_domains(self, config):
+        session_pool = SessionPool(max_uses=2)
+
+        # Store a cookie and some data for the first domain
+        firefox_browser_1 = FirefoxBrowser(
+            config=config,
+            url=self.target_url,
+            explicit_wait_duration=0,
+            session_pool=session_pool,
+        )
+        firefox_browser_1.setup()
+        firefox_browser_1.connect()
+        firefox_browser_1.fetch()
+        firefox_browser_1.driver.add_cookie({"name": "cm_test", "value": "1"})
+        firefox_browser_1.driver.execute_script("localStorage.setItem('cm_test', '1');")
+
+        # Leave the first domain, like a redirect would
+        firefox_browser_1.driver.get("https://www.torproject.org/")
+        firefox_browser_1.close()
+
+        # Reuse the session for the second domain
+        firefox_browser_2 = FirefoxBrowser(
+            config=config,
+            url="https://www.torproject.org/",
+            explicit_wait_duration=0,
+            session_pool=session_pool,
+        )
+        firefox_browser_2.setup()
+        firefox_browser_2.connect()
+        firefox_browser_2.fetch()
+
+        assert firefox_browser_2._is_session_reused
+
+        # The data of the first domain should be gone too
+        firefox_browser_2.driver.get(self.target_url)
+        assert "cm_test" not in [
+            cookie["name"] for cookie in firefox_browser_2.driver.get_cookies()
+        ]
+        assert (
+            firefox_browser_2.driver.execute_script(
+                "return localStorage.getItem('cm_test');"
+            )
+            is None
+        )
+
+        firefox_browser_2.close()
@@ -0,0 +1,167 @@
+# pylint: disable=C0115,C0116,W0212
+
+import pytest
+from sqlalchemy import event
+
+from captchamonitor.core.worker import claim_jobs
+from captchamonitor.utils.models import (
+    Proxy,
+    Relay,
+    Domain,
+    Fetcher,
+    FetchQueue,
+    FetchCompleted,
+)
+from captchamonitor.core.analyzer import Analyzer
+from captchamonitor.core.update_fetchers import UpdateFetchers
+
+
+@pytest.fixture()
+def populated_tables(config, db_session):
+    # pylint: disable=C0121
+    UpdateFetchers(config=config, db_session=db_session)
+    db_session.add(Relay(fingerprint="A" * 40))
+    db_session.add(
+        Proxy(host="127.0.0.1", port=8080, country="US", anonymity="x", ssl=True)
+    )
+    for i in range(20):
+        db_session.add(
+            Domain(
+                domain=f"example{i}.com",
+                supports_http=True,
+                supports_https=True,
+                supports_ftp=False,
+                supports_ipv4=True,
+                supports_ipv6=False,
+                requires_multiple_requests=False,
+            )
+        )
+    db_session.commit()
+
+    non_tor_id = (
+        db_session.query(Fetcher.id).filter(Fetcher.uses_proxy_type == None).first()[0]
+    )
+    proxy_fetcher_id = (
+        db_session.query(Fetcher.id)
+        .filter(Fetcher.uses_proxy_type == "http")
+        .first()[0]
+    )
+    tor_id = (
+        db_session.query(Fetcher.id).filter(Fetcher.uses_proxy_type == "tor").first()[0]
+    )
+    relay_id = db_session.query(Relay.id).scalar()
+    proxy_id = db_session.query(Proxy.id).scalar()
+
+    fetches = []
+    for (domain_id,) in db_session.query(Domain.id):
+        fetch = {
+            "url": "https://example.com",
+            "captcha_monitor_version": "0.0.0",
+            "domain_id": domain_id,
+            "inline_html_data": "<html><body>Example</body></html>",
+        }
+        for _ in range(5):
+            fetches.append(dict(fetch, fetcher_id=non_tor_id))
+            fetches.append(dict(fetch, fetcher_id=proxy_fetcher_id, proxy_id=proxy_id))
+            fetches.append(dict(fetch, fetcher_id=tor_id, relay_id=relay_id))
+    db_session.bulk_insert_mappings(FetchCompleted, fetches)
+
+    db_session.bulk_insert_mappings(
+        FetchQueue,
+        [
+            {"url": "https://example.com", "domain_id": 1, "fetcher_id": non_tor_id}
+            for _ in range(100)
+        ],
+    )
+    db_session.commit()
+    db_session.execute("ANALYZE")
+    db_session.commit()
+
+
+def capture_statements(db_session, func):
+    statements = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        # pylint: disable=W0613,R0913
+        if not executemany:
+            statements.append((statement, parameters))
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return statements
+
+
+def explain(db_session, statements, table):
+    # Sequential scans are cheaper than any index on tables this small, disable
+    # them to see which index the planner would use on a large table
+    cursor = db_session.connection().connection.cursor()
+    cursor.execute("SET enable_seqscan = off")
+
+    plans = []
+    for statement, parameters in statements:
+        if f"FROM {table}" in statement and not statement.startswith("INSERT"):
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            plans.append("\n".join(row[0] for row in cursor.fetchall()))
+
+    cursor.execute("RESET enable_seqscan")
+    return plans
+
+
+def uses_index(db_session, plan, index_name):
+    # The partitions of a partitioned table have their own copies of its indexes
+    index_names = [index_name] + [
+        name
+        for (name,) in db_session.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits "
+            "WHERE inhparent = to_regclass(:index_name)",
+            {"index_name": index_name},
+        )
+    ]
+    return any(f" {name} " in plan for name in index_names)
+
+
+@pytest.mark.usefixtures("populated_tables")
+class TestQueryPlans:
+    @staticmethod
+    def test_claim_jobs_uses_indexes(db_session):
+        statements = capture_statements(
+            db_session, lambda: claim_jobs(db_session, "0", 10)
+        )
+        plans = explain(db_session, statements, "fetch_queue")
+
+        assert len(plans) == 1
+        assert uses_index(db_session, plans[0], "ix_fetch_queue_unclaimed")
+        assert "Seq Scan on fetch_queue" not in plans[0]
+
+        plan = explain(
+            db_session,
+            [
+                (
+                    "SELECT id FROM fetch_queue WHERE claimed_by = %(claimed_by)s",
+                    {"claimed_by": "0"},
+                )
+            ],
+            "fetch_queue",
+        )[0]
+        assert uses_index(db_session, plan, "ix_fetch_queue_claimed_by")
+
+    @staticmethod
+    def test_analyzer_uses_indexes(config, db_session):
+        analyzer = Analyzer(
+            analyzer_id="0", config=config, db_session=db_session, loop=False
+        )
+
+        statements = capture_statements(db_session, analyzer.process_next_batch)
+        plans = "\n".join(explain(db_session, statements, "fetch_completed"))
+
+        assert uses_index(db_session, plans, "ix_analyze_completed_fetch_completed_id")
+        assert uses_index(db_session, plans, "ix_fetch_completed_domain_id_id")
+        assert uses_index(db_session, plans, "ix_fetch_completed_domain_id_proxy_id_id")
+        assert "Seq Scan on fetch_completed" not in plans
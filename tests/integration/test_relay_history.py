@@ -0,0 +1,139 @@
+# pylint: disable=C0115,C0116,W0212
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from captchamonitor.utils.models import Consensus, RelaySnapshot
+from captchamonitor.utils.relay_history import record_consensus, get_relay_snapshot
+from captchamonitor.utils.consensus_parser import encode_flags
+
+START_DATE = datetime(2021, 6, 1, 12, tzinfo=pytz.utc)
+GUARD_FLAGS = encode_flags(["Fast", "Guard", "Running", "Valid"])
+
+
+def make_consensus(hour, relays):
+    """
+    Creates a consensus with the given (fingerprint, flags, bandwidth) relays
+    """
+    return {
+        "valid_after": START_DATE + timedelta(hours=hour),
+        "fresh_until": START_DATE + timedelta(hours=hour + 1),
+        "bandwidth_weights": {
+            "Wgg": 6000,
+            "Wgd": 2500,
+            "Wmg": 4000,
+            "Wmm": 10000,
+            "Wme": 0,
+            "Wmd": 2500,
+            "Wee": 10000,
+            "Wed": 5000,
+        },
+        "weight_totals": {
+            "consensus_weight_total": 4000.0,
+            "guard_weight_total": 2400.0,
+            "middle_weight_total": 1600.0,
+            "exit_weight_total": 0.0,
+        },
+        "relays": [
+            {
+                "fingerprint": fingerprint,
+                "nickname": fingerprint.lower(),
+                "ipv4_address": "127.0.0.1",
+                "ipv6_address": None,
+                "flags": flags,
+                "bandwidth": bandwidth,
+            }
+            for fingerprint, flags, bandwidth in relays
+        ],
+    }
+
+
+def get_intervals(db_session, fingerprint):
+    return [
+        (
+            int((snapshot.valid_from - START_DATE).total_seconds() // 3600),
+            int((snapshot.valid_until - START_DATE).total_seconds() // 3600),
+            snapshot.bandwidth,
+        )
+        for snapshot in db_session.query(RelaySnapshot)
+        .filter_by(fingerprint=fingerprint)
+        .order_by(RelaySnapshot.valid_from)
+    ]
+
+
+class TestRelayHistory:
+    @staticmethod
+    def test_record_consensus_stores_changes(db_session):
+        bandwidths = [4000, 4000, 2000, 2000]
+        for hour, bandwidth in enumerate(bandwidths):
+            assert record_consensus(
+                db_session,
+                make_consensus(
+                    hour, [("A" * 40, GUARD_FLAGS, 4000), ("B" * 40, 0, bandwidth)]
+                ),
+            )
+
+        assert get_intervals(db_session, "A" * 40) == [(0, 4, 4000)]
+        assert get_intervals(db_session, "B" * 40) == [(0, 2, 4000), (2, 4, 2000)]
+        assert db_session.query(Consensus).count() == 4
+
+        # Recording a consensus again doesn't change anything
+        assert not record_consensus(
+            db_session, make_consensus(0, [("A" * 40, GUARD_FLAGS, 1)])
+        )
+        assert get_intervals(db_session, "A" * 40) == [(0, 4, 4000)]
+
+    @staticmethod
+    def test_record_consensus_out_of_order(db_session):
+        relays = [("A" * 40, GUARD_FLAGS, 4000), ("B" * 40, 0, 1000)]
+        for hour in [3, 0, 2, 1]:
+            record_consensus(db_session, make_consensus(hour, relays))
+
+        # The snapshots of the adjacent consensuses are merged
+        assert get_intervals(db_session, "A" * 40) == [(0, 4, 4000)]
+        assert get_intervals(db_session, "B" * 40) == [(0, 4, 1000)]
+
+        # The relay is missing from a consensus, and it changes after it
+        record_consensus(db_session, make_consensus(5, [("A" * 40, GUARD_FLAGS, 10)]))
+        record_consensus(db_session, make_consensus(6, relays))
+        record_consensus(db_session, make_consensus(4, relays[1:]))
+
+        assert get_intervals(db_session, "A" * 40) == [
+            (0, 4, 4000),
+            (5, 6, 10),
+            (6, 7, 4000),
+        ]
+        assert get_intervals(db_session, "B" * 40) == [(0, 5, 1000), (6, 7, 1000)]
+
+    @staticmethod
+    def test_get_relay_snapshot(db_session):
+        record_consensus(db_session, make_consensus(0, [("A" * 40, GUARD_FLAGS, 4000)]))
+        record_consensus(db_session, make_consensus(2, [("A" * 40, GUARD_FLAGS, 2000)]))
+
+        snapshot = get_relay_snapshot(
+            db_session, "A" * 40, START_DATE + timedelta(minutes=30)
+        )
+        assert snapshot["valid_after"] == START_DATE
+        assert snapshot["nickname"] == "a" * 40
+        assert snapshot["flags"] == GUARD_FLAGS
+        assert snapshot["consensus_weight_fraction"] == 1.0
+        assert snapshot["guard_probability"] == 1.0
+        assert snapshot["middle_probability"] == 1.0
+        assert snapshot["exit_probability"] == 0.0
+
+        # Naive dates are in UTC
+        snapshot = get_relay_snapshot(db_session, "A" * 40, datetime(2021, 6, 1, 14))
+        assert snapshot["bandwidth"] == 2000
+        assert snapshot["consensus_weight_fraction"] == 0.5
+
+        # The consensus or the relay wasn't recorded
+        assert (
+            get_relay_snapshot(db_session, "A" * 40, datetime(2021, 6, 1, 13)) is None
+        )
+        assert (
+            get_relay_snapshot(db_session, "A" * 40, datetime(2021, 6, 1, 11)) is None
+        )
+        assert (
+            get_relay_snapshot(db_session, "B" * 40, datetime(2021, 6, 1, 12)) is None
+        )
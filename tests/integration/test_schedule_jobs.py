@@ -2,7 +2,8 @@
 
 import pytest
 
-from captchamonitor.utils.models import FetchQueue
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.models import Relay, FetchQueue
 from captchamonitor.core.schedule_jobs import ScheduleJobs
 
 
@@ -24,3 +25,68 @@ class TestScheduleJobs:
 
         # Check if jobs are scheduled
         assert db_session.query(FetchQueue).count() > 5
+
+    @staticmethod
+    def test_schedule_jobs_skips_queued_jobs(config, db_session):
+        schedule_jobs = ScheduleJobs(
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+
+        num_jobs = schedule_jobs.schedule_next_batch()
+
+        assert num_jobs == db_session.query(FetchQueue).count()
+
+        # The same jobs are still in the queue, so nothing should be added
+        assert schedule_jobs.schedule_next_batch() == 0
+        assert db_session.query(FetchQueue).count() == num_jobs
+
+    @staticmethod
+    def test_schedule_jobs_max_queue_depth(config, db_session):
+        schedule_jobs = ScheduleJobs(
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+
+        assert schedule_jobs.schedule_next_batch(max_queue_depth=3) == 3
+        assert schedule_jobs.schedule_next_batch(max_queue_depth=3) == 0
+        assert db_session.query(FetchQueue).count() == 3
+
+        # Raising the limit fills the queue up to the new limit
+        assert schedule_jobs.schedule_next_batch(max_queue_depth=5) == 2
+        assert db_session.query(FetchQueue).count() == 5
+
+    @staticmethod
+    def test_schedule_jobs_relay_rotation(db_session):
+        # Rotation period is so short that the rotation is always behind schedule
+        config = Config()
+        config["relay_rotation_period"] = 0.000001
+
+        # Only the first relay would be picked if we were just using the weights
+        relays = [
+            Relay(fingerprint=f"{i:040d}", ipv4_exiting_allowed=True) for i in range(10)
+        ]
+        for i, relay in enumerate(relays):
+            relay.exit_probability = 1 if i == 0 else 0
+            db_session.add(relay)
+        db_session.commit()
+
+        schedule_jobs = ScheduleJobs(
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+        schedule_jobs.schedule_next_batch()
+
+        relay_ids = [
+            job.relay_id
+            for job in db_session.query(FetchQueue).filter(
+                FetchQueue.relay_id != None  # pylint: disable=C0121,W0143
+            )
+        ]
+
+        # Each Tor job should go through a different exit relay
+        assert len(relay_ids) > 1
+        assert len(set(relay_ids)) == len(relay_ids)
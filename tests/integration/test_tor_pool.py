@@ -0,0 +1,42 @@
+# pylint: disable=C0115,C0116,W0212,W0621
+
+import pytest
+
+from captchamonitor.core.tor_pool import TorPool
+from captchamonitor.utils.exceptions import TorPoolLeaseError
+from captchamonitor.utils.small_scripts import deep_copy
+from captchamonitor.utils.tor_pool_client import TorPoolClient
+
+
+@pytest.fixture()
+def tor_pool_config(config):
+    test_config = deep_copy(config)
+    test_config["tor_pool_url"] = "http://127.0.0.1:0"
+
+    tor_pool = TorPool(test_config, size=1, loop=False)
+    test_config["tor_pool_url"] = f"http://127.0.0.1:{tor_pool.port}"
+
+    yield test_config
+
+    tor_pool.close()
+
+
+class TestTorPool:
+    @staticmethod
+    def test_tor_pool_lease(tor_pool_config):
+        client = TorPoolClient(tor_pool_config, timeout=300)
+
+        try:
+            tor_launcher = client.lease()
+            assert tor_launcher.is_healthy()
+
+            # The only Tor container is leased already
+            with pytest.raises(TorPoolLeaseError):
+                TorPoolClient(tor_pool_config, timeout=1).lease()
+
+            # The connection to the Tor container is kept between the leases
+            client.release(tor_launcher)
+            assert client.lease() is tor_launcher
+
+        finally:
+            client.close()
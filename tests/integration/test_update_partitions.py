@@ -0,0 +1,201 @@
+# pylint: disable=C0115,C0116,E1101,W0212,W0621
+
+from datetime import datetime
+
+import pytz
+import pytest
+
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.models import (
+    Blob,
+    Domain,
+    Fetcher,
+    FetchFailed,
+    FetchCompleted,
+)
+from captchamonitor.utils.partitions import (
+    add_months,
+    get_partitions,
+    partition_name,
+    create_partitions,
+    supports_partitioning,
+)
+from captchamonitor.core.update_fetchers import UpdateFetchers
+from captchamonitor.core.update_partitions import UpdatePartitions
+
+
+@pytest.fixture()
+def connection(db_session):
+    with db_session.get_bind().connect() as connection_local:
+        if not supports_partitioning(connection_local):
+            pytest.skip("Partitioning requires PostgreSQL 11 or later")
+        yield connection_local
+
+
+@pytest.fixture()
+def add_failed_fetch(config, db_session):
+    UpdateFetchers(config=config, db_session=db_session)
+    db_session.add(
+        Domain(
+            domain="example.com",
+            supports_http=True,
+            supports_https=True,
+            supports_ftp=False,
+            supports_ipv4=True,
+            supports_ipv6=False,
+            requires_multiple_requests=False,
+        )
+    )
+    db_session.commit()
+
+    def add(month):
+        db_session.add(
+            FetchFailed(
+                url="https://example.com",
+                captcha_monitor_version="0.0.0",
+                domain_id=db_session.query(Domain).one().id,
+                fetcher_id=db_session.query(Fetcher).first().id,
+                created_at=datetime(month.year, month.month, 15, tzinfo=pytz.utc),
+            )
+        )
+        db_session.commit()
+
+    return add
+
+
+def add_blob(db_session, name, month, fetch_month=None):
+    """
+    Adds a blob created in the given month, and a fetch that uses it in
+    fetch_month unless it is None
+    """
+    created_at = datetime(month.year, month.month, 15, tzinfo=pytz.utc)
+    blob = Blob(sha256=name, size=1, data=b"", created_at=created_at)
+    db_session.add(blob)
+    db_session.flush()
+
+    if fetch_month is not None:
+        db_session.add(
+            FetchCompleted(
+                url="https://example.com",
+                captcha_monitor_version="0.0.0",
+                domain_id=db_session.query(Domain).one().id,
+                fetcher_id=db_session.query(Fetcher).first().id,
+                html_data_blob_id=blob.id,
+                created_at=datetime(
+                    fetch_month.year, fetch_month.month, 15, tzinfo=pytz.utc
+                ),
+            )
+        )
+    db_session.commit()
+
+
+def count_rows(connection, table_name):
+    return connection.execute(f"SELECT count(*) FROM {table_name}").scalar()
+
+
+class TestUpdatePartitions:
+    @staticmethod
+    def test_update_partitions_creates_partitions(config, db_session, connection):
+        today = datetime.now(pytz.utc).date()
+
+        UpdatePartitions(config=config, db_session=db_session, months_ahead=4)
+
+        partitions = get_partitions(connection, FetchFailed.__tablename__)
+        for i in range(4):
+            month = add_months(today, i)
+            assert partitions[partition_name(FetchFailed.__tablename__, month)] == month
+
+    @staticmethod
+    def test_create_partitions_moves_rows_from_default(
+        db_session, connection, add_failed_fetch
+    ):
+        month = add_months(datetime.now(pytz.utc).date(), 6)
+        name = partition_name(FetchFailed.__tablename__, month)
+
+        # The partition doesn't exist yet, so the row goes to the default partition
+        add_failed_fetch(month)
+        assert count_rows(connection, "fetch_failed_default") == 1
+
+        assert create_partitions(connection, FetchFailed.__table__, month, 1) == [name]
+        assert count_rows(connection, "fetch_failed_default") == 0
+        assert count_rows(connection, name) == 1
+        assert db_session.query(FetchFailed).count() == 1
+
+    @staticmethod
+    def test_update_partitions_archives_old_partitions(
+        db_session, connection, add_failed_fetch
+    ):
+        config = Config()
+        config["db_retention_months"] = "3"
+        config["db_retention_archive_schema"] = "archive"
+        today = datetime.now(pytz.utc).date()
+        old_month = add_months(today, -3)
+        kept_month = add_months(today, -2)
+        old_name = partition_name(FetchFailed.__tablename__, old_month)
+
+        create_partitions(connection, FetchFailed.__table__, old_month, 2)
+        add_failed_fetch(old_month)
+        add_failed_fetch(kept_month)
+
+        UpdatePartitions(config=config, db_session=db_session)
+
+        partitions = get_partitions(connection, FetchFailed.__tablename__)
+        assert old_name not in partitions
+        assert partition_name(FetchFailed.__tablename__, kept_month) in partitions
+        assert db_session.query(FetchFailed).count() == 1
+        assert count_rows(connection, f"archive.{old_name}") == 1
+
+    @staticmethod
+    def test_update_partitions_drops_old_partitions(
+        db_session, connection, add_failed_fetch
+    ):
+        config = Config()
+        config["db_retention_months"] = "1"
+        config["db_retention_archive_schema"] = ""
+        old_month = add_months(datetime.now(pytz.utc).date(), -1)
+        old_name = partition_name(FetchFailed.__tablename__, old_month)
+
+        create_partitions(connection, FetchFailed.__table__, old_month, 1)
+        add_failed_fetch(old_month)
+
+        # Goes to the default partition since its partition doesn't exist
+        add_failed_fetch(add_months(old_month, -12))
+
+        UpdatePartitions(config=config, db_session=db_session)
+
+        assert old_name not in get_partitions(connection, FetchFailed.__tablename__)
+        assert db_session.query(FetchFailed).count() == 0
+        assert (
+            connection.execute("SELECT to_regclass(%s)", f"archive.{old_name}").scalar()
+            is None
+        )
+
+    @staticmethod
+    @pytest.mark.parametrize("archive_schema", ["", "archive"])
+    def test_update_partitions_deletes_orphaned_blobs(
+        db_session, connection, add_failed_fetch, archive_schema
+    ):
+        config = Config()
+        config["db_retention_months"] = "1"
+        config["db_retention_archive_schema"] = archive_schema
+        today = datetime.now(pytz.utc).date()
+        old_month = add_months(today, -1)
+
+        create_partitions(connection, FetchCompleted.__table__, old_month, 2)
+        add_failed_fetch(today)
+
+        add_blob(db_session, "orphaned", old_month)
+        add_blob(db_session, "old_fetch", old_month, old_month)
+        add_blob(db_session, "new_fetch", old_month, today)
+        add_blob(db_session, "new", today)
+
+        UpdatePartitions(config=config, db_session=db_session)
+
+        # The blob of the archived fetch is still used by it
+        kept = (
+            {"old_fetch", "new_fetch", "new"}
+            if archive_schema
+            else {"new_fetch", "new"}
+        )
+        assert {blob.sha256 for blob in db_session.query(Blob)} == kept
+        assert db_session.query(FetchCompleted).count() == 1
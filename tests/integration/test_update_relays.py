@@ -1,11 +1,12 @@
 # pylint: disable=C0115,C0116,W0212
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import pytz
 from freezegun import freeze_time
 
 from captchamonitor.utils.models import Relay
-from captchamonitor.utils.onionoo import Onionoo
+from captchamonitor.utils.onionoo import Onionoo, OnionooRelayEntry
 from captchamonitor.core.update_relays import UpdateRelays
 from captchamonitor.utils.consensus_parser import ConsensusRelayEntry
 
@@ -92,3 +93,56 @@ class TestUpdateRelays:
         # Make sure there still only one relay
         assert db_relay_query.count() == 1
         assert db_relay_query.first().fingerprint == self.csailmitexit_fpr
+
+    def test_insert_batch_into_db_upserts_relays(self, config, db_session):
+        update_relays = UpdateRelays(
+            config=config, db_session=db_session, auto_update=False
+        )
+        fingerprints = [f"{i:040d}" for i in range(3)]
+        parsed_consensus = {fpr: self.consensus_relay_entry for fpr in fingerprints}
+
+        def onionoo_entry(fingerprint, nickname):
+            return OnionooRelayEntry(
+                fingerprint=fingerprint,
+                ipv4_exiting_allowed=True,
+                ipv6_exiting_allowed=False,
+                country="us",
+                country_name="United States of America",
+                continent="America",
+                nickname=nickname,
+                first_seen=None,
+                last_seen=None,
+                version="0.4.5.7",
+                asn=None,
+                asn_name=None,
+                platform=None,
+                exit_policy_summary=None,
+                exit_policy_v6_summary=None,
+            )
+
+        first_update = datetime.now(pytz.utc)
+        update_relays._UpdateRelays__insert_batch_into_db(
+            [onionoo_entry(fpr, "first") for fpr in fingerprints],
+            parsed_consensus,
+            first_update,
+            chunk_size=2,
+        )
+
+        # Only the first two relays are in the next consensus
+        second_update = first_update + timedelta(hours=1)
+        update_relays._UpdateRelays__insert_batch_into_db(
+            [onionoo_entry(fpr, "second") for fpr in fingerprints[:2]],
+            parsed_consensus,
+            second_update,
+        )
+        update_relays._UpdateRelays__mark_offline_relays(second_update)
+
+        relays = {relay.fingerprint: relay for relay in db_session.query(Relay)}
+        assert len(relays) == 3
+        for fingerprint in fingerprints[:2]:
+            assert relays[fingerprint].nickname == "second"
+            assert relays[fingerprint].status
+            assert relays[fingerprint].created_at == first_update
+            assert relays[fingerprint].updated_at == second_update
+        assert relays[fingerprints[2]].nickname == "first"
+        assert not relays[fingerprints[2]].status
@@ -1,9 +1,19 @@
 # pylint: disable=C0115,C0116,W0212
 
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+import port_for
+from sqlalchemy import event
 
-from captchamonitor.core.worker import Worker
+from captchamonitor.core.worker import Worker, claim_jobs
 from captchamonitor.utils.models import FetchQueue, FetchFailed, FetchCompleted
+from captchamonitor.utils.database import Database
+from captchamonitor.utils.tor_pool_client import TorPoolClient
+
+logger = logging.getLogger(__name__)
 
 
 @pytest.mark.usefixtures("insert_domains_fetchers_relays_proxies")
@@ -142,6 +152,38 @@ class TestWorker:
         assert db_job.count() != 0
         assert db_job.first().url == "https://stupid.urlextension"
 
+    @staticmethod
+    def test_worker_puts_job_back_without_tor_container(
+        config, db_session, firefox_tor_proxy_id
+    ):
+        config["tor_pool_url"] = f"http://127.0.0.1:{port_for.select_random()}"
+        worker = Worker(
+            worker_id="0",
+            config=config,
+            db_session=db_session,
+            loop=False,
+        )
+        worker._Worker__tor_pool = TorPoolClient(config, timeout=0)
+
+        # Insert a job
+        db_session.add(
+            FetchQueue(
+                url="https://check.torproject.org",
+                fetcher_id=firefox_tor_proxy_id,
+                domain_id=1,
+                relay_id=1,
+                options={"explicit_wait_duration": 0},
+            )
+        )
+        db_session.commit()
+
+        # The Tor pool isn't running, so the job isn't fetched
+        assert worker.process_next_job() is False
+
+        # The job is back in the queue instead of being recorded as failed
+        assert db_session.query(FetchFailed).count() == 0
+        assert db_session.query(FetchQueue).one().claimed_by is None
+
     @staticmethod
     def test_worker_no_job_in_queue(config, db_session):
         worker = Worker(
@@ -153,3 +195,150 @@ class TestWorker:
 
         # Process the job, shouldn't rise any errors
         worker.process_next_job()
+
+    @staticmethod
+    def test_claim_jobs_batch(db_session, firefox_id):
+        for i in range(5):
+            db_session.add(
+                FetchQueue(
+                    url=f"https://check.torproject.org/{i}",
+                    fetcher_id=firefox_id,
+                    domain_id=1,
+                )
+            )
+        db_session.commit()
+
+        jobs = claim_jobs(db_session, "0", batch_size=3)
+        assert [job.url for job in jobs] == [
+            f"https://check.torproject.org/{i}" for i in range(3)
+        ]
+        assert all(job.claimed_by == "0" for job in jobs)
+
+        # The remaining jobs should go to the next worker
+        jobs = claim_jobs(db_session, "1", batch_size=3)
+        assert len(jobs) == 2
+        assert all(job.claimed_by == "1" for job in jobs)
+
+        # Nothing left to claim
+        assert claim_jobs(db_session, "2", batch_size=3) == []
+
+    @staticmethod
+    def test_claim_jobs_concurrently(config, db_session, firefox_id):
+        # pylint: disable=R0914
+        num_jobs = 200
+        batch_size = 5
+        round_trip_delay = 0.01
+
+        db_session.bulk_save_objects(
+            [
+                FetchQueue(
+                    url="https://check.torproject.org",
+                    fetcher_id=firefox_id,
+                    domain_id=1,
+                )
+                for _ in range(num_jobs)
+            ]
+        )
+        db_session.commit()
+        job_ids = sorted(job_id for (job_id,) in db_session.query(FetchQueue.id))
+
+        database = Database(
+            config["db_host"],
+            config["db_port"],
+            config["db_name"],
+            config["db_user"],
+            config["db_password"],
+        )
+
+        # The workers run on other hosts than the database, so each round trip
+        # takes a while and the claims of the workers overlap. The claimed rows
+        # stay locked until the commit, so a claim that waited on another
+        # worker's locks would fail with the lock timeout.
+        def delay_round_trip(*_):
+            time.sleep(round_trip_delay)
+
+        def set_lock_timeout(dbapi_connection, _):
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute("SET lock_timeout = '5ms'")
+
+        def claim_until_empty(worker_id):
+            session = database.session()
+            claimed_ids = []
+            while True:
+                jobs = claim_jobs(session, worker_id, batch_size)
+                if len(jobs) == 0:
+                    break
+                claimed_ids += [job.id for job in jobs]
+            session.close()
+            return claimed_ids
+
+        listeners = [
+            ("connect", set_lock_timeout),
+            ("before_cursor_execute", delay_round_trip),
+            ("commit", delay_round_trip),
+        ]
+        for name, listener in listeners:
+            event.listen(database.engine, name, listener)
+
+        try:
+            throughputs = {}
+            for num_workers in [1, 2, 4]:
+                # Put all jobs back into the queue
+                db_session.query(FetchQueue).update({FetchQueue.claimed_by: None})
+                db_session.commit()
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                    results = list(
+                        executor.map(claim_until_empty, map(str, range(num_workers)))
+                    )
+                throughputs[num_workers] = num_jobs / (time.perf_counter() - start)
+
+                # Every job must be claimed exactly once
+                assert sorted(sum(results, [])) == job_ids
+                if num_workers > 1:
+                    assert all(len(claimed_ids) > 0 for claimed_ids in results)
+
+                logger.info(
+                    "%s workers claimed %.0f jobs/s, %.2fx of a single worker",
+                    num_workers,
+                    throughputs[num_workers],
+                    throughputs[num_workers] / throughputs[1],
+                )
+
+        finally:
+            for name, listener in listeners:
+                event.remove(database.engine, name, listener)
+            database.engine.dispose()
+
+    @staticmethod
+    def test_worker_concurrent_run(config, db_session, firefox_id):
+        worker = Worker(
+            worker_id="0",
+            config=config,
+            db_session=db_session,
+            loop=False,
+            concurrency=2,
+        )
+
+        # Insert a successful and a failing job
+        for url in ["https://check.torproject.org", "https://stupid.urlextension"]:
+            db_session.add(
+                FetchQueue(
+                    url=url,
+                    fetcher_id=firefox_id,
+                    domain_id=1,
+                    options={"explicit_wait_duration": 0},
+                )
+            )
+        db_session.commit()
+
+        # Process both jobs at the same time
+        assert worker.process_next_jobs() == 2
+
+        assert db_session.query(FetchCompleted).count() == 1
+        assert db_session.query(FetchFailed).count() == 1
+        assert db_session.query(FetchQueue).count() == 0
+
+        # The queue is empty now
+        assert worker.process_next_jobs() == 0
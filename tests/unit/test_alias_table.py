@@ -0,0 +1,42 @@
+# pylint: disable=C0115,C0116,W0212
+
+import random
+from collections import Counter
+
+import pytest
+
+from captchamonitor.utils.alias_table import AliasTable
+
+
+class TestAliasTable:
+    @classmethod
+    def setup_class(cls):
+        cls.num_samples = 100000
+
+    def test_alias_table_follows_weights(self):
+        weights = {"a": 0.5, "b": 0.3, "c": 0.15, "d": 0.05, "e": 0}
+        alias_table = AliasTable(
+            list(weights.keys()), list(weights.values()), rng=random.Random(1)
+        )
+
+        counts = Counter(alias_table.sample() for _ in range(self.num_samples))
+
+        assert len(alias_table) == 5
+        assert counts["e"] == 0
+        for item, weight in weights.items():
+            assert counts[item] / self.num_samples == pytest.approx(weight, abs=0.01)
+
+    def test_alias_table_without_weights(self):
+        alias_table = AliasTable(["a", "b"], [0, None], rng=random.Random(1))
+
+        counts = Counter(alias_table.sample() for _ in range(self.num_samples))
+
+        assert counts["a"] / self.num_samples == pytest.approx(0.5, abs=0.01)
+
+    @staticmethod
+    def test_alias_table_invalid_input():
+        with pytest.raises(ValueError):
+            AliasTable([], [])
+
+        with pytest.raises(ValueError):
+            AliasTable(["a", "b"], [1])
@@ -1,7 +1,10 @@
 # pylint: disable=C0115,C0116,W0212
 
+import io
 import os
+import json
 import shutil
+import tarfile
 from datetime import datetime, timedelta
 
 from captchamonitor.utils.collector import Collector
@@ -58,3 +61,224 @@ class TestCollector:
         file = self.collector.get_consensus(self.recent_datetime)
 
         assert file.split("/")[-1] == self.recent_consensus_str
+
+
+def write_consensus_files(consensus_dir, hours):
+    for i, hour in enumerate(hours):
+        path = consensus_dir / f"2021-06-01-{hour:02d}-00-00-consensus"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+
+
+def read_manifest(consensus_dir):
+    with open(consensus_dir / "manifest.json", "r") as file:
+        return json.load(file)
+
+
+class TestCollectorCache:
+    @staticmethod
+    def test_get_consensus_indexes_cached_files(tmp_path):
+        write_consensus_files(tmp_path, [0, 1])
+        (tmp_path / "unrelated-file").write_bytes(b"x")
+
+        file = Collector(str(tmp_path)).get_consensus(datetime(2021, 6, 1, 1, 30))
+
+        assert file == str(tmp_path / "2021-06-01-01-00-00-consensus")
+        assert read_manifest(tmp_path) == {
+            "2021-06-01-00-00-00": {
+                "file_name": "2021-06-01-00-00-00-consensus",
+                "size": 100,
+            },
+            "2021-06-01-01-00-00": {
+                "file_name": "2021-06-01-01-00-00-consensus",
+                "size": 100,
+            },
+        }
+
+    @staticmethod
+    def test_least_recently_used_consensuses_are_evicted(tmp_path):
+        write_consensus_files(tmp_path, [0, 1, 2])
+        collector = Collector(str(tmp_path), max_cache_size=300)
+
+        # Looking up the oldest consensus makes it the most recently used one
+        collector.get_consensus(datetime(2021, 6, 1, 0))
+
+        size = collector._Collector__store_consensus_file(
+            "2021-06-01-03-00-00-consensus", io.BytesIO(b"x" * 100)
+        )
+        collector._Collector__add_to_manifest(
+            {
+                "2021-06-01-03-00-00": {
+                    "file_name": "2021-06-01-03-00-00-consensus",
+                    "size": size,
+                }
+            },
+            keep="2021-06-01-03-00-00",
+        )
+
+        assert sorted(read_manifest(tmp_path)) == [
+            "2021-06-01-00-00-00",
+            "2021-06-01-02-00-00",
+            "2021-06-01-03-00-00",
+        ]
+        assert not (tmp_path / "2021-06-01-01-00-00-consensus").exists()
+        assert not [file for file in os.listdir(tmp_path) if file.startswith(".d")]
+
+    @staticmethod
+    def test_remove_consensus_file_updates_manifest(tmp_path):
+        write_consensus_files(tmp_path, [0])
+        collector = Collector(str(tmp_path))
+        other_collector = Collector(str(tmp_path))
+        consensus_date = datetime(2021, 6, 1, 0)
+
+        assert other_collector.get_consensus(consensus_date) is not None
+
+        collector.remove_consensus_file(consensus_date)
+
+        # The other instance sees that the manifest was replaced
+        assert read_manifest(tmp_path) == {}
+        assert other_collector._Collector__find_consensus("2021-06-01-00-00-00") is None
+
+    @staticmethod
+    def test_find_consensus_removes_stale_entry(tmp_path):
+        write_consensus_files(tmp_path, [0, 1])
+        collector = Collector(str(tmp_path))
+        assert collector.get_consensus(datetime(2021, 6, 1, 0)) is not None
+
+        # The file is deleted outside of the cache, e.g. by a /tmp cleanup
+        os.remove(tmp_path / "2021-06-01-00-00-00-consensus")
+
+        assert collector._Collector__find_consensus("2021-06-01-00-00-00") is None
+        assert sorted(read_manifest(tmp_path)) == ["2021-06-01-01-00-00"]
+
+        # The consensus is extracted from the archive again
+        archive = build_archive(
+            [("consensuses-2021-06/01/2021-06-01-00-00-00-consensus", b"consensus 0")]
+        )
+        collector._Collector__extract_consensuses_from_archive(
+            io.BytesIO(archive), datetime(2021, 6, 1, 0)
+        )
+
+        assert collector._Collector__find_consensus("2021-06-01-00-00-00") == str(
+            tmp_path / "2021-06-01-00-00-00-consensus"
+        )
+        assert (tmp_path / "2021-06-01-00-00-00-consensus").read_bytes() == (
+            b"consensus 0"
+        )
+
+
+def build_archive(files):
+    archive_file = io.BytesIO()
+    with tarfile.open(fileobj=archive_file, mode="w:xz") as archive:
+        for name, content in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return archive_file.getvalue()
+
+
+class TestCollectorArchive:
+    @staticmethod
+    def test_extract_consensuses_from_archive(tmp_path):
+        write_consensus_files(tmp_path, [1])
+        archive = build_archive(
+            [("consensuses-2021-06/01/README", b"readme")]
+            + [
+                (
+                    f"consensuses-2021-06/01/2021-06-01-{hour:02d}-00-00-consensus",
+                    f"consensus {hour}".encode(),
+                )
+                for hour in range(4)
+            ]
+            + [("../2021-06-02-00-00-00-consensus", b"consensus 24")]
+        )
+        collector = Collector(str(tmp_path))
+
+        collector._Collector__extract_consensuses_from_archive(
+            io.BytesIO(archive), datetime(2021, 6, 1, 2)
+        )
+
+        assert sorted(read_manifest(tmp_path)) == [
+            "2021-06-01-00-00-00",
+            "2021-06-01-01-00-00",
+            "2021-06-01-02-00-00",
+            "2021-06-01-03-00-00",
+            "2021-06-02-00-00-00",
+        ]
+        assert (tmp_path / "2021-06-01-02-00-00-consensus").read_bytes() == (
+            b"consensus 2"
+        )
+        assert (tmp_path / "2021-06-02-00-00-00-consensus").read_bytes() == (
+            b"consensus 24"
+        )
+
+        # The cached consensuses aren't overwritten and nothing else is extracted
+        assert (tmp_path / "2021-06-01-01-00-00-consensus").read_bytes() == (b"x" * 100)
+        assert not (tmp_path / "README").exists()
+        assert not (tmp_path.parent / "2021-06-02-00-00-00-consensus").exists()
+
+    @staticmethod
+    def test_extract_consensuses_from_archive_in_range(tmp_path):
+        archive = build_archive(
+            [
+                (
+                    f"consensuses-2021-06/01/2021-06-01-{hour:02d}-00-00-consensus",
+                    f"consensus {hour}".encode(),
+                )
+                for hour in range(3)
+            ]
+            + [
+                (
+                    "consensuses-2021-06/01/2021-06-01-03-00-00-consensus",
+                    os.urandom(2**20),
+                )
+            ]
+        )
+        collector = Collector(str(tmp_path))
+
+        # Reading the archive stops before the truncated part
+        collector._Collector__extract_consensuses_from_archive(
+            io.BytesIO(archive[: len(archive) // 2]),
+            datetime(2021, 6, 1, 1),
+            datetime(2021, 6, 1, 2),
+        )
+
+        assert sorted(read_manifest(tmp_path)) == [
+            "2021-06-01-01-00-00",
+            "2021-06-01-02-00-00",
+        ]
+        assert not (tmp_path / "2021-06-01-00-00-00-consensus").exists()
+
+    @staticmethod
+    def test_extract_consensuses_from_archive_within_cache_size(tmp_path):
+        archive = build_archive(
+            [
+                (
+                    f"consensuses-2021-06/01/2021-06-01-{hour:02d}-00-00-consensus",
+                    b"x" * 100,
+                )
+                for hour in range(24)
+            ]
+        )
+        collector = Collector(str(tmp_path), max_cache_size=500)
+        collector._Collector__manifest_update_interval = 2
+
+        # Count the cached consensuses every time a consensus is stored
+        num_cached = []
+        store_consensus_file = collector._Collector__store_consensus_file
+
+        def counting_store_consensus_file(file_name, source):
+            num_cached.append(
+                len([file for file in os.listdir(tmp_path) if file.startswith("2")])
+            )
+            return store_consensus_file(file_name, source)
+
+        collector._Collector__store_consensus_file = counting_store_consensus_file
+        collector._Collector__extract_consensuses_from_archive(
+            io.BytesIO(archive), datetime(2021, 6, 1, 0)
+        )
+
+        # The cache never grew much larger than its maximum size
+        assert max(num_cached) <= 7
+        assert len(read_manifest(tmp_path)) == 5
+        assert "2021-06-01-00-00-00" in read_manifest(tmp_path)
@@ -0,0 +1,28 @@
+# pylint: disable=C0115,C0116,W0212
+
+import zstandard
+
+from captchamonitor.utils.compression import compress, decompress
+
+
+class TestCompression:
+    @classmethod
+    def setup_class(cls):
+        cls.samples = [
+            f"<html><body><p>Sample {i}</p><a href='/page/{i}'>Link</a></body></html>".encode()
+            * 10
+            for i in range(100)
+        ]
+
+    def test_compression_round_trip(self):
+        compressed = compress(self.samples[0])
+
+        assert len(compressed) < len(self.samples[0])
+        assert decompress(compressed) == self.samples[0]
+
+    def test_compression_with_dictionary(self):
+        dictionary = zstandard.train_dictionary(2048, self.samples).as_bytes()
+        compressed = compress(self.samples[0], dictionary, level=19)
+
+        assert decompress(compressed, dictionary) == self.samples[0]
+        assert len(compressed) < len(compress(self.samples[0], level=19))
@@ -1,9 +1,22 @@
 # pylint: disable=C0115,C0116,W0212
 
+import base64
 from datetime import datetime, timedelta
 
+import pytest
+
 from captchamonitor.utils.collector import Collector
-from captchamonitor.utils.consensus_parser import ConsensusV3Parser, ConsensusRelayEntry
+from captchamonitor.utils.exceptions import (
+    ConsensusParserInvalidDocument,
+    ConsensusParserFileNotFoundError,
+)
+from captchamonitor.utils.consensus_parser import (
+    FLAG_RUNNING,
+    ConsensusV3Parser,
+    ConsensusRelayEntry,
+    decode_flags,
+    encode_flags,
+)
 
 
 class TestConsensusParser:
@@ -27,3 +40,163 @@ class TestConsensusParser:
                 assert relay.is_exit is True
 
         assert found is True
+
+
+def write_consensus(path, relays, footer=True):
+    lines = [
+        "network-status-version 3",
+        "valid-after 2021-06-01 12:00:00",
+        "fresh-until 2021-06-01 13:00:00",
+    ]
+    for i, (nickname, flags, bandwidth) in enumerate(relays):
+        identity = base64.b64encode(bytes([i]) * 20).decode().rstrip("=")
+        lines += [
+            f"r {nickname} {identity} digest 2021-06-01 11:00:00 127.0.0.1 9001 0",
+            f"a [2001:db8::{i}]:9001",
+            f"s {flags}",
+            "v Tor 0.4.5.8",
+            f"w Bandwidth={bandwidth}",
+            "p reject 1-65535",
+        ]
+    if footer:
+        lines += [
+            "directory-footer",
+            "bandwidth-weights Wed=5000 Wee=10000 Wgd=2500 Wgg=6000 Wmd=2500 "
+            "Wme=0 Wmg=4000 Wmm=10000",
+        ]
+    consensus_file = path / "consensus"
+    consensus_file.write_text("\n".join(lines) + "\n")
+    return str(consensus_file)
+
+
+class TestConsensusParserFile:
+    relays = [
+        ("guardexit", "Exit Fast Guard Running Valid", 4000),
+        ("guard", "Fast Guard Running Valid", 3000),
+        ("exit", "Exit Fast Running Valid", 2000),
+        ("badexit", "BadExit Exit Fast Running Valid", 500),
+        ("middle", "Fast Running Valid", 500),
+        ("notrunning", "Exit Fast Guard Valid", 1000),
+    ]
+
+    def test_consensus_parser_stream(self, tmp_path):
+        consensus_file = write_consensus(tmp_path, self.relays)
+        parsed = ConsensusV3Parser(consensus_file)
+        streamed = ConsensusV3Parser(consensus_file, stream=True)
+
+        assert streamed.relay_entries == []
+        assert not streamed.bandwidth_weights
+
+        entries = streamed.iter_relay_entries()
+        first = next(entries)
+
+        # The header is parsed before the first relay entry
+        assert streamed.valid_after == datetime(2021, 6, 1, 12)
+        assert streamed.fresh_until == datetime(2021, 6, 1, 13)
+        assert first.nickname == "guardexit"
+        assert first.IPv6 == "[2001:db8::0]"
+        assert first.IPv6ORPort == "9001"
+        assert first.bandwidth == 4000.0
+        assert first.is_exit is True
+
+        # The footer is parsed after the last relay entry
+        rest = list(entries)
+        assert streamed.bandwidth_weights == parsed.bandwidth_weights
+        assert [relay.fingerprint for relay in [first] + rest] == [
+            relay.fingerprint for relay in parsed.relay_entries
+        ]
+        assert [relay.flags for relay in [first] + rest] == [
+            relay.flags for relay in parsed.relay_entries
+        ]
+
+        # The probabilities need all of the relays and the footer
+        assert first.guard_probability == 0.0
+
+    @staticmethod
+    def test_consensus_parser_invalid_files(tmp_path):
+        with pytest.raises(ConsensusParserFileNotFoundError):
+            ConsensusV3Parser(str(tmp_path / "missing"))
+
+        empty_file = tmp_path / "empty"
+        empty_file.write_text("")
+        with pytest.raises(ConsensusParserInvalidDocument):
+            ConsensusV3Parser(str(empty_file))
+
+        no_header_file = tmp_path / "no_header"
+        no_header_file.write_text("r relay identity digest\n")
+        with pytest.raises(ConsensusParserInvalidDocument):
+            ConsensusV3Parser(str(no_header_file))
+
+    @staticmethod
+    def test_consensus_parser_without_footer(tmp_path):
+        consensus_file = write_consensus(
+            tmp_path, [("middle", "Fast Running Valid", 500)], footer=False
+        )
+        streamed = ConsensusV3Parser(consensus_file, stream=True)
+
+        assert [relay.nickname for relay in streamed.iter_relay_entries()] == ["middle"]
+        assert not streamed.bandwidth_weights
+
+    def test_consensus_parser_compact_entries(self, tmp_path):
+        consensus_file = write_consensus(tmp_path, self.relays)
+        first = ConsensusV3Parser(consensus_file).relay_entries
+        second = ConsensusV3Parser(consensus_file).relay_entries
+
+        assert not hasattr(first[0], "__dict__")
+        assert first == second
+
+        # The entries of the same relay share their strings and publication times
+        assert first[0].fingerprint is second[0].fingerprint
+        assert first[0].nickname is second[0].nickname
+        assert first[0].publication is second[0].publication
+
+        assert first[0].flags == ["Exit", "Fast", "Guard", "Running", "Valid"]
+        assert first[0].flag_mask & FLAG_RUNNING
+        assert not first[-1].flag_mask & FLAG_RUNNING
+
+    @staticmethod
+    def test_encode_flags_with_unknown_flags(caplog):
+        # The flags that were removed from Tor have fixed bits too
+        flags = ["Fast", "Named", "Running", "Unnamed", "Valid"]
+        mask = encode_flags(flags)
+
+        assert mask & FLAG_RUNNING
+        assert decode_flags(mask) == flags
+        assert encode_flags([]) == 0
+
+        # The unknown flags don't get bits
+        assert encode_flags(["Fast", "NewFlag"]) == encode_flags(["Fast"])
+        assert "NewFlag" in caplog.text
+
+    def test_path_selection_probabilities(self, tmp_path):
+        consensus_file = write_consensus(tmp_path, self.relays)
+
+        entries = {
+            relay.nickname: relay
+            for relay in ConsensusV3Parser(consensus_file).relay_entries
+        }
+
+        # The relays that aren't running can't be selected
+        assert entries["notrunning"].flag_mask & FLAG_RUNNING == 0
+        assert entries["notrunning"].consensus_weight_fraction == 0.0
+        assert entries["notrunning"].guard_probability == 0.0
+
+        # Guard weights: 4000 * 0.25 + 3000 * 0.6 = 2800
+        assert entries["guardexit"].guard_probability == pytest.approx(1000 / 2800)
+        assert entries["guard"].guard_probability == pytest.approx(1800 / 2800)
+
+        # Middle weights: 4000 * 0.25 + 3000 * 0.4 + 2000 * 0 + 500 + 500 = 3200
+        assert entries["guard"].middle_probability == pytest.approx(1200 / 3200)
+        assert entries["exit"].middle_probability == 0.0
+        assert entries["badexit"].middle_probability == pytest.approx(500 / 3200)
+
+        # Exit weights: 4000 * 0.5 + 2000 * 1 = 4000, bad exits aren't used
+        assert entries["guardexit"].exit_probability == pytest.approx(0.5)
+        assert entries["exit"].exit_probability == pytest.approx(0.5)
+        assert entries["badexit"].exit_probability == 0.0
+
+        assert entries["guard"].consensus_weight_fraction == pytest.approx(0.3)
+        for name in ("consensus_weight_fraction", "guard_probability"):
+            assert sum(getattr(relay, name) for relay in entries.values()) == (
+                pytest.approx(1.0)
+            )
@@ -0,0 +1,85 @@
+# pylint: disable=C0115,C0116,W0212
+
+import time
+import logging
+
+from bs4 import BeautifulSoup
+
+from captchamonitor.utils.dom_features import DomFeatures, extract_dom_features
+
+logger = logging.getLogger(__name__)
+
+
+class TestDomFeatures:
+    @classmethod
+    def setup_class(cls):
+        cls.html_data = """
+            <!DOCTYPE html>
+            <html>
+                <head>
+                    <title>Access Denied</title>
+                    <script>var captcha = "<div>";</script>
+                    <style>p { color: red; }</style>
+                </head>
+                <body>
+                    <p>Sorry, <b>you</b> have been blocked<br/></p>
+                    <img src="image.png">
+                    <!-- A comment -->
+                    <div><p>Unclosed paragraph<li>Item</div>
+                </body>
+            </html>
+        """
+        cls.match_list = ["denied", "sorry", "forbidden", "captcha"]
+
+    def test_dom_features_node_count(self):
+        features = extract_dom_features(self.html_data)
+        soup = BeautifulSoup(self.html_data, "html.parser")
+
+        # Should count the nodes the same way as BeautifulSoup does
+        assert features.node_count == len(soup.find_all(True))
+        assert features.tag_histogram["p"] == 2
+        assert features.tag_histogram["br"] == 1
+
+    def test_dom_features_tokens(self):
+        features = extract_dom_features(self.html_data)
+
+        # Script and style contents are not visible text
+        assert features.tokens[:4] == ["access", "denied", "sorry", "you"]
+        assert "var" not in features.tokens
+        assert "color" not in features.tokens
+
+    def test_dom_features_keyword_matches(self):
+        features = extract_dom_features(self.html_data, self.match_list)
+
+        assert features.keyword_matches == frozenset(["denied", "sorry", "captcha"])
+
+    @staticmethod
+    def test_dom_features_empty_document():
+        assert extract_dom_features("", ["captcha"]) == DomFeatures()
+
+    def test_dom_features_benchmark(self):
+        html_data = self.html_data * 200
+        num_runs = 5
+
+        start_time = time.perf_counter()
+        for _ in range(num_runs):
+            soup = BeautifulSoup(html_data, "html.parser")
+            node_count = len(soup.find_all(True))
+            html_lower = str(soup).lower()
+            matches = [keyword for keyword in self.match_list if keyword in html_lower]
+        soup_duration = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for _ in range(num_runs):
+            features = extract_dom_features(html_data, self.match_list)
+        features_duration = time.perf_counter() - start_time
+
+        logger.info(
+            "BeautifulSoup: %.3f s, DomFeatureExtractor: %.3f s, speedup: %.1fx",
+            soup_duration,
+            features_duration,
+            soup_duration / features_duration,
+        )
+
+        assert features.node_count == node_count
+        assert features.keyword_matches == frozenset(matches)
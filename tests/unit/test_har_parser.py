@@ -0,0 +1,67 @@
+# pylint: disable=C0115,C0116,W0212
+
+import json
+
+from captchamonitor.utils.har_parser import HarStatuses, read_har_statuses
+
+
+def har_entry(url, status):
+    return {
+        "request": {"method": "GET", "url": url, "headers": []},
+        "response": {"status": status, "headers": [], "content": {"size": 0}},
+    }
+
+
+class TestHarParser:
+    @staticmethod
+    def test_read_har_statuses_follows_redirects():
+        har_data = json.dumps(
+            {
+                "log": {
+                    "version": "1.2",
+                    "pages": [],
+                    "entries": [
+                        har_entry("http://example.com", 301),
+                        har_entry("https://example.com", 302),
+                        har_entry("https://www.example.com", 403),
+                        har_entry("https://www.example.com/style.css", 200),
+                    ],
+                }
+            }
+        )
+
+        statuses = read_har_statuses(har_data)
+
+        assert statuses.document == ("https://www.example.com", 403)
+        # Stops reading after the first response that isn't a redirect
+        assert statuses.entries == [
+            ("http://example.com", 301),
+            ("https://example.com", 302),
+            ("https://www.example.com", 403),
+        ]
+
+    @staticmethod
+    def test_read_har_statuses_only_redirects():
+        har_data = json.dumps({"log": {"entries": [har_entry("http://a.com", 301)]}})
+
+        statuses = read_har_statuses(har_data)
+
+        assert statuses.document is None
+        assert statuses.entries == [("http://a.com", 301)]
+
+    @staticmethod
+    def test_read_har_statuses_large_har():
+        entries = [har_entry(f"https://example.com/{i}", 200) for i in range(5000)]
+        har_data = json.dumps({"log": {"entries": entries}})
+
+        statuses = read_har_statuses(har_data)
+
+        assert statuses.document == ("https://example.com/0", 200)
+        assert len(statuses.entries) == 1
+
+    @staticmethod
+    def test_read_har_statuses_invalid_har():
+        assert read_har_statuses(None) == HarStatuses()
+        assert read_har_statuses("") == HarStatuses()
+        assert read_har_statuses("not a HAR") == HarStatuses()
+        assert read_har_statuses(json.dumps({"log": {"entries": []}})) == HarStatuses()
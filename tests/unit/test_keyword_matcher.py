@@ -0,0 +1,46 @@
+# pylint: disable=C0115,C0116,W0212
+
+from captchamonitor.utils.keyword_matcher import (
+    CAPTCHA_SIGNATURES,
+    KeywordMatcher,
+    get_keyword_matcher,
+)
+
+
+class TestKeywordMatcher:
+    @staticmethod
+    def test_keyword_matcher_finds_all_keywords():
+        keyword_matcher = KeywordMatcher(["Denied", "captcha", "recaptcha", "tor"])
+        text = "<div class='g-reCAPTCHA'>Access denied</div>"
+
+        assert len(keyword_matcher) == 4
+        assert keyword_matcher.keywords == frozenset(
+            ["denied", "captcha", "recaptcha", "tor"]
+        )
+        # Overlapping keywords are all reported and case doesn't matter
+        assert keyword_matcher.find_all(text) == frozenset(
+            ["denied", "captcha", "recaptcha"]
+        )
+
+    @staticmethod
+    def test_keyword_matcher_without_keywords():
+        keyword_matcher = KeywordMatcher(["", ""])
+
+        assert len(keyword_matcher) == 0
+        assert keyword_matcher.find_all("captcha") == frozenset()
+
+    @staticmethod
+    def test_keyword_matcher_captcha_signatures():
+        keyword_matcher = get_keyword_matcher(CAPTCHA_SIGNATURES)
+        url = "https://challenges.cloudflare.com/cdn-cgi/challenge-platform/h/g"
+
+        assert keyword_matcher.find_all(url) == frozenset(
+            ["challenges.cloudflare.com", "challenge-platform"]
+        )
+
+    @staticmethod
+    def test_get_keyword_matcher_is_cached():
+        keyword_matcher = get_keyword_matcher(["error", "sorry"])
+
+        assert get_keyword_matcher(["sorry", "error", "sorry"]) is keyword_matcher
+        assert get_keyword_matcher(["error"]) is not keyword_matcher
@@ -26,6 +26,34 @@ class TestOnionoo:
 
         assert len(onionoo.relay_entries) == 2
 
+    def test_onionoo_init_concurrent_batches(self):
+        onionoo = Onionoo(
+            [self.csailmitexit_fpr, self.csailmitnoexit_fpr], batch_size=1
+        )
+
+        assert {relay.fingerprint for relay in onionoo.relay_entries} == {
+            self.csailmitexit_fpr,
+            self.csailmitnoexit_fpr,
+        }
+
+    def test_onionoo_init_bulk_request(self):
+        onionoo = Onionoo(
+            [self.csailmitexit_fpr, self.csailmitnoexit_fpr], bulk_threshold=1
+        )
+
+        assert {relay.fingerprint for relay in onionoo.relay_entries} == {
+            self.csailmitexit_fpr,
+            self.csailmitnoexit_fpr,
+        }
+
+    def test_onionoo_reuses_unmodified_responses(self):
+        first = Onionoo([self.csailmitexit_fpr]).relay_entries
+
+        # The second request is conditional and might return the cached relays
+        second = Onionoo([self.csailmitexit_fpr]).relay_entries
+
+        assert first == second
+
     def test_is_exiting_allowed(self):
         onionoo = Onionoo([self.csailmitexit_fpr])
 
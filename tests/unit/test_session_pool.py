@@ -0,0 +1,80 @@
+# pylint: disable=C0115,C0116,W0212
+
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+from captchamonitor.fetchers.session_pool import SessionPool, PooledSession
+
+
+class DummyDriver:
+    def __init__(self, fail_on_quit=False):
+        self.fail_on_quit = fail_on_quit
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+        if self.fail_on_quit:
+            raise WebDriverException
+
+
+class TestSessionPool:
+    @classmethod
+    def setup_class(cls):
+        cls.key_1 = ("FirefoxBrowser", "tor", ("127.0.0.1", 9050))
+        cls.key_2 = ("FirefoxBrowser", None, None)
+
+    def test_session_pool_reuse(self):
+        session_pool = SessionPool(max_uses=3)
+        driver = DummyDriver()
+        session = PooledSession(driver=driver)
+
+        assert session_pool.acquire(self.key_1) is None
+
+        session_pool.release(self.key_1, session)
+
+        assert len(session_pool) == 1
+        assert session_pool.acquire(self.key_2) is None
+        assert session_pool.acquire(self.key_1) is session
+        assert len(session_pool) == 0
+        assert session.uses == 1
+        assert not driver.quit_called
+
+    def test_session_pool_recycle_after_max_uses(self):
+        session_pool = SessionPool(max_uses=2)
+        driver = DummyDriver()
+        session = PooledSession(driver=driver)
+
+        session_pool.release(self.key_1, session)
+        session_pool.release(self.key_1, session_pool.acquire(self.key_1))
+
+        assert len(session_pool) == 0
+        assert session.uses == 2
+        assert driver.quit_called
+
+    def test_session_pool_max_idle_time(self):
+        session_pool = SessionPool(max_idle_time=60)
+        driver = DummyDriver(fail_on_quit=True)
+        session = PooledSession(driver=driver)
+
+        session_pool.release(self.key_1, session)
+        session.last_used = time.time() - 61
+
+        assert session_pool.acquire(self.key_1) is None
+        assert driver.quit_called
+
+    def test_session_pool_close(self):
+        session_pool = SessionPool()
+        drivers = [DummyDriver() for _ in range(3)]
+        sessions = [PooledSession(driver=driver) for driver in drivers]
+
+        session_pool.release(self.key_1, sessions[0])
+        session_pool.release(self.key_1, sessions[1])
+        session_pool.release(self.key_2, sessions[2])
+
+        assert len(session_pool) == 3
+
+        session_pool.close()
+
+        assert len(session_pool) == 0
+        assert all(driver.quit_called for driver in drivers)
@@ -0,0 +1,18 @@
+# pylint: disable=C0115,C0116,W0212
+
+import pytest
+import port_for
+
+from captchamonitor.utils.config import Config
+from captchamonitor.utils.exceptions import TorPoolLeaseError
+from captchamonitor.utils.tor_pool_client import TorPoolClient
+
+
+class TestTorPoolClient:
+    @staticmethod
+    def test_lease_without_tor_pool():
+        config = Config()
+        config["tor_pool_url"] = f"http://127.0.0.1:{port_for.select_random()}"
+
+        with pytest.raises(TorPoolLeaseError):
+            TorPoolClient(config, timeout=0).lease()